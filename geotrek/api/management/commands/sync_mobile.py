@@ -3,19 +3,16 @@ import logging
 import filecmp
 import os
 import stat
-from PIL import Image
 import re
 import shutil
 import tempfile
 from time import sleep
 from zipfile import ZipFile
-import cairosvg
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.management.base import BaseCommand, CommandError
 from django.db.models import Q
-from django.http import StreamingHttpResponse
 from django.test.client import RequestFactory
 from django.utils import translation
 from django.utils.translation import gettext as _
@@ -27,7 +24,8 @@ from geotrek.tourism import models as tourism_models
 from geotrek.trekking import models as trekking_models
 from geotrek.api.mobile.views.trekking import TrekViewSet
 from geotrek.api.mobile.views.common import FlatPageViewSet, SettingsView
-from geotrek.common.helpers_sync import ZipTilesBuilder
+from geotrek.common.helpers_sync import (ManifestZipFile, MediaBundles, PictogramRenditions, SyncZipFile, ZipTilesBuilder,
+                                         response_chunks, write_chunks)
 # Register mapentity models
 from geotrek.trekking import urls  # NOQA
 from geotrek.tourism import urls  # NOQA
@@ -45,6 +43,8 @@ class Command(BaseCommand):
         parser.add_argument('--portal', '-P', dest='portal', default=None, help='Filter by portal(s)')
         parser.add_argument('--skip-tiles', '-t', action='store_true', dest='skip_tiles', default=False,
                             help='Skip inclusion of tiles in zip files')
+        parser.add_argument('--shared-media', action='store_true', dest='shared_media', default=False,
+                            help='Store trek medias once in shared bundles, trek zip files only containing a manifest')
         parser.add_argument('--url', '-u', dest='url', default='http://localhost', help='Base url')
         parser.add_argument('--indent', '-i', default=0, type=int, help='Indent json files')
         parser.add_argument('--task', default=None, help=argparse.SUPPRESS)
@@ -77,17 +77,8 @@ class Command(BaseCommand):
             if self.verbosity == 2:
                 self.stdout.write("\x1b[3D\x1b[31;1mfailed (HTTP {code})\x1b[0m".format(code=response.status_code))
             return
-        f = open(fullname, 'wb')
-        if isinstance(response, StreamingHttpResponse):
-            content = b''.join(response.streaming_content)
-        else:
-            content = response.content
-        # Fix strange unicode characters 2028 and 2029 that make Geotrek-mobile crash
-        if fix2028:
-            content = content.replace(b'\\u2028', b'\\n')
-            content = content.replace(b'\\u2029', b'\\n')
-        f.write(content)
-        f.close()
+        # Stream the response to disk, without joining it in memory
+        write_chunks(response_chunks(response), fullname, fix2028=fix2028)
         oldfilename = os.path.join(self.dst_root, name)
         # If new file is identical to old one, don't recreate it. This will help backup
         if os.path.isfile(oldfilename) and filecmp.cmp(fullname, oldfilename):
@@ -166,7 +157,7 @@ class Command(BaseCommand):
         self.mkdirs(dst)
         if not os.path.isfile(dst):
             os.link(src, dst)
-        if zipfile and os.path.join(url, name) not in zipfile.namelist():
+        if zipfile is not None and os.path.join(url, name) not in zipfile:
             zipfile.write(dst, os.path.join(url, name))
         if self.verbosity == 2:
             self.stdout.write(
@@ -189,18 +180,9 @@ class Command(BaseCommand):
                 name = os.path.join(settings.MEDIA_URL.strip('/'), obj.pictogram.name)
             dst = os.path.join(self.tmp_root, directory, name)
             self.mkdirs(dst)
-            # Convert SVG to PNG and open it
-            if file_extension == '.svg':
-                cairosvg.svg2png(url=obj.pictogram.path, write_to=dst)
-                image = Image.open(dst)
-            else:
-                image = Image.open(obj.pictogram.path)
-            # Resize
-            if size:
-                image = image.resize((size, size), Image.ANTIALIAS)
-            # Save
-            image.save(dst, optimize=True, quality=95)
-            if name not in zipfile.namelist():
+            # Converted and resized pictograms are reused from previous runs
+            self.pictogram_renditions.link(obj.pictogram.path, dst, size=size)
+            if name not in zipfile:
                 zipfile.write(dst, name)
             if self.verbosity == 2:
                 self.stdout.write(
@@ -290,51 +272,58 @@ class Command(BaseCommand):
         zipname_trekid = os.path.join(url_trek, "{}.zip".format(trek.pk))
         zipfullname_trekid = os.path.join(self.tmp_root, zipname_trekid)
         self.mkdirs(zipfullname_trekid)
-        trekid_zipfile = ZipFile(zipfullname_trekid, 'w')
+        trekid_zipfile = SyncZipFile(zipfullname_trekid, 'w')
 
         if not self.skip_tiles:
             self.sync_trek_tiles(trek, trekid_zipfile)
 
+        media_zipfile = trekid_zipfile
+        if self.shared_media:
+            media_zipfile = ManifestZipFile(trekid_zipfile, self.media_bundles,
+                                            '{}/manifest.json'.format(trek.pk))
+
         for poi in trek.published_pois.annotate(geom_type=GeometryType("geom")).filter(geom_type="POINT"):
             if poi.resized_pictures:
                 for picture, thdetail in poi.resized_pictures[:settings.MOBILE_NUMBER_PICTURES_SYNC]:
                     self.sync_media_file(thdetail, prefix=trek.pk, directory=url_trek,
-                                         zipfile=trekid_zipfile)
+                                         zipfile=media_zipfile)
         for touristic_content in trek.published_touristic_contents.annotate(geom_type=GeometryType("geom")).filter(geom_type="POINT"):
             if touristic_content.resized_pictures:
                 for picture, thdetail in touristic_content.resized_pictures[:settings.MOBILE_NUMBER_PICTURES_SYNC]:
                     self.sync_media_file(thdetail, prefix=trek.pk, directory=url_trek,
-                                         zipfile=trekid_zipfile)
+                                         zipfile=media_zipfile)
         for touristic_event in trek.published_touristic_events.annotate(geom_type=GeometryType("geom")).filter(geom_type="POINT"):
             if touristic_event.resized_pictures:
                 for picture, thdetail in touristic_event.resized_pictures[:settings.MOBILE_NUMBER_PICTURES_SYNC]:
                     self.sync_media_file(thdetail, prefix=trek.pk, directory=url_trek,
-                                         zipfile=trekid_zipfile)
+                                         zipfile=media_zipfile)
         if trek.resized_pictures:
             for picture, thdetail in trek.resized_pictures[:settings.MOBILE_NUMBER_PICTURES_SYNC]:
                 self.sync_media_file(thdetail, prefix=trek.pk, directory=url_trek,
-                                     zipfile=trekid_zipfile)
+                                     zipfile=media_zipfile)
         for desk in trek.information_desks.all().annotate(geom_type=GeometryType("geom")).filter(geom_type="POINT"):
             if desk.resized_picture:
                 self.sync_media_file(desk.resized_picture, prefix=trek.pk, directory=url_trek,
-                                     zipfile=trekid_zipfile)
+                                     zipfile=media_zipfile)
         for lang in self.languages:
             trek.prepare_elevation_chart(lang, self.referer)
             url_media = '/{}{}'.format(trek.pk, settings.MEDIA_URL)
             self.sync_file(trek.get_elevation_chart_url_png(lang), settings.MEDIA_ROOT,
-                           url_media, directory=url_trek, zipfile=trekid_zipfile)
+                           url_media, directory=url_trek, zipfile=media_zipfile)
         # Sync media of children too
         for child in trek.children.annotate(geom_type=GeometryType("geom")).filter(geom_type="LINESTRING"):
             for picture, resized in child.resized_pictures:
-                self.sync_media_file(resized, prefix=trek.pk, directory=url_trek, zipfile=trekid_zipfile)
+                self.sync_media_file(resized, prefix=trek.pk, directory=url_trek, zipfile=media_zipfile)
             for desk in child.information_desks.all().annotate(geom_type=GeometryType("geom")).filter(geom_type="POINT"):
-                self.sync_media_file(desk.resized_picture, prefix=trek.pk, directory=url_trek, zipfile=trekid_zipfile)
+                self.sync_media_file(desk.resized_picture, prefix=trek.pk, directory=url_trek, zipfile=media_zipfile)
             for lang in self.languages:
                 child.prepare_elevation_chart(lang, self.referer)
                 url_media = '/{}{}'.format(trek.pk, settings.MEDIA_URL)
                 self.sync_file(child.get_elevation_chart_url_png(lang), settings.MEDIA_ROOT,
-                               url_media, directory=url_trek, zipfile=trekid_zipfile)
+                               url_media, directory=url_trek, zipfile=media_zipfile)
 
+        if self.shared_media:
+            media_zipfile.write_manifest()
         self.close_zip(trekid_zipfile, zipname_trekid)
 
     def sync_treks_media(self):
@@ -342,15 +331,21 @@ class Command(BaseCommand):
         if self.portal:
             treks = treks.filter(Q(portal__name__in=self.portal) | Q(portal=None))
 
+        if self.shared_media:
+            self.media_bundles = MediaBundles(self.tmp_root, os.path.join('nolang', 'bundles'))
+
         for trek in treks:
             self.sync_trek_by_pk_media(trek)
 
+        if self.shared_media:
+            self.media_bundles.close(self.close_zip)
+
     def sync_global_media(self):
         url_media_nolang = os.path.join('nolang')
         zipname_settings = os.path.join('nolang', 'global.zip')
         zipfullname_settings = os.path.join(self.tmp_root, zipname_settings)
         self.mkdirs(zipfullname_settings)
-        self.zipfile_settings = ZipFile(zipfullname_settings, 'w')
+        self.zipfile_settings = SyncZipFile(zipfullname_settings, 'w')
 
         if not self.skip_tiles:
             self.sync_global_tiles(self.zipfile_settings)
@@ -472,8 +467,10 @@ class Command(BaseCommand):
         self.successfull = True
         self.verbosity = options['verbosity']
         self.skip_tiles = options['skip_tiles']
+        self.shared_media = options['shared_media']
         self.indent = options['indent']
         self.factory = RequestFactory()
+        self.pictogram_renditions = PictogramRenditions()
         self.dst_root = options["path"].rstrip('/')
         self.abs_path = os.path.abspath(options["path"])
         self.check_dst_root_is_empty()
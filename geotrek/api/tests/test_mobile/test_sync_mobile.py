@@ -337,6 +337,21 @@ class SyncMobileSettingsTest(TranslationResetMixin, VarTmpTestCase):
         self.assertEqual(image_desk.size, (32, 32))
         self.assertIn('en/settings.json', output.getvalue())
 
+    @override_settings(SYNC_PICTOGRAMS_CACHE_ROOT=os.path.join(settings.TMP_DIR, 'sync_mobile', 'pictograms'))
+    def test_sync_pictograms_renditions_reused(self):
+        self.addCleanup(shutil.rmtree, os.path.join(settings.TMP_DIR, 'sync_mobile', 'pictograms'), ignore_errors=True)
+        practice = PracticeFactory.create(pictogram=get_dummy_uploaded_image_svg())
+        pictogram_png = practice.pictogram.url.replace('.svg', '.png')
+        management.call_command('sync_mobile', os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync'), url='http://localhost:8000',
+                                skip_tiles=True, verbosity=0)
+        self.assertTrue(os.listdir(os.path.join(settings.TMP_DIR, 'sync_mobile', 'pictograms')))
+        with mock.patch('geotrek.common.helpers_sync.cairosvg.svg2png') as mock_svg2png:
+            management.call_command('sync_mobile', os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync'), url='http://localhost:8000',
+                                    skip_tiles=True, verbosity=0)
+        mock_svg2png.assert_not_called()
+        image_practice = Image.open(os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync', 'nolang', pictogram_png[1:]))
+        self.assertEqual(image_practice.size, (32, 32))
+
 
 class SyncMobileTreksTest(TranslationResetMixin, VarTmpTestCase):
     @classmethod
@@ -467,6 +482,26 @@ class SyncMobileTreksTest(TranslationResetMixin, VarTmpTestCase):
         self.assertTrue(os.path.exists(os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync', 'nolang', str(self.trek_1.pk), 'media',
                                                     'upload')))
 
+    def test_medias_treks_shared_media(self):
+        management.call_command('sync_mobile', os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync'), url='http://localhost:8000',
+                                skip_tiles=True, shared_media=True, verbosity=0)
+        bundles_dir = os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync', 'nolang', 'bundles')
+        with zipfile.ZipFile(os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync', 'nolang',
+                                          '{}.zip'.format(self.trek_1.pk))) as trek_zipfile:
+            self.assertEqual(trek_zipfile.namelist(), ['{}/manifest.json'.format(self.trek_1.pk)])
+            manifest = json.loads(trek_zipfile.read('{}/manifest.json'.format(self.trek_1.pk)))
+        self.assertTrue(manifest)
+        for arcname, media in manifest.items():
+            self.assertTrue(arcname.startswith('{}/media/'.format(self.trek_1.pk)))
+            with zipfile.ZipFile(os.path.join(bundles_dir, media['bundle'])) as bundle:
+                self.assertIn(media['name'], bundle.namelist())
+        # Each media is stored once, whatever the number of treks using it
+        names = []
+        for bundle_name in os.listdir(bundles_dir):
+            with zipfile.ZipFile(os.path.join(bundles_dir, bundle_name)) as bundle:
+                names.extend(bundle.namelist())
+        self.assertEqual(len(names), len(set(names)))
+
     def test_medias_treks_multiple_picture(self):
         output = StringIO()
         management.call_command('sync_mobile', os.path.join(settings.TMP_DIR, 'sync_mobile', 'tmp_sync'), url='http://localhost:8000',
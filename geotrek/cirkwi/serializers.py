@@ -1,6 +1,5 @@
 import datetime
 
-from django.contrib.gis.db.models.functions import Transform
 from django.urls import reverse
 from django.utils import translation
 from django.utils.timezone import utc, make_aware
@@ -11,6 +10,7 @@ from mapentity.serializers import plain_text
 
 
 from geotrek.cirkwi.models import CirkwiTag
+from geotrek.trekking.models import POI
 
 
 def timestamp(dt):
@@ -173,6 +173,8 @@ class CirkwiTrekSerializer(CirkwiPOISerializer):
 
     # TODO: parking location (POI?), points_reference
     def serialize(self, treks):
+        treks = list(treks)
+        pois = {} if self.exclude_pois else POI.published_treks_pois(treks)
         self.xml.startDocument()
         self.xml.startElement('circuits', {'version': '2'})
         for trek in treks:
@@ -207,9 +209,9 @@ class CirkwiTrekSerializer(CirkwiPOISerializer):
             self.xml.startElement('tracking_information', {})
             self.serialize_tracking_info(trek)
             self.xml.endElement('tracking_information')
-            if not self.exclude_pois and trek.published_pois:
+            if pois.get(trek.pk):
                 self.xml.startElement('pois', {})
-                self.serialize_pois(trek.published_pois.annotate(transformed_geom=Transform('geom', 4326)))
+                self.serialize_pois(pois[trek.pk])
                 self.xml.endElement('pois')
             self.xml.endElement('circuit')
         self.xml.endElement('circuits')
@@ -1,7 +1,15 @@
+import hashlib
+import json
 import logging
+import os
 import re
+import shutil
+import tempfile
+from zipfile import ZipFile
 
+import cairosvg
 from django.conf import settings
+from PIL import Image
 from landez import TilesManager
 from landez.sources import DownloadError
 
@@ -11,6 +19,237 @@ from geotrek.common import views
 logger = logging.getLogger(__name__)
 
 
+# Strange unicode characters 2028 and 2029 make Geotrek-rando and Geotrek-mobile crash
+ESCAPES_2028 = (b'\\u2028', b'\\u2029')
+ESCAPE_2028_REPLACEMENT = b'\\n'
+
+
+class SyncZipFile(ZipFile):
+    """ ZipFile with constant time membership test (``name in zipfile``),
+    instead of rebuilding ``namelist()`` each time.
+    """
+    def __contains__(self, name):
+        return name in self.NameToInfo
+
+
+def fix2028_chunks(chunks):
+    """ Replace escaped 2028 and 2029 characters in a stream of bytes chunks.
+    The tail of each chunk is held back until the next one so that an escape
+    sequence split across two chunks is still replaced.
+    """
+    keep = max(len(escape) for escape in ESCAPES_2028) - 1
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        for escape in ESCAPES_2028:
+            pending = pending.replace(escape, ESCAPE_2028_REPLACEMENT)
+        if len(pending) > keep:
+            yield pending[:-keep]
+            pending = pending[-keep:]
+    if pending:
+        yield pending
+
+
+def write_chunks(chunks, fullname, zipfile=None, arcname=None, fix2028=False):
+    """ Write a stream of bytes chunks to ``fullname`` and, if ``zipfile`` is given
+    and does not contain it yet, to the ``arcname`` member of the archive, in one pass.
+    """
+    if fix2028:
+        chunks = fix2028_chunks(chunks)
+    zip_member = None
+    if zipfile is not None and arcname not in zipfile:
+        zip_member = zipfile.open(arcname, 'w')
+    try:
+        # Replace the file instead of truncating it: when a step is resumed, it can be a hard link to a published file
+        if os.path.lexists(fullname):
+            os.unlink(fullname)
+        with open(fullname, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                if zip_member:
+                    zip_member.write(chunk)
+    finally:
+        if zip_member:
+            zip_member.close()
+
+
+def response_chunks(response):
+    """ Iterate over the content of a response without joining it in memory.
+    """
+    if response.streaming:
+        yield from response.streaming_content
+    else:
+        yield response.content
+
+
+def file_hash(path):
+    """ SHA1 hex digest of the content of file ``path``.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class PictogramRenditions:
+    """ Store of converted pictograms, shared between synchronization runs and commands.
+    Renditions are keyed by the pictogram content hash, the target size and the format,
+    so a pictogram is only converted again when its file changes.
+    """
+    def __init__(self, root=None):
+        self.root = root or settings.SYNC_PICTOGRAMS_CACHE_ROOT
+
+    def rendition_format(self, path):
+        extension = os.path.splitext(path)[1].lower()
+        return 'png' if extension == '.svg' else extension.lstrip('.')
+
+    def get(self, path, size=None):
+        """ Return the path of the rendition of pictogram ``path``, converted to PNG if it is a SVG
+        and resized to ``size`` if given. The rendition is generated if it does not exist yet.
+        """
+        rendition_format = self.rendition_format(path)
+        rendition = os.path.join(self.root, '{hash}_{size}.{format}'.format(
+            hash=file_hash(path), size=size or 'orig', format=rendition_format))
+        if not os.path.isfile(rendition):
+            self.render(path, rendition, size, rendition_format)
+        return rendition
+
+    def render(self, path, rendition, size, rendition_format):
+        os.makedirs(self.root, exist_ok=True)
+        # Render in a temporary file so that concurrent runs never see a partial rendition
+        fd, tmp_rendition = tempfile.mkstemp(suffix='.{}'.format(rendition_format), dir=self.root)
+        os.close(fd)
+        try:
+            # Convert SVG to PNG and open it
+            if os.path.splitext(path)[1].lower() == '.svg':
+                cairosvg.svg2png(url=path, write_to=tmp_rendition)
+                image = Image.open(tmp_rendition)
+            else:
+                image = Image.open(path)
+            if size:
+                image = image.resize((size, size), Image.ANTIALIAS)
+            image.save(tmp_rendition, optimize=True, quality=95)
+            os.replace(tmp_rendition, rendition)
+        except Exception:
+            os.unlink(tmp_rendition)
+            raise
+
+    def link(self, path, dst, size=None):
+        """ Hard link (or copy if not on the same filesystem) the rendition of pictogram ``path`` to ``dst``.
+        """
+        rendition = self.get(path, size=size)
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        try:
+            os.link(rendition, dst)
+        except OSError:
+            shutil.copyfile(rendition, dst)
+
+
+class MediaBundles:
+    """ Content-addressed store of media files shared by several archives.
+    Each file is stored once, named after its content hash, in the bundle named after
+    the first characters of this hash.
+    """
+    def __init__(self, root, directory, prefix_length=2):
+        self.root = root
+        self.directory = directory
+        self.prefix_length = prefix_length
+        self.bundles = {}
+        self.hashes = {}
+
+    def add(self, filename):
+        """ Store file ``filename`` if not already stored and return its (bundle, member) names.
+        """
+        if filename not in self.hashes:
+            self.hashes[filename] = file_hash(filename)
+        content_hash = self.hashes[filename]
+        bundle_name = '{}.zip'.format(content_hash[:self.prefix_length])
+        member_name = content_hash + os.path.splitext(filename)[1]
+        bundle = self.bundles.get(bundle_name)
+        if bundle is None:
+            fullname = os.path.join(self.root, self.directory, bundle_name)
+            os.makedirs(os.path.dirname(fullname), exist_ok=True)
+            bundle = self.bundles[bundle_name] = SyncZipFile(fullname, 'w')
+        if member_name not in bundle:
+            bundle.write(filename, member_name)
+        return bundle_name, member_name
+
+    def close(self, close_zip):
+        for bundle_name, bundle in sorted(self.bundles.items()):
+            close_zip(bundle, os.path.join(self.directory, bundle_name))
+        self.bundles = {}
+
+
+class ManifestZipFile:
+    """ Stand-in for a ZipFile where written files are stored in shared media bundles,
+    the archive itself only receiving a manifest of the bundled files.
+    """
+    def __init__(self, zipfile, bundles, manifest_name):
+        self.zipfile = zipfile
+        self.bundles = bundles
+        self.manifest_name = manifest_name
+        self.manifest = {}
+
+    def __contains__(self, name):
+        return name in self.manifest or name in self.zipfile
+
+    def write(self, filename, arcname):
+        bundle_name, member_name = self.bundles.add(filename)
+        self.manifest[arcname] = {'bundle': bundle_name, 'name': member_name}
+
+    def write_manifest(self):
+        # Sorted keys keep the manifest identical (same CRC) when media did not change
+        self.zipfile.writestr(self.manifest_name, json.dumps(self.manifest, sort_keys=True))
+
+
+class SyncJournal:
+    """ Journal of the completed steps of a synchronization, kept next to its working directory,
+    so that an interrupted run can be resumed from the last completed step.
+    Without path, the journal is only kept in memory.
+    """
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.steps = set()
+        self.successfull = True
+
+    def load(self):
+        """ Load steps completed by a previous run with the same options. Return False if there is none.
+        """
+        try:
+            with open(self.path, 'r') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if journal.get('options') != self.options:
+            return False
+        self.steps = set(journal['steps'])
+        self.successfull = journal['successfull']
+        return True
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'options': self.options, 'steps': sorted(self.steps), 'successfull': self.successfull}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_done(self, step):
+        return step in self.steps
+
+    def complete(self, step, successfull):
+        self.steps.add(step)
+        self.successfull = self.successfull and successfull
+        self.save()
+
+    def delete(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
 class ZipTilesBuilder:
     def __init__(self, zipfile, prefix="", **builder_args):
         self.zipfile = zipfile
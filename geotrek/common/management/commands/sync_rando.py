@@ -1,4 +1,5 @@
 import argparse
+import hashlib
 import logging
 import filecmp
 import os
@@ -12,7 +13,6 @@ from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.management.base import BaseCommand, CommandError
 from django.db.models import Q
-from django.http import StreamingHttpResponse
 from django.test.client import RequestFactory
 from django.utils import translation
 from django.utils.translation import gettext as _
@@ -50,10 +50,18 @@ logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
+    # Options which must be the same to resume an interrupted synchronization
+    journal_options = ('path', 'url', 'rando_url', 'source', 'portal', 'skip_pdf', 'skip_tiles', 'skip_dem',
+                       'skip_profile_png', 'languages', 'with_events', 'content_categories', 'with_signages',
+                       'with_infrastructures', 'with_dives')
+
     def add_arguments(self, parser):
         parser.add_argument('path')
         parser.add_argument('--empty-tmp-folder', dest='empty_tmp_folder', action='store_true', default=False,
                             help='Empty tmp folder')
+        parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                            help='Keep the working directory if interrupted, and resume an interrupted '
+                                 'synchronization run with this option and the same options')
         parser.add_argument('--url', '-u', dest='url', default='http://localhost', help='Base url')
         parser.add_argument('--rando-url', '-r', dest='rando_url', default='http://localhost',
                             help='Base url of public rando site')
@@ -90,6 +98,16 @@ class Command(BaseCommand):
         if self.portal:
             params['portal'] = self.portal
 
+    def run_step(self, step, func, *args):
+        """ Run a synchronization step, unless already completed by the interrupted run being resumed.
+        """
+        if self.journal.is_done(step):
+            if self.verbosity == 2:
+                self.stdout.write("{step} already synced".format(step=step))
+            return
+        func(*args)
+        self.journal.complete(step, self.successfull)
+
     def sync_global_tiles(self):
         """ Creates a tiles file on the global extent.
         """
@@ -107,7 +125,7 @@ class Command(BaseCommand):
         logger.info("Build global tiles file...")
         self.mkdirs(global_file)
 
-        zipfile = ZipFile(global_file, 'w')
+        zipfile = common_sync.SyncZipFile(global_file, 'w')
         tiles = common_sync.ZipTilesBuilder(zipfile, **self.builder_args)
         tiles.add_coverage(bbox=global_extent,
                            zoomlevels=settings.MOBILE_TILES_GLOBAL_ZOOMS)
@@ -131,7 +149,7 @@ class Command(BaseCommand):
 
         self.mkdirs(trek_file)
 
-        zipfile = ZipFile(trek_file, 'w')
+        zipfile = common_sync.SyncZipFile(trek_file, 'w')
         tiles = common_sync.ZipTilesBuilder(zipfile, **self.builder_args)
 
         geom = trek.geom
@@ -173,17 +191,9 @@ class Command(BaseCommand):
             if self.verbosity > 0:
                 self.stderr.write(self.style.ERROR("failed (HTTP {code})".format(code=response.status_code)))
             return
-        f = open(fullname, 'wb')
-        if isinstance(response, StreamingHttpResponse):
-            content = b''.join(response.streaming_content)
-        else:
-            content = response.content
-        # Fix strange unicode characters 2028 and 2029 that make Geotrek-rando crash
-        if fix2028:
-            content = content.replace(b'\\u2028', b'\\n')
-            content = content.replace(b'\\u2029', b'\\n')
-        f.write(content)
-        f.close()
+        # Stream the response to disk and to the zip file, without joining it in memory
+        common_sync.write_chunks(common_sync.response_chunks(response), fullname,
+                                 zipfile=zipfile, arcname=name, fix2028=fix2028)
         oldfilename = os.path.join(self.dst_root, name)
         # If new file is identical to old one, don't recreate it. This will help backup
         if os.path.isfile(oldfilename) and filecmp.cmp(fullname, oldfilename):
@@ -194,10 +204,6 @@ class Command(BaseCommand):
         else:
             if self.verbosity == 2:
                 self.stdout.write("generated")
-        # FixMe: Find why there are duplicate files.
-        if zipfile:
-            if name not in zipfile.namelist():
-                zipfile.write(fullname, name)
 
     def sync_json(self, lang, viewset, name, zipfile=None, params={}, as_view_args=[], **kwargs):
         view = viewset.as_view(*as_view_args)
@@ -265,7 +271,7 @@ class Command(BaseCommand):
             return
         if not os.path.isfile(dst):
             os.link(src, dst)
-        if zipfile:
+        if zipfile is not None and os.path.join(url, name) not in zipfile:
             zipfile.write(dst, os.path.join(url, name))
         if self.verbosity == 2:
             self.stdout.write("{lang} {url}/{name} copied".format(lang=lang, url=url, name=name))
@@ -320,7 +326,7 @@ class Command(BaseCommand):
                     }
                 )
 
-            self.sync_global_tiles()
+            self.run_step('tiles', self.sync_global_tiles)
 
             if self.celery_task:
                 self.celery_task.update_state(
@@ -342,7 +348,7 @@ class Command(BaseCommand):
 
             for trek in treks:
                 if trek.any_published or any([parent.any_published for parent in trek.parents]):
-                    self.sync_trek_tiles(trek)
+                    self.run_step('tiles/{pk}'.format(pk=trek.pk), self.sync_trek_tiles, trek)
 
             if self.celery_task:
                 self.celery_task.update_state(
@@ -370,6 +376,9 @@ class Command(BaseCommand):
             dst = os.path.join(self.tmp_root, 'api', lang, '{modelname}s'.format(modelname=modelname), str(obj.pk),
                                obj.slug + '.pdf')
             self.mkdirs(dst)
+            # Already linked if the step is resumed
+            if os.path.lexists(dst):
+                os.unlink(dst)
             os.link(src, dst)
             if self.verbosity == 2:
                 self.stdout.write("\x1b[36m{lang}\x1b[0m \x1b[1m{dst}\x1b[0m \x1b[32mcopied\x1b[0m".format(lang=lang,
@@ -416,20 +425,27 @@ class Command(BaseCommand):
                     )
                     current_value = current_value + step_value
 
-                zipname = os.path.join('zip', 'treks', lang, 'global.zip')
-                zipfullname = os.path.join(self.tmp_root, zipname)
-                self.mkdirs(zipfullname)
-                self.zipfile = ZipFile(zipfullname, 'w')
+                step = '{module}/{lang}'.format(module=subcommand.__module__, lang=lang)
+                self.run_step(step, self.sync_subcommand, subcommand, lang)
 
-                translation.activate(lang)
-                subcommand.sync(lang)
-                translation.deactivate()
+        self.run_step('static', self.sync_static)
 
-                if self.verbosity == 2:
-                    self.stdout.write("{lang} {name} ...".format(lang=lang, name=zipname), ending="")
+    def sync_subcommand(self, subcommand, lang):
+        zipname = os.path.join('zip', 'treks', lang, 'global.zip')
+        zipfullname = os.path.join(self.tmp_root, zipname)
+        self.mkdirs(zipfullname)
+        self.zipfile = common_sync.SyncZipFile(zipfullname, 'w')
 
-                self.close_zip(self.zipfile, zipname)
+        translation.activate(lang)
+        subcommand.sync(lang)
+        translation.deactivate()
+
+        if self.verbosity == 2:
+            self.stdout.write("{lang} {name} ...".format(lang=lang, name=zipname), ending="")
+
+        self.close_zip(self.zipfile, zipname)
 
+    def sync_static(self):
         self.sync_static_file('**', 'tourism/touristicevent.svg')
         self.sync_pictograms('**', [tourism_models.InformationDeskType, tourism_models.TouristicContentCategory,
                                     tourism_models.TouristicContentType, tourism_models.TouristicEventType])
@@ -449,7 +465,23 @@ class Command(BaseCommand):
             shutil.rmtree(tmp_root2)
         os.rename(self.tmp_root, self.dst_root)
         os.chmod(self.dst_root, stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH | stat.S_IXOTH)
-        os.mkdir(self.tmp_root)  # Recreate otherwise python3.6 will complain it does not find the tmp dir at cleanup.
+
+    def get_journal_options(self):
+        return {name: self.options.get(name) for name in self.journal_options}
+
+    def sync_and_rename(self):
+        self.sync()
+        if self.celery_task:
+            self.celery_task.update_state(
+                state='PROGRESS',
+                meta={
+                    'name': self.celery_task.name,
+                    'current': 100,
+                    'total': 100,
+                    'infos': "{}".format(_("Sync ended"))
+                }
+            )
+        self.rename_root()
 
     def handle(self, *args, **options):
         self.options = options
@@ -506,28 +538,42 @@ class Command(BaseCommand):
             'ignore_errors': True,
             'tiles_dir': os.path.join(settings.VAR_DIR, 'tiles'),
         }
+        if options['resume'] and options['empty_tmp_folder']:
+            raise CommandError('--resume and --empty-tmp-folder options are not compatible')
         sync_rando_tmp_dir = os.path.join(settings.TMP_DIR, 'sync_rando')
         if options['empty_tmp_folder']:
             for dir in os.listdir(sync_rando_tmp_dir):
-                shutil.rmtree(os.path.join(sync_rando_tmp_dir, dir))
+                path = os.path.join(sync_rando_tmp_dir, dir)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
         if not os.path.exists(settings.TMP_DIR):
             os.mkdir(settings.TMP_DIR)
         if not os.path.exists(sync_rando_tmp_dir):
             os.mkdir(sync_rando_tmp_dir)
-        with tempfile.TemporaryDirectory(dir=sync_rando_tmp_dir) as tmp_dir:
-            self.tmp_root = tmp_dir
-            self.sync()
-            if self.celery_task:
-                self.celery_task.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'name': self.celery_task.name,
-                        'current': 100,
-                        'total': 100,
-                        'infos': "{}".format(_("Sync ended"))
-                    }
-                )
-            self.rename_root()
+
+        if options['resume']:
+            # Working directory is kept if the synchronization is interrupted, so that it can be resumed
+            dst_hash = hashlib.sha1(os.path.abspath(self.dst_root).encode('utf-8')).hexdigest()[:12]
+            self.tmp_root = os.path.join(sync_rando_tmp_dir, 'resume_{}'.format(dst_hash))
+            self.journal = common_sync.SyncJournal('{}.json'.format(self.tmp_root), self.get_journal_options())
+            if os.path.isdir(self.tmp_root) and self.journal.load():
+                self.successfull = self.journal.successfull
+                if self.verbosity >= 1:
+                    self.stdout.write("Resuming synchronization ({} steps already synced)".format(len(self.journal.steps)))
+            else:
+                if os.path.exists(self.tmp_root):
+                    shutil.rmtree(self.tmp_root)
+                os.mkdir(self.tmp_root)
+                self.journal.save()
+            self.sync_and_rename()
+            self.journal.delete()
+        else:
+            with tempfile.TemporaryDirectory(dir=sync_rando_tmp_dir) as tmp_dir:
+                self.tmp_root = tmp_dir
+                self.journal = common_sync.SyncJournal(None, self.get_journal_options())
+                self.sync_and_rename()
 
         done_message = 'Done'
         if self.successfull:
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.19 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0035_label_published'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='import_url',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Imported from'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='import_etag',
+            field=models.CharField(blank=True, default='', editable=False, max_length=256, verbose_name='Imported ETag'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='import_last_modified',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Imported Last-Modified'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='import_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Imported content hash'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='import_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Import check date'),
+        ),
+    ]
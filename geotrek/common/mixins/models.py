@@ -274,11 +274,14 @@ class BasePublishableMixin(models.Model):
         abstract = True
 
     def save(self, *args, **kwargs):
+        self.update_publication_date()
+        super().save(*args, **kwargs)
+
+    def update_publication_date(self):
         if self.publication_date is None and self.any_published:
             self.publication_date = datetime.date.today()
         if self.publication_date is not None and not self.any_published:
             self.publication_date = None
-        super().save(*args, **kwargs)
 
     @property
     def any_published(self):
@@ -340,16 +343,21 @@ class PublishableMixin(BasePublishableMixin):
         abstract = True
 
     def save(self, *args, **kwargs):
-        if (self.pk and self.__class__.objects.get(pk=self.pk).review != self.review and self.review) and settings.ALERT_REVIEW:
-            subject = _("{obj} need a review").format(obj=self)
-            message = render_to_string('common/review_email_message.txt', {"obj": self})
-            try:
-                mail_managers(subject, message, fail_silently=False)
-            except Exception as exc:
-                msg = f'Caught {exc.__class__.__name__}: {exc}'
-                logger.warning(f"Error mail managers didn't work ({msg})")
+        if self.pk and self.__class__.objects.get(pk=self.pk).review != self.review and self.review:
+            self.send_review_email()
         super().save(*args, **kwargs)
 
+    def send_review_email(self):
+        if not settings.ALERT_REVIEW:
+            return
+        subject = _("{obj} need a review").format(obj=self)
+        message = render_to_string('common/review_email_message.txt', {"obj": self})
+        try:
+            mail_managers(subject, message, fail_silently=False)
+        except Exception as exc:
+            msg = f'Caught {exc.__class__.__name__}: {exc}'
+            logger.warning(f"Error mail managers didn't work ({msg})")
+
     @property
     def slug(self):
         return slugify(self.name.lower().replace("œ", "oe")) or str(self.pk)
@@ -3,7 +3,9 @@ from io import BytesIO
 from urllib.parse import urljoin
 
 from django.conf import settings
-from django.http import HttpResponseNotFound, HttpResponse
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Max
+from django.http import FileResponse, HttpResponseNotFound, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import translation
 from django.utils.functional import classproperty
@@ -13,9 +15,12 @@ from mapentity import views as mapentity_views
 from mapentity.helpers import suffix_for
 from pdfimpose import PageList
 
+from geotrek import __version__
 from geotrek.common.models import TargetPortal, FileType, Attachment
+from geotrek.common.tasks import refresh_public_pdf
 from geotrek.common.utils import logger
 from geotrek.common.utils.portals import smart_get_template_by_portal
+from geotrek.common.utils.public_pdf import PublicPDFCache, record_public_pdf_cache
 
 
 class CustomColumnsMixin:
@@ -206,6 +211,10 @@ class DocumentPortalMixin:
 
 class DocumentPublicMixin:
     template_name_suffix = "_public"
+    # Rendered PDFs are cached (not markup)
+    public_pdf_cache = False
+    # Serve outdated cached PDFs while they are refreshed in background
+    serve_stale_public_pdf = True
 
     # Override view_permission_required
     def dispatch(self, *args, **kwargs):
@@ -219,6 +228,8 @@ class DocumentPublicMixin:
             file_type = None
         attachments = Attachment.objects.attachments_for_object_only_type(obj, file_type)
         if not attachments and not settings.ONLY_EXTERNAL_PUBLIC_PDF:
+            if self.public_pdf_cache and settings.PUBLIC_PDF_CACHE_ENABLED:
+                return self.get_cached_pdf(request, obj, pk, slug, lang)
             return super().get(request, pk, slug, lang)
         if not attachments:
             return HttpResponseNotFound("No attached file with 'Topoguide' type.")
@@ -239,6 +250,61 @@ class DocumentPublicMixin:
         context['mapimage_ratio'] = settings.EXPORT_MAP_IMAGE_SIZE[modelname]
         return context
 
+    def get_public_pdf_dependencies(self, obj):
+        """ Versions of everything the rendered PDF depends on, besides language and request parameters.
+        """
+        map_image_path = obj.get_map_image_path()
+        map_image_version = os.path.getmtime(map_image_path) if os.path.exists(map_image_path) else None
+        return [__version__, obj.get_date_update(), map_image_version, self.attachments_version(obj._meta.model, [obj.pk])]
+
+    @staticmethod
+    def attachments_version(model, pks):
+        """ Number and latest update of attachments of these objects, as their pictures are rendered.
+        """
+        content_type = ContentType.objects.get_for_model(model)
+        version = Attachment.objects.filter(content_type=content_type, object_id__in=pks).aggregate(
+            count=Count('pk'), last_update=Max('date_update'))
+        return [version['count'], version['last_update']]
+
+    def get_cached_pdf(self, request, obj, pk, slug, lang):
+        """ Serve the PDF from the cache if it is up-to-date. If it is outdated, serve it anyway
+        and refresh it in background, unless asked not to. Otherwise render and store it.
+        """
+        lang = lang or request.LANGUAGE_CODE
+        refresh = getattr(request, 'refresh_public_pdf', False)
+        pdf_cache = PublicPDFCache(obj, self.template_name_suffix, lang, request.GET)
+        pdf_file = pdf_cache.open(pdf_cache.name(self.get_public_pdf_dependencies(obj)))
+        if pdf_file:
+            if refresh:
+                # Already refreshed in the meantime
+                pdf_cache.unlock_refresh()
+            else:
+                record_public_pdf_cache('hit')
+            return self.cached_pdf_response(pdf_file, slug)
+        if self.serve_stale_public_pdf and not refresh:
+            pdf_file = pdf_cache.open_latest()
+            if pdf_file:
+                record_public_pdf_cache('stale')
+                if pdf_cache.lock_refresh():
+                    refresh_public_pdf.delay(request.path_info, request.GET.urlencode(), lang,
+                                             request.get_host(), request.is_secure())
+                return self.cached_pdf_response(pdf_file, slug)
+        if not refresh:
+            record_public_pdf_cache('miss')
+        response = super().get(request, pk, slug, lang)
+        response.render()
+        if response.status_code == 200:
+            # Map image may have been captured during rendering
+            pdf_cache.store(pdf_cache.name(self.get_public_pdf_dependencies(obj)), response.content)
+        if refresh:
+            pdf_cache.unlock_refresh()
+        return response
+
+    def cached_pdf_response(self, pdf_file, slug):
+        response = FileResponse(pdf_file, content_type='application/pdf')
+        response['Content-Disposition'] = "attachment; filename={0}.pdf".format(slug)
+        return response
+
 
 class CompletenessMixin:
     """Mixin for completeness fields"""
@@ -185,6 +185,15 @@ class FileType(StructureOrNoneRelated, TimeStampedModelMixin, BaseFileType):
 class Attachment(BaseAttachment):
     creation_date = models.DateField(verbose_name=_("Creation Date"), null=True, blank=True)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    # Validators of the file downloaded by parsers, to check if it changed since
+    import_url = models.TextField(verbose_name=_("Imported from"), blank=True, default="", editable=False)
+    import_etag = models.CharField(verbose_name=_("Imported ETag"), max_length=256, blank=True, default="",
+                                   editable=False)
+    import_last_modified = models.CharField(verbose_name=_("Imported Last-Modified"), max_length=64, blank=True,
+                                            default="", editable=False)
+    import_hash = models.CharField(verbose_name=_("Imported content hash"), max_length=40, blank=True, default="",
+                                   editable=False)
+    import_date = models.DateTimeField(verbose_name=_("Import check date"), null=True, blank=True, editable=False)
 
 
 class Theme(TimeStampedModelMixin, PictogramMixin):
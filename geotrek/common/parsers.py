@@ -1,19 +1,29 @@
 from io import BytesIO
+import copy
+import hashlib
 import importlib
 import json
 import os
 from pathlib import PurePath
 import re
+import shutil
+import tempfile
 import requests
 import logging
 import magic
 import mimetypes
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 import textwrap
 import xlrd
 import xml.etree.ElementTree as ET
+import queue
+import threading
+from datetime import timedelta
 from functools import reduce
-from collections import Iterable
+from itertools import islice
+from collections import Iterable, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from time import sleep
 from PIL import Image, UnidentifiedImageError
 
@@ -22,24 +32,29 @@ from os.path import dirname
 from urllib.parse import urlparse
 
 from django.contrib.gis.geos import GEOSGeometry, WKBWriter
-from django.db import models, connection
+from django.db import models, connection, transaction
+from django.db.models.expressions import RawSQL
 from django.db.models.fields import NOT_PROVIDED
+from django.db.models.signals import m2m_changed, post_save, pre_save
 from django.db.utils import DatabaseError, InternalError
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.gdal import DataSource, GDALException, CoordTransform
 from django.contrib.gis.geos import Point, Polygon
 from django.core.exceptions import ImproperlyConfigured
 from django.core.files.base import ContentFile
 from django.template.loader import render_to_string
-from django.utils import translation
+from django.utils import timezone, translation
 from django.utils.translation import gettext as _
 from django.utils.encoding import force_str
 from django.conf import settings
 from paperclip.models import attachment_upload, random_suffix_regexp
 
 from geotrek.authent.models import default_structure
+from geotrek.common.mixins.models import NoDeleteMixin
 from geotrek.common.models import FileType, Attachment, License
 from geotrek.common.utils.parsers import add_http_prefix
+from geotrek.common.utils.profiling import ImportProfiler
 from geotrek.common.utils.translation import get_translated_fields
 
 
@@ -69,10 +84,66 @@ class DownloadImportError(ImportError):
     pass
 
 
+class LookupCache:
+    """
+    Related objects looked up by natural key during one import, so that the same categories,
+    themes, types... are fetched once instead of once per row. Missing objects are cached too,
+    and objects created during import are reused by following rows.
+    """
+    creation_lock = threading.Lock()
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_key(self, model, fields):
+        values = tuple(sorted(
+            (name, value.pk if isinstance(value, models.Model) else value) for name, value in fields.items()
+        ))
+        # Natural keys may be translated fields, looked up in current language
+        key = (model, translation.get_language(), values)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, model, **fields):
+        key = self.get_key(model, fields)
+        if key is None:
+            return model.objects.get(**fields)
+        if key not in self.objects:
+            try:
+                self.objects[key] = model.objects.get(**fields)
+            except model.DoesNotExist:
+                self.objects[key] = None
+        if self.objects[key] is None:
+            raise model.DoesNotExist
+        return self.objects[key]
+
+    def get_or_create(self, model, **fields):
+        key = self.get_key(model, fields)
+        if key is not None and self.objects.get(key) is not None:
+            return self.objects[key], False
+        # Sources of GeotrekAggregatorParser are imported by threads sharing reference tables,
+        # creations are serialized so that a category created by a thread is found by the others
+        with self.creation_lock:
+            obj, created = model.objects.get_or_create(**fields)
+        if key is not None:
+            self.objects[key] = obj
+        return obj, created
+
+
 class Parser:
     """
     provider: Allow to differentiate multiple Parser for the same model
     default_language: Allow to define which language this parser will populate by default
+    batch_size: Save objects by chunks of this number of rows with bulk queries, instead of one by one.
+        Model save() method is not called, so it should not be used for models relying on it (topologies...)
+        Objects are saved one by one if model save or many to many signals are listened.
+    chunk_size: Import rows in transactions of this number of rows, each row in a savepoint.
+        Work deferred with end_chunk() is done once per chunk. If a chunk fails, its rows are imported again one by one.
+    soft_delete: With delete, mark objects which are not in source anymore as deleted instead of deleting them.
+        Only for models with a deleted field (NoDeleteMixin). Objects back in source are restored.
     """
     label = None
     model = None
@@ -97,6 +168,10 @@ class Parser:
     natural_keys = {}
     field_options = {}
     default_language = None
+    batch_size = None
+    chunk_size = None
+    soft_delete = False
+    delete_batch_size = 1000
 
     def __init__(self, progress_cb=None, user=None, encoding='utf8'):
         self.warnings = {}
@@ -110,6 +185,12 @@ class Parser:
         self.structure = user and user.profile.structure or default_structure()
         self.encoding = encoding
         self.translated_fields = get_translated_fields(self.model)
+        self.lookups = LookupCache()
+        self.profiler = ImportProfiler()
+        self.to_delete_table = None
+        self.seen_pks = set()
+        self.temporary_tables = []
+        self.nb_deleted = 0
 
         if self.fields is None:
             self.fields = {
@@ -122,6 +203,12 @@ class Parser:
                 for f in self.model._meta.many_to_many
             }
 
+        if self.soft_delete:
+            if not issubclass(self.model, NoDeleteMixin):
+                raise ImproperlyConfigured("soft_delete can only be used with models having a deleted field")
+            # Restore objects back in source
+            self.constant_fields = {**self.constant_fields, 'deleted': False}
+
         if self.default_language and self.default_language in settings.MODELTRANSLATION_LANGUAGES:
             translation.activate(self.default_language)
         else:
@@ -208,8 +295,12 @@ class Parser:
         if isinstance(field, models.CharField):
             val = str(val)[:256]
         if isinstance(field, models.ManyToManyField):
-            fk = getattr(self.obj, dst)
-            fk.set(val)
+            if self.batch_size and field.remote_field.through._meta.auto_created:
+                # Written for all objects of the batch at once
+                self.batch_m2m.setdefault(dst, {})[self.obj] = val
+            else:
+                fk = getattr(self.obj, dst)
+                fk.set(val)
         else:
             setattr(self.obj, dst, val)
 
@@ -222,7 +313,8 @@ class Parser:
                 old = getattr(self.obj, dst)
 
         if hasattr(self, 'filter_{0}'.format(dst)):
-            val = getattr(self, 'filter_{0}'.format(dst))(src, val)
+            with self.profiler.filter('filter_{0}'.format(dst)):
+                val = getattr(self, 'filter_{0}'.format(dst))(src, val)
         else:
             val = self.apply_filter(dst, src, val)
         if hasattr(self.obj, dst):
@@ -263,7 +355,8 @@ class Parser:
         # If during filter, the traduction of the field has been changed
         # we can still check if this value has been changed
         if hasattr(self, 'filter_{0}'.format(dst)):
-            val_default_language = getattr(self, 'filter_{0}'.format(dst))(src, val)
+            with self.profiler.filter('filter_{0}'.format(dst)):
+                val_default_language = getattr(self, 'filter_{0}'.format(dst))(src, val)
         else:
             val_default_language = self.apply_filter(dst, src, val)
 
@@ -322,23 +415,38 @@ class Parser:
         return updated
 
     def parse_obj(self, row, operation):
+        update_fields = self.parse_obj_fields(row, operation)
+        if update_fields is None:
+            return
+        with self.profiler.phase('save'):
+            if operation == "created":
+                self.obj.save()
+            else:
+                self.obj.save(update_fields=update_fields)
+        with self.profiler.phase('m2m'):
+            update_fields += self.parse_fields(row, self.m2m_fields)
+            update_fields += self.parse_fields(row, self.m2m_constant_fields)
+        with self.profiler.phase('filter'):
+            update_fields += self.parse_fields(row, self.non_fields, non_field=True)
+        self.count_obj(operation, update_fields)
+
+    def parse_obj_fields(self, row, operation):
+        """Parse fields stored in the object table. Returns modified fields, or None if the row is invalid"""
         try:
-            update_fields = self.parse_fields(row, self.fields)
-            update_fields += self.parse_fields(row, self.constant_fields)
+            with self.profiler.phase('filter'):
+                update_fields = self.parse_fields(row, self.fields)
+                update_fields += self.parse_fields(row, self.constant_fields)
             if 'id' in update_fields:
                 update_fields.remove('id')  # Can't update primary key
         except RowImportError as warnings:
             self.add_warning(str(warnings))
-            return
+            return None
         if operation == "created":
             if hasattr(self.model, 'provider') and self.provider is not None and not self.obj.provider:
                 self.obj.provider = self.provider
-            self.obj.save()
-        else:
-            self.obj.save(update_fields=update_fields)
-        update_fields += self.parse_fields(row, self.m2m_fields)
-        update_fields += self.parse_fields(row, self.m2m_constant_fields)
-        update_fields += self.parse_fields(row, self.non_fields, non_field=True)
+        return update_fields
+
+    def count_obj(self, operation, update_fields):
         if operation == "created":
             self.nb_created += 1
         elif update_fields:
@@ -362,6 +470,33 @@ class Parser:
         self.eid_val = eid_val
         return {self.eid: eid_val}
 
+    def get_eid_objects(self, eid_kwargs):
+        if self.batch_size:
+            if eid_kwargs.keys() == {self.eid}:
+                return self.objects_by_eid.get(self.get_eid_key(self.eid_val), [])
+            # Eid index does not know about other filters, query saved objects instead
+            self.save_batch()
+        objects = self.model.objects.filter(**eid_kwargs)
+        if hasattr(self.model, 'provider') and self.provider is not None:
+            objects = objects.filter(provider__exact=self.provider)
+        return objects
+
+    def get_eid_key(self, eid_val):
+        return self.model._meta.get_field(self.eid).to_python(eid_val)
+
+    def load_eid_index(self):
+        """Load existing objects in one query, indexed by eid, instead of one query per row"""
+        self.objects_by_eid = {}
+        if self.eid is None:
+            return
+        objects = self.model.objects.all()
+        if hasattr(self.model, 'provider') and self.provider is not None:
+            objects = objects.filter(provider__exact=self.provider)
+        if hasattr(self.model, 'structure'):
+            objects = objects.select_related('structure')
+        for obj in objects:
+            self.objects_by_eid.setdefault(self.get_eid_key(getattr(obj, self.eid)), []).append(obj)
+
     def parse_row(self, row):
         self.eid_val = None
         self.line += 1
@@ -374,9 +509,8 @@ class Parser:
             except RowImportError as warnings:
                 self.add_warning(str(warnings))
                 return
-            objects = self.model.objects.filter(**eid_kwargs)
-            if hasattr(self.model, 'provider') and self.provider is not None:
-                objects = objects.filter(provider__exact=self.provider)
+            with self.profiler.phase('lookups'):
+                objects = self.get_eid_objects(eid_kwargs)
         if len(objects) == 0 and self.update_only:
             if self.warn_on_missing_objects:
                 self.add_warning(_("Bad value '{eid_val}' for field '{eid_src}'. No object with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
@@ -387,6 +521,9 @@ class Parser:
                 obj.structure = self.structure
             objects = [obj]
             operation = "created"
+            if self.batch_size and self.eid is not None:
+                # Following rows with the same eid update this object
+                self.objects_by_eid[self.get_eid_key(self.eid_val)] = objects
         elif len(objects) >= 2 and not self.duplicate_eid_allowed:
             self.add_warning(_("Bad value '{eid_val}' for field '{eid_src}'. Multiple objects with this identifier").format(eid_val=self.eid_val, eid_src=self.eid_src))
             return
@@ -396,16 +533,151 @@ class Parser:
                 if not hasattr(obj, 'structure') or obj.structure == self.structure or self.user is None or self.user.has_perm('authent.can_bypass_structure'):
                     _objects.append(obj)
                 else:
-                    self.to_delete.discard(obj.pk)
+                    self.keep_object(obj.pk)
                     self.add_warning(_("Bad ownership '{structure}' for object '{eid_val}'.").format(structure=obj.structure.name, eid_val=self.eid_val))
             objects = _objects
             operation = "updated"
         for self.obj in objects:
-            self.parse_obj(row, operation)
-            self.to_delete.discard(self.obj.pk)
+            if self.batch_size:
+                self.add_to_batch(row, operation)
+            else:
+                self.parse_obj(row, operation)
+            self.keep_object(self.obj.pk)
         self.nb_success += 1  # FIXME
         if self.progress_cb:
             self.progress_cb(float(self.line) / self.nb, self.line, self.eid_val)
+        if self.batch_size and len(self.batch) >= self.batch_size:
+            self.save_batch()
+
+    def add_to_batch(self, row, operation):
+        update_fields = self.parse_obj_fields(row, operation)
+        if update_fields is None:
+            if operation == "created" and self.eid is not None:
+                self.objects_by_eid.pop(self.get_eid_key(self.eid_val), None)
+            return
+        self.batch.append({
+            'line': self.line,
+            'eid_val': self.eid_val,
+            'row': row,
+            'obj': self.obj,
+            'operation': operation,
+            'update_fields': update_fields,
+        })
+
+    def save_batch(self):
+        """Save objects parsed since last call with bulk queries, then parse their relations"""
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        line, eid_val = self.line, self.eid_val
+        try:
+            with transaction.atomic(), self.profiler.phase('save'):
+                self.bulk_save(batch)
+        except DatabaseError:
+            if settings.DEBUG:
+                raise
+            # Save objects one by one to report the faulty rows only
+            batch = self.save_batch_one_by_one(batch)
+        else:
+            self.send_review_emails(batch)
+        with self.profiler.phase('m2m'):
+            self.batch_m2m = {}
+            self.prefetch_batch_m2m([entry['obj'] for entry in batch])
+            for entry in batch:
+                self.line, self.eid_val, self.obj = entry['line'], entry['eid_val'], entry['obj']
+                try:
+                    entry['update_fields'] += self.parse_fields(entry['row'], self.m2m_fields)
+                    entry['update_fields'] += self.parse_fields(entry['row'], self.m2m_constant_fields)
+                except (ValueImportError, RowImportError) as e:
+                    self.add_warning(str(e))
+            self.bulk_save_m2m()
+        for entry in batch:
+            # Free memory, as objects are kept in eid index
+            entry['obj']._prefetched_objects_cache = {}
+        for entry in batch:
+            self.line, self.eid_val, self.obj = entry['line'], entry['eid_val'], entry['obj']
+            try:
+                with self.profiler.phase('filter'):
+                    entry['update_fields'] += self.parse_fields(entry['row'], self.non_fields, non_field=True)
+            except (ValueImportError, RowImportError) as e:
+                self.add_warning(str(e))
+                continue
+            self.count_obj(entry['operation'], entry['update_fields'])
+        self.line, self.eid_val = line, eid_val
+
+    def bulk_save(self, batch):
+        created = {}
+        updated = {}
+        for entry in batch:
+            obj = entry['obj']
+            if hasattr(obj, 'update_publication_date'):
+                obj.update_publication_date()
+            if obj.pk is None:
+                created[id(obj)] = obj
+            elif entry['update_fields']:
+                # Group objects by modified fields, to only write these ones
+                fields = tuple(sorted(set(entry['update_fields'])))
+                updated.setdefault(fields, {})[id(obj)] = obj
+        self.model.objects.bulk_create(created.values())
+        for fields, objects in updated.items():
+            self.model.objects.bulk_update(objects.values(), fields)
+
+    def send_review_emails(self, batch):
+        """Send emails otherwise sent by PublishableMixin.save() for objects set waiting for publication"""
+        for entry in batch:
+            obj = entry['obj']
+            if entry['operation'] == "updated" and 'review' in entry['update_fields'] and getattr(obj, 'review', False):
+                obj.send_review_email()
+
+    def can_bulk_save(self):
+        """Bulk queries do not send model signals, so they can only be used if nobody listens to them"""
+        if pre_save.has_listeners(self.model) or post_save.has_listeners(self.model):
+            return False
+        return not any(m2m_changed.has_listeners(field.remote_field.through) for field in self.model._meta.many_to_many)
+
+    def save_batch_one_by_one(self, batch):
+        saved = []
+        for entry in batch:
+            obj = entry['obj']
+            if entry['operation'] == "created":
+                # Rollbacked by the failed bulk insert
+                obj.pk = None
+                obj._state.adding = True
+        for entry in batch:
+            self.line, self.eid_val, self.obj = entry['line'], entry['eid_val'], entry['obj']
+            try:
+                with transaction.atomic():
+                    if self.obj.pk is None:
+                        self.obj.save()
+                    else:
+                        self.obj.save(update_fields=entry['update_fields'])
+            except DatabaseError as e:
+                self.add_warning(str(e))
+                if self.obj.pk is None and self.eid is not None:
+                    self.objects_by_eid.pop(self.get_eid_key(self.eid_val), None)
+                continue
+            saved.append(entry)
+        return saved
+
+    def prefetch_batch_m2m(self, objects):
+        fields = [dst for dst in list(self.m2m_fields) + list(self.m2m_constant_fields)
+                  if isinstance(self.model._meta.get_field(dst), models.ManyToManyField)]
+        if fields:
+            models.prefetch_related_objects(objects, *fields)
+
+    def bulk_save_m2m(self):
+        """Replace many to many relations set during batch, with two queries by field"""
+        for dst, values in self.batch_m2m.items():
+            field = self.model._meta.get_field(dst)
+            through = field.remote_field.through
+            source_name = field.m2m_field_name()
+            target_name = field.m2m_reverse_field_name()
+            through.objects.filter(**{'{}__in'.format(source_name): [obj.pk for obj in values]}).delete()
+            through.objects.bulk_create([
+                through(**{source_name: obj, target_name: target})
+                for obj, targets in values.items() for target in targets
+            ])
+        self.batch_m2m = {}
 
     def report(self, output_format='txt'):
         context = {
@@ -413,9 +685,10 @@ class Parser:
             'nb_lines': self.line,
             'nb_created': self.nb_created,
             'nb_updated': self.nb_updated,
-            'nb_deleted': len(self.to_delete) if self.delete else None,
+            'nb_deleted': self.nb_deleted if self.delete else None,
             'nb_unmodified': self.nb_unmodified,
             'warnings': self.warnings,
+            'profile': self.profiler.as_dict() if self.profiler.phases else None,
         }
         return render_to_string('common/parser_report.{output_format}'.format(output_format=output_format), context)
 
@@ -450,12 +723,14 @@ class Parser:
         if fk:
             fields[fk] = getattr(self.obj, fk)
         if create:
-            val, created = model.objects.get_or_create(**fields)
+            with self.profiler.phase('lookups'):
+                val, created = self.lookups.get_or_create(model, **fields)
             if created:
                 self.add_warning(_("{model} '{val}' did not exist in Geotrek-Admin and was automatically created").format(model=model._meta.verbose_name.title(), val=val))
             return val
         try:
-            return model.objects.get(**fields)
+            with self.profiler.phase('lookups'):
+                return self.lookups.get(model, **fields)
         except model.DoesNotExist:
             self.add_warning(_("{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=model._meta.verbose_name.title(), val=val))
             return None
@@ -476,13 +751,15 @@ class Parser:
             if fk:
                 fields[fk] = getattr(self.obj, fk)
             if create:
-                subval, created = model.objects.get_or_create(**fields)
+                with self.profiler.phase('lookups'):
+                    subval, created = self.lookups.get_or_create(model, **fields)
                 if created:
                     self.add_warning(_("{model} '{val}' did not exist in Geotrek-Admin and was automatically created").format(model=model._meta.verbose_name.title(), val=subval))
                 dst.append(subval)
                 continue
             try:
-                dst.append(model.objects.get(**fields))
+                with self.profiler.phase('lookups'):
+                    dst.append(self.lookups.get(model, **fields))
             except model.DoesNotExist:
                 self.add_warning(_("{model} '{val}' does not exists in Geotrek-Admin. Please add it").format(model=model._meta.verbose_name.title(), val=subval))
                 continue
@@ -517,15 +794,100 @@ class Parser:
         return kwargs
 
     def start(self):
-        kwargs = self.get_to_delete_kwargs()
-        if kwargs is None:
-            self.to_delete = set()
-        else:
-            self.to_delete = set(self.model.objects.filter(**kwargs).values_list('pk', flat=True))
+        self.stage_to_delete()
+        if self.batch_size and not self.can_bulk_save():
+            self.batch_size = None
+        if self.batch_size:
+            self.batch = []
+            self.batch_m2m = {}
+            self.load_eid_index()
 
     def end(self):
-        if self.delete:
-            self.model.objects.filter(pk__in=self.to_delete).delete()
+        if self.to_delete_table:
+            with self.profiler.phase('delete'):
+                self.flush_seen_pks()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pk FROM {table} ORDER BY pk'.format(table=self.to_delete_table))
+                    pks = [pk for pk, in cursor.fetchall()]
+                self.nb_deleted = len(pks)
+                self.delete_objects(pks)
+        self.drop_temporary_tables()
+
+    def get_to_delete_queryset(self):
+        """Objects to delete if they are not in source anymore, None if there are none"""
+        kwargs = self.get_to_delete_kwargs()
+        if kwargs is None:
+            return None
+        return self.model.objects.filter(**kwargs)
+
+    def create_temporary_table(self, name, sql, params=()):
+        """Create a temporary table, dropped at the end of the import"""
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {table}'.format(table=name))
+            cursor.execute(sql.format(table=name), params)
+        self.temporary_tables.append(name)
+
+    def drop_temporary_tables(self):
+        with connection.cursor() as cursor:
+            for table in self.temporary_tables:
+                cursor.execute('DROP TABLE IF EXISTS {table}'.format(table=table))
+        self.temporary_tables = []
+        self.to_delete_table = None
+
+    def stage_to_delete(self):
+        """Stage primary keys of objects to delete if they are not found in source in a temporary table.
+        Objects found in source are removed from it by batches, remaining ones are deleted at the end."""
+        self.to_delete_table = None
+        self.seen_pks = set()
+        self.nb_deleted = 0
+        queryset = self.get_to_delete_queryset() if self.delete else None
+        if queryset is None:
+            return
+        table = 'parser_to_delete_{}'.format(id(self))
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        self.create_temporary_table(
+            table, 'CREATE TEMPORARY TABLE {{table}} AS SELECT DISTINCT pk FROM ({sql}) AS candidates(pk)'.format(sql=sql),
+            params)
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE {table} ADD PRIMARY KEY (pk)'.format(table=table))
+        self.to_delete_table = table
+
+    def keep_object(self, pk):
+        """Do not delete this object at the end of the import"""
+        if self.to_delete_table is None or pk is None:
+            return
+        self.seen_pks.add(pk)
+        if len(self.seen_pks) >= self.delete_batch_size:
+            self.flush_seen_pks()
+
+    def flush_seen_pks(self):
+        if self.seen_pks:
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM {table} WHERE pk = ANY(%s)'.format(table=self.to_delete_table),
+                               [list(self.seen_pks)])
+        self.seen_pks = set()
+
+    def delete_objects(self, pks):
+        """Delete objects by batches, or mark them as deleted with one update by batch if soft_delete is set"""
+        pks = sorted(pks)
+        for i in range(0, len(pks), self.delete_batch_size):
+            queryset = self.model.objects.filter(pk__in=pks[i:i + self.delete_batch_size])
+            if self.soft_delete:
+                queryset.update(deleted=True)
+            else:
+                queryset.delete()
+
+    def exclude_values(self, queryset, field, values):
+        """Exclude objects whose field is in values, with an anti-join on a temporary table
+        instead of a NOT IN clause with thousands of values"""
+        field = queryset.model._meta.get_field(field)
+        table = 'parser_values_{}'.format(id(self))
+        self.create_temporary_table(table, 'CREATE TEMPORARY TABLE {{table}} (value {type} PRIMARY KEY)'.format(
+            type=field.db_type(connection)))
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO {table} SELECT DISTINCT unnest(%s::text[])::{type}'.format(
+                table=table, type=field.cast_db_type(connection)), [[str(value) for value in values]])
+        return queryset.exclude(**{'{}__in'.format(field.name): RawSQL('SELECT value FROM {table}'.format(table=table), [])})
 
     def parse(self, filename=None, limit=None):
         if filename:
@@ -534,24 +896,101 @@ class Parser:
             raise GlobalImportError(_("Filename or url is required"))
         if self.filename and not os.path.exists(self.filename):
             raise GlobalImportError(_("File does not exists at: {filename}").format(filename=self.filename))
-        self.start()
-        for i, row in enumerate(self.next_row()):
-            if limit and i >= limit:
-                break
-            try:
-                self.parse_row(row)
-            except DatabaseError as e:
-                if settings.DEBUG:
-                    raise
-                self.add_warning(str(e))
-            except (ValueImportError, RowImportError) as e:
-                self.add_warning(str(e))
-            except Exception as e:
+        with connection.execute_wrapper(self.profiler.execute_wrapper):
+            self.start()
+            rows = self.profiler.iterate(self.prefetch_rows(self.next_row()))
+            if limit:
+                rows = islice(rows, limit)
+            if self.chunk_size and not self.batch_size:
+                self.parse_chunks(rows)
+            else:
+                for row in rows:
+                    self.import_row(row)
+            if self.batch_size:
+                self.save_batch()
+            self.end()
+
+    def import_row(self, row, savepoint=False):
+        try:
+            with self.profiler.row(self):
+                if savepoint:
+                    # An error in this row must not abort the whole transaction
+                    with transaction.atomic():
+                        self.parse_row(row)
+                else:
+                    self.parse_row(row)
+        except DatabaseError as e:
+            if settings.DEBUG:
                 raise
+            self.add_warning(str(e))
+        except (ValueImportError, RowImportError) as e:
+            self.add_warning(str(e))
+        except Exception as e:
+            raise
+            if settings.DEBUG:
+                raise
+            self.add_warning(str(e))
+
+    def parse_chunks(self, rows):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            state = self.get_chunk_state()
+            try:
+                self.parse_chunk(chunk)
+            except DatabaseError:
                 if settings.DEBUG:
                     raise
-                self.add_warning(str(e))
-        self.end()
+                # Import rows one by one, to lose only faulty ones
+                self.set_chunk_state(state)
+                for row in chunk:
+                    state = self.get_chunk_state()
+                    try:
+                        self.parse_chunk([row])
+                    except DatabaseError as e:
+                        self.set_chunk_state(state)
+                        self.line += 1
+                        self.add_warning(str(e))
+
+    def parse_chunk(self, rows):
+        with transaction.atomic():
+            for row in rows:
+                self.import_row(row, savepoint=True)
+            self.end_chunk()
+
+    def end_chunk(self):
+        """Hook to do deferred work on objects of a chunk, before it is commited"""
+        pass
+
+    def get_chunk_state(self):
+        """Import state to restore if the chunk is rollbacked"""
+        return {
+            'line': self.line,
+            'nb_success': self.nb_success,
+            'nb_created': self.nb_created,
+            'nb_updated': self.nb_updated,
+            'nb_unmodified': self.nb_unmodified,
+            'warnings': {key: list(warnings) for key, warnings in self.warnings.items()},
+            'seen_pks': set(self.seen_pks),
+        }
+
+    def set_chunk_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        # Cached objects may have been created by the rollbacked transaction
+        self.lookups = LookupCache()
+
+    def prefetch_rows(self, rows):
+        """Hook to prepare following rows while the current one is parsed"""
+        return rows
+
+    def fetch_pages(self, pages):
+        """Iterate over pages, fetching next ones in background if PARSER_PREFETCH_PAGES is set"""
+        if not settings.PARSER_PREFETCH_PAGES:
+            return pages
+        return iter(PageFetcher(pages, settings.PARSER_PREFETCH_PAGES))
 
     def request_or_retry(self, url, verb='get', **kwargs):
         try_get = settings.PARSER_NUMBER_OF_TRIES
@@ -563,7 +1002,7 @@ class Parser:
                 logger.info("Failed to fetch url {}. Retrying ...".format(url))
                 sleep(settings.PARSER_RETRY_SLEEP_TIME)
                 try_get -= 1
-            elif response.status_code == 200:
+            elif response.status_code in (requests.codes.ok, requests.codes.not_modified):
                 return response
             else:
                 break
@@ -571,25 +1010,94 @@ class Parser:
         raise DownloadImportError(_("Failed to download {url}. HTTP status code {status_code}").format(url=response.url, status_code=response.status_code))
 
 
+class XmlStream:
+    """ Iterate over entries of a XML document while it is read, removing them from the tree
+    once read, so that large documents are never loaded in memory.
+    Only simple paths (tags separated by slashes, relative to the root element) are supported.
+    """
+    def __init__(self, f, path, ns=None, size=None):
+        self.f = f
+        self.tags = [self.qualify(part, ns or {}) for part in path.split('/')]
+        self.size = size
+        self.offset = 0
+        self.count = 0
+        self.root = None
+
+    @classmethod
+    def is_streamable(cls, path):
+        return bool(path) and all(re.match(r'^(\w+:)?[\w.-]+$', part) for part in path.split('/'))
+
+    def qualify(self, tag, ns):
+        if ':' in tag:
+            prefix, tag = tag.split(':')
+            return '{{{uri}}}{tag}'.format(uri=ns[prefix], tag=tag)
+        return tag
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.offset += len(data)
+        return data
+
+    @property
+    def estimated_count(self):
+        """Number of entries, estimated from the part of the document already read"""
+        if not self.size or not self.offset:
+            return self.count
+        return max(self.count, round(self.count * self.size / self.offset))
+
+    def __iter__(self):
+        parents = []
+        for event, elem in ET.iterparse(self, events=('start', 'end')):
+            if event == 'start':
+                if self.root is None:
+                    self.root = elem
+                parents.append(elem)
+                continue
+            parents.pop()
+            if len(parents) == len(self.tags) and [parent.tag for parent in parents[1:]] + [elem.tag] == self.tags:
+                parents[-1].remove(elem)
+                self.count += 1
+                yield elem
+
+
 class XmlParser(Parser):
-    """XML Parser"""
+    """XML Parser
+
+    Entries are read while the document is downloaded if results_path is a simple path.
+    """
     ns = {}
     results_path = ''
 
-    def next_row(self):
+    def open_xml(self):
+        """Return XML document file object and its size in bytes if known"""
         if self.filename:
-            with open(self.filename) as f:
-                self.root = ET.fromstring(f.read())
-        else:
-            response = requests.get(self.url, params={})
-            if response.status_code != 200:
-                raise GlobalImportError(_(u"Failed to download {url}. HTTP status code {status_code}").format(
-                    url=self.url, status_code=response.status_code))
-            self.root = ET.fromstring(response.content)
-        entries = self.root.findall(self.results_path, self.ns)
-        self.nb = len(entries)
-        for row in entries:
-            yield row
+            return open(self.filename, 'rb'), os.path.getsize(self.filename)
+        response = requests.get(self.url, params={}, stream=True)
+        if response.status_code != 200:
+            raise GlobalImportError(_(u"Failed to download {url}. HTTP status code {status_code}").format(
+                url=self.url, status_code=response.status_code))
+        response.raw.decode_content = True
+        size = response.headers.get('Content-Length')
+        if size is None or response.headers.get('Content-Encoding'):
+            return response.raw, None
+        return response.raw, int(size)
+
+    def next_row(self):
+        f, size = self.open_xml()
+        with f:
+            if not XmlStream.is_streamable(self.results_path):
+                self.root = ET.parse(f).getroot()
+                entries = self.root.findall(self.results_path, self.ns)
+                self.nb = len(entries)
+                for row in entries:
+                    yield row
+                return
+            stream = XmlStream(f, self.results_path, self.ns, size)
+            for row in stream:
+                self.root = stream.root
+                self.nb = stream.estimated_count
+                yield row
+            self.nb = stream.count
 
     def get_part(self, dst, src, val):
         return val.findtext(src, None, self.ns)
@@ -653,12 +1161,186 @@ class AtomParser(Parser):
         srcs = self.flatten_fields(self.fields)
         srcs += self.flatten_fields(self.m2m_fields)
         srcs += self.flatten_fields(self.non_fields)
-        tree = ET.parse(self.filename)
-        entries = tree.getroot().findall('Atom:entry', self.ns)
-        self.nb = len(entries)
-        for entry in entries:
-            row = {self.normalize_field_name(src): entry.find(src, self.ns).text for src in srcs}
-            yield row
+        with open(self.filename, 'rb') as f:
+            stream = XmlStream(f, 'Atom:entry', self.ns, os.path.getsize(self.filename))
+            for entry in stream:
+                self.nb = stream.estimated_count
+                row = {self.normalize_field_name(src): entry.find(src, self.ns).text for src in srcs}
+                yield row
+
+
+class PageFetcher:
+    """ Iterate over pages of an API, fetching next pages in a background thread
+    while rows of the current one are imported.
+    """
+    def __init__(self, pages, size):
+        self.pages = pages
+        self.queue = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            for page in self.pages:
+                if not self.put((page, None)):
+                    return
+        except Exception as e:
+            self.put((None, e))
+        else:
+            self.put((None, None))
+
+    def put(self, item):
+        # Do not block forever if pages are not consumed anymore
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        try:
+            while True:
+                page, exception = self.queue.get()
+                if exception is not None:
+                    raise exception
+                if page is None:
+                    return
+                yield page
+        finally:
+            self.stopped.set()
+
+
+class AttachmentFetcher:
+    """
+    Download attachments with a pool of threads sharing HTTP connections, so that following
+    attachments are fetched while the current ones are saved.
+    Requests to the same host are limited, and retries are scheduled later instead of waiting in a worker.
+    """
+    # Size of downloaded bodies not used yet above which no more attachments are prefetched
+    max_pending_size = 64 * 1024 * 1024
+
+    def __init__(self, workers, workers_by_host):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.workers_by_host = workers_by_host
+        self.max_prefetch = 4 * workers
+        self.max_pending = 16 * workers
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+        self.futures = OrderedDict()
+        self.sizes = {}
+        self.pending_size = 0
+        self.timers = set()
+        self.closed = False
+
+    def get_host_semaphore(self, host):
+        with self.lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.workers_by_host)
+            return self.host_semaphores[host]
+
+    def prefetch(self, url, verb='get', headers=None):
+        key = (verb, url, tuple(sorted((headers or {}).items())))
+        if key in self.futures:
+            return key
+        future = self.futures[key] = Future()
+        self.submit(key, future, url, verb, headers, settings.PARSER_NUMBER_OF_TRIES)
+        while len(self.futures) > self.max_pending:
+            # Prefetched but never used (invalid row...)
+            with self.lock:
+                old_key, old_future = self.futures.popitem(last=False)
+                self.pending_size -= self.sizes.pop(old_key, 0)
+            old_future.cancel()
+        return key
+
+    def is_full(self):
+        """True if too many downloaded bodies are waiting to be used"""
+        return self.pending_size > self.max_pending_size
+
+    def fetch(self, url, verb='get', headers=None):
+        """Return the response, waiting for its download if not completed yet"""
+        key = self.prefetch(url, verb, headers)
+        future = self.futures.pop(key)
+        try:
+            return future.result()
+        finally:
+            self.release(key)
+
+    def release(self, key):
+        with self.lock:
+            self.pending_size -= self.sizes.pop(key, 0)
+
+    def submit(self, key, future, url, verb, headers, tries):
+        if future.done() or self.closed:
+            return
+        try:
+            self.executor.submit(self.request, key, future, url, verb, headers, tries)
+        except RuntimeError as e:
+            # Executor shut down
+            future.set_exception(e)
+
+    def schedule_retry(self, key, future, url, verb, headers, tries):
+        def retry():
+            with self.lock:
+                self.timers.discard(timer)
+            self.submit(key, future, url, verb, headers, tries)
+
+        timer = threading.Timer(settings.PARSER_RETRY_SLEEP_TIME, retry)
+        with self.lock:
+            if self.closed:
+                return
+            self.timers.add(timer)
+        timer.start()
+
+    def request(self, key, future, url, verb, headers, tries):
+        """Try to download url once, scheduling the next try if the server asks to retry later"""
+        if tries == settings.PARSER_NUMBER_OF_TRIES and not future.set_running_or_notify_cancel():
+            return
+        try:
+            host_semaphore = self.get_host_semaphore(urlparse(url).hostname)
+            with host_semaphore:
+                response = getattr(self.session, verb)(url, allow_redirects=True, headers=headers)
+                if verb == 'get':
+                    response.content  # Read body in this thread
+            tries -= 1
+            if response.status_code in settings.PARSER_RETRY_HTTP_STATUS and tries:
+                logger.info("Failed to fetch url {}. Retrying ...".format(url))
+                # The worker goes on with other downloads meanwhile
+                self.schedule_retry(key, future, url, verb, headers, tries)
+            elif response.status_code in (requests.codes.ok, requests.codes.not_modified):
+                with self.lock:
+                    # Bodies of evicted downloads are not waiting to be used
+                    if verb == 'get' and response.status_code == requests.codes.ok and self.futures.get(key) is future:
+                        self.sizes[key] = len(response.content)
+                        self.pending_size += self.sizes[key]
+                future.set_result(response)
+            else:
+                logger.warning("Failed to fetch {} after {} times. Status code : {}.".format(
+                    url, settings.PARSER_NUMBER_OF_TRIES - tries, response.status_code))
+                future.set_exception(DownloadImportError(_("Failed to download {url}. HTTP status code {status_code}").format(
+                    url=response.url, status_code=response.status_code)))
+        except Exception as e:
+            future.set_exception(e)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            timers, self.timers = self.timers, set()
+        for timer in timers:
+            timer.cancel()
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        self.sizes.clear()
+        self.pending_size = 0
 
 
 class AttachmentParserMixin:
@@ -666,6 +1348,8 @@ class AttachmentParserMixin:
     base_url = ''
     delete_attachments = True
     filetype_name = "Photographie"
+    attachment_fetcher = None
+    attachment_validator_fields = ['import_url', 'import_etag', 'import_last_modified', 'import_hash', 'import_date']
     non_fields = {
         'attachments': _("Attachments"),
     }
@@ -683,6 +1367,147 @@ class AttachmentParserMixin:
                 raise GlobalImportError(_("FileType '{name}' does not exists in "
                                           "Geotrek-Admin. Please add it").format(name=self.filetype_name))
         self.creator, created = get_user_model().objects.get_or_create(username='import', defaults={'is_active': False})
+        self.attachment_fetcher = None
+        self.attachment_validators = {}
+        self.downloaded_attachments = {}
+        self.checked_attachments = []
+        if settings.PARSER_ATTACHMENT_WORKERS:
+            self.attachment_fetcher = AttachmentFetcher(settings.PARSER_ATTACHMENT_WORKERS,
+                                                        settings.PARSER_ATTACHMENT_WORKERS_BY_HOST)
+            # On first import, attachments of following rows will have to be downloaded
+            self.attachments_content_type = ContentType.objects.get_for_model(self.model)
+            self.attachments_imported = Attachment.objects.filter(content_type=self.attachments_content_type).exists()
+
+    def end(self):
+        super().end()
+        self.close_attachment_fetcher()
+
+    def parse(self, filename=None, limit=None):
+        try:
+            super().parse(filename, limit)
+        finally:
+            # Do not leave download threads behind if the import fails
+            self.close_attachment_fetcher()
+
+    def close_attachment_fetcher(self):
+        if self.attachment_fetcher is not None:
+            self.attachment_fetcher.close()
+            self.attachment_fetcher = None
+
+    def get_attachment_urls(self, src, val):
+        """Urls of attachments, without warnings (they are reported when attachments are saved)"""
+        warnings, self.warnings = self.warnings, {}
+        try:
+            return [self.base_url + attachment_data[0] for attachment_data in self.filter_attachments(src, val)]
+        except Exception:
+            return []
+        finally:
+            self.warnings = warnings
+
+    def prefetch_attachments(self, urls, verb, attachments=()):
+        """Request attachments before they are checked or downloaded.
+        verb is used for urls which were not imported in one of the given attachments.
+        """
+        imported = {attachment.import_url: attachment for attachment in attachments if attachment.import_url}
+        for url in urls:
+            if urlparse(url).scheme not in ('http', 'https'):
+                continue
+            attachment = imported.get(url)
+            if attachment is not None:
+                if not self.is_attachment_fresh(attachment):
+                    headers = self.get_conditional_headers(attachment)
+                    self.attachment_fetcher.prefetch(url, 'get' if headers else 'head', headers or None)
+            elif verb == 'head' or self.download_attachments:
+                self.attachment_fetcher.prefetch(url, verb)
+
+    def prefetch_rows(self, rows):
+        rows = super().prefetch_rows(rows)
+        if self.attachment_fetcher is None or 'attachments' not in self.non_fields:
+            yield from rows
+            return
+        verb = 'head' if self.attachments_imported else 'get'
+        src = self.normalize_src(self.non_fields['attachments'])
+        upcoming = deque()
+        for row in rows:
+            upcoming.append(row)
+            try:
+                val = self.get_val(row, 'attachments', src)
+            except ValueImportError:
+                val = None
+            urls = self.get_attachment_urls(src, val)
+            attachments = []
+            if self.attachments_imported:
+                attachments = Attachment.objects.filter(content_type=self.attachments_content_type, import_url__in=urls)
+            self.prefetch_attachments(urls, verb, attachments)
+            while upcoming and (len(upcoming) > settings.PARSER_ATTACHMENT_WORKERS
+                                or len(self.attachment_fetcher.futures) > self.attachment_fetcher.max_prefetch
+                                or self.attachment_fetcher.is_full()):
+                yield upcoming.popleft()
+        yield from upcoming
+
+    def request_attachment(self, url, verb='get', headers=None):
+        if self.attachment_fetcher is None:
+            if headers:
+                return self.request_or_retry(url, verb=verb, headers=headers)
+            return self.request_or_retry(url, verb=verb)
+        return self.attachment_fetcher.fetch(url, verb, headers)
+
+    def get_attachment_validators(self, url, response=None, content=None, attachment=None):
+        """Validators to store with the attachment, to check later if it changed"""
+        validators = {
+            'import_url': url,
+            'import_date': timezone.now(),
+        }
+        if attachment is not None:
+            validators['import_etag'] = attachment.import_etag
+            validators['import_last_modified'] = attachment.import_last_modified
+            validators['import_hash'] = attachment.import_hash
+        if response is not None:
+            for field, header in (('import_etag', 'ETag'), ('import_last_modified', 'Last-Modified')):
+                value = response.headers.get(header)
+                if isinstance(value, str) and len(value) <= Attachment._meta.get_field(field).max_length:
+                    validators[field] = value
+        if isinstance(content, bytes):
+            validators['import_hash'] = hashlib.sha1(content).hexdigest()
+        return validators
+
+    def get_conditional_headers(self, attachment):
+        headers = {}
+        if attachment.import_etag:
+            headers['If-None-Match'] = attachment.import_etag
+        if attachment.import_last_modified:
+            headers['If-Modified-Since'] = attachment.import_last_modified
+        return headers
+
+    def is_attachment_fresh(self, attachment):
+        """Checked recently enough to be considered unchanged"""
+        return (settings.PARSER_ATTACHMENT_FRESHNESS and attachment.import_date is not None
+                and timezone.now() - attachment.import_date < timedelta(seconds=settings.PARSER_ATTACHMENT_FRESHNESS))
+
+    def has_attachment_changed(self, url, attachment):
+        """Check with validators of previous download if possible, otherwise compare sizes"""
+        if attachment.import_url != url:
+            return self.has_size_changed(url, attachment)
+        if self.is_attachment_fresh(attachment):
+            self.attachment_validators = {}
+            return False
+        headers = self.get_conditional_headers(attachment)
+        if not headers or urlparse(url).scheme not in ('http', 'https'):
+            return self.has_size_changed(url, attachment)
+        try:
+            response = self.request_attachment(url, headers=headers)
+        except (requests.exceptions.ConnectionError, DownloadImportError) as e:
+            raise ValueImportError('Failed to load attachment: {exc}'.format(exc=e))
+        if response.status_code == requests.codes.not_modified:
+            self.attachment_validators = self.get_attachment_validators(url, response, attachment=attachment)
+            return False
+        content_hash = hashlib.sha1(response.content).hexdigest()
+        if content_hash == attachment.import_hash:
+            self.attachment_validators = self.get_attachment_validators(url, response, response.content)
+            return False
+        # Keep it, to not download it again
+        self.downloaded_attachments[url] = response
+        return True
 
     def filter_attachments(self, src, val):
         if not val:
@@ -698,13 +1523,15 @@ class AttachmentParserMixin:
             ftp.login(user=parsed_url.username, passwd=parsed_url.password)
             ftp.cwd(directory)
             size = ftp.size(parsed_url.path.split('/')[-1:][0])
+            self.attachment_validators = self.get_attachment_validators(url, attachment=attachment)
             return size != attachment.attachment_file.size
 
         if parsed_url.scheme == 'http' or parsed_url.scheme == 'https':
             try:
-                response = self.request_or_retry(url, verb='head')
+                response = self.request_attachment(url, verb='head')
             except (requests.exceptions.ConnectionError, DownloadImportError) as e:
                 raise ValueImportError('Failed to load attachment: {exc}'.format(exc=e))
+            self.attachment_validators = self.get_attachment_validators(url, response, attachment=attachment)
             size = response.headers.get('content-length')
             try:
                 return size is not None and int(size) != attachment.attachment_file.size
@@ -715,6 +1542,7 @@ class AttachmentParserMixin:
 
     def download_attachment(self, url):
         parsed_url = urlparse(url)
+        self.attachment_validators = {}
         if parsed_url.scheme == 'ftp':
             try:
                 response = self.request_or_retry(url)
@@ -724,12 +1552,13 @@ class AttachmentParserMixin:
         else:
             if self.download_attachments:
                 try:
-                    response = self.request_or_retry(url)
+                    response = self.downloaded_attachments.pop(url, None) or self.request_attachment(url)
                 except (DownloadImportError, requests.exceptions.ConnectionError) as e:
                     raise ValueImportError('Failed to load attachment: {exc}'.format(exc=e))
                 if response.status_code != requests.codes.ok:
                     self.add_warning(_("Failed to download '{url}'").format(url=url))
                     return None
+                self.attachment_validators = self.get_attachment_validators(url, response, response.content)
                 return response.content
             return None
 
@@ -739,9 +1568,13 @@ class AttachmentParserMixin:
             upload_name, ext = os.path.splitext(attachment_upload(attachment, kwargs.get('name')))
             existing_name = attachment.attachment_file.name
             regexp = f"{upload_name}({random_suffix_regexp()})?(_[a-zA-Z0-9]{{7}})?{ext}"
-            if re.search(r"^{regexp}$".format(regexp=regexp), existing_name) and not self.has_size_changed(kwargs.get('url'), attachment):
+            if re.search(r"^{regexp}$".format(regexp=regexp), existing_name) and not self.has_attachment_changed(kwargs.get('url'), attachment):
                 found = True
                 attachments_to_delete.remove(attachment)
+                if self.attachment_validators:
+                    for field, value in self.attachment_validators.items():
+                        setattr(attachment, field, value)
+                    self.checked_attachments.append(attachment)
                 if (
                         kwargs.get('author') != attachment.author
                         or kwargs.get('legend') != attachment.legend
@@ -801,6 +1634,8 @@ class AttachmentParserMixin:
                 pass
             attachment.attachment_file.save(name, f, save=False)
             attachment.is_image = attachment.is_an_image()
+            for field, value in self.attachment_validators.items():
+                setattr(attachment, field, value)
         else:
             attachment.attachment_link = url
         return True, updated
@@ -844,15 +1679,23 @@ class AttachmentParserMixin:
         return updated, attachments
 
     def save_attachments(self, src, val):
-        updated = False
-        attachments_to_delete = list(Attachment.objects.attachments_for_object(self.obj))
-        updated, attachments = self.generate_attachments(src, val, attachments_to_delete, updated)
-        Attachment.objects.bulk_create(attachments)
-        # TODO : attachments from parsers should be resized
-        #  See https://github.com/makinacorpus/django-paperclip/blob/master/paperclip/models.py#L124
-        # `bulk_create` does not call this `save` method
-        self.remove_attachments(attachments_to_delete)
-        return updated
+        with self.profiler.phase('attachments'):
+            updated = False
+            attachments_to_delete = list(Attachment.objects.attachments_for_object(self.obj))
+            if self.attachment_fetcher is not None:
+                # Existing attachments are checked, others are downloaded
+                self.prefetch_attachments(self.get_attachment_urls(src, val), 'head' if attachments_to_delete else 'get',
+                                          attachments_to_delete)
+            self.checked_attachments = []
+            self.downloaded_attachments = {}
+            updated, attachments = self.generate_attachments(src, val, attachments_to_delete, updated)
+            Attachment.objects.bulk_create(attachments)
+            Attachment.objects.bulk_update(self.checked_attachments, self.attachment_validator_fields)
+            # TODO : attachments from parsers should be resized
+            #  See https://github.com/makinacorpus/django-paperclip/blob/master/paperclip/models.py#L124
+            # `bulk_create` does not call this `save` method
+            self.remove_attachments(attachments_to_delete)
+            return updated
 
 
 class TourInSoftParser(AttachmentParserMixin, Parser):
@@ -1057,6 +1900,25 @@ class LEIParser(AttachmentParserMixin, XmlParser):
     results_path = 'Resultat/sit_liste'
     eid = 'eid'
 
+    def next_row(self):
+        """Nomenclature being after results in LEI documents, read the document twice:
+        first to get the nomenclature, then to import results.
+        Downloaded document is stored in a temporary file meanwhile.
+        """
+        with tempfile.TemporaryFile() as tmp:
+            f = self.open_xml()[0]
+            with f:
+                shutil.copyfileobj(f, tmp)
+            tmp.seek(0)
+            stream = XmlStream(tmp, self.results_path, self.ns)
+            for row in stream:
+                pass
+            root, self.nb = stream.root, stream.count
+            tmp.seek(0)
+            for row in XmlStream(tmp, self.results_path, self.ns):
+                self.root = root
+                yield row
+
     def get_part(self, dst, src, val):
         """For generic CRITERES return XML Crit element"""
         if 'CRITERES/Crit' in src:
@@ -1081,10 +1943,11 @@ class LEIParser(AttachmentParserMixin, XmlParser):
             f'NOMENCLATURE/CRIT[@CLEF="{crit.attrib["CLEF_CRITERE"]}"]/MODAL[@CLEF="{crit.attrib["CLEF_MODA"]}"]'
         )
 
-    def start(self):
-        super().start()
-        lei = set(self.model.objects.filter(eid__startswith='LEI').values_list('pk', flat=True))
-        self.to_delete = self.to_delete & lei
+    def get_to_delete_queryset(self):
+        queryset = super().get_to_delete_queryset()
+        if queryset is None:
+            return None
+        return queryset.filter(eid__startswith='LEI')
 
     def filter_eid(self, src, val):
         return 'LEI' + val
@@ -1180,10 +2043,16 @@ class GeotrekAggregatorParser:
         self.progress_cb = progress_cb
         self.warnings = {}
         self.report_by_api_v2_by_type = {}
+        self.lock = threading.RLock()
 
     def add_warning(self, key, msg):
-        warnings = self.warnings.setdefault(key, [])
-        warnings.append(msg)
+        with self.lock:
+            warnings = self.warnings.setdefault(key, [])
+            warnings.append(msg)
+
+    def synchronized_progress_cb(self, *args):
+        with self.lock:
+            self.progress_cb(*args)
 
     def run_method_parser(self, key_name, parsers, method_name):
         for parser in parsers:
@@ -1195,7 +2064,7 @@ class GeotrekAggregatorParser:
                 'nb_success': parser.nb_success,
                 'nb_created': parser.nb_created,
                 'nb_updated': parser.nb_updated,
-                'nb_deleted': len(parser.to_delete),
+                'nb_deleted': parser.nb_deleted,
                 'nb_unmodified': parser.nb_unmodified,
                 'warnings': parser.warnings
             }
@@ -1207,37 +2076,47 @@ class GeotrekAggregatorParser:
         with open(filename, mode='r') as f:
             json_aggregator = json.load(f)
 
-        for key, datas in json_aggregator.items():
+        for key in json_aggregator.keys():
+            # Keep order of sources in report
             self.report_by_api_v2_by_type[key] = {}
-            models_to_import = datas.get('data_to_import')
-            if not models_to_import:
-                models_to_import = self.mapping_model_parser.keys()
-            parsers_to_parse = []
-            for model in models_to_import:
-                if settings.TREKKING_TOPOLOGY_ENABLED:
-                    if model in self.invalid_model_topology:
-                        warning = f"{model}s can't be imported with dynamic segmentation"
-                        logger.warning(warning)
-                        key_warning = _(f"Model {model}")
-                        self.add_warning(key_warning, warning)
-                        self.report_by_api_v2_by_type[key][model] = {
-                            'nb_lines': 0,
-                            'nb_success': 0,
-                            'nb_created': 0,
-                            'nb_updated': 0,
-                            'nb_deleted': None,
-                            'nb_unmodified': 0,
-                            'warnings': self.warnings
-                        }
-                        continue
-                module_name, class_name = self.mapping_model_parser[model]
-                module = importlib.import_module(module_name)
-                parser = getattr(module, class_name)
-                if 'url' not in datas:
-                    warning = f"{key} has no url"
-                    key_warning = _("Geotrek-admin")
+        workers = min(settings.PARSER_AGGREGATOR_WORKERS, len(json_aggregator))
+        if workers <= 1:
+            for key, datas in json_aggregator.items():
+                self.parse_source(key, datas)
+            return
+        progress_cb = self.progress_cb
+        if progress_cb is not None:
+            self.progress_cb = self.synchronized_progress_cb
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.parse_source_in_thread, key, datas)
+                           for key, datas in json_aggregator.items()]
+                for future in futures:
+                    future.result()
+        finally:
+            self.progress_cb = progress_cb
+
+    def parse_source_in_thread(self, key, datas):
+        try:
+            self.parse_source(key, datas)
+        finally:
+            # Each thread has its own database connection
+            connection.close()
+
+    def parse_source(self, key, datas):
+        """Import models of a source one after another"""
+        models_to_import = datas.get('data_to_import')
+        if not models_to_import:
+            models_to_import = self.mapping_model_parser.keys()
+        parsers_to_parse = []
+        for model in models_to_import:
+            if settings.TREKKING_TOPOLOGY_ENABLED:
+                if model in self.invalid_model_topology:
+                    warning = f"{model}s can't be imported with dynamic segmentation"
+                    logger.warning(warning)
+                    key_warning = _(f"Model {model}")
                     self.add_warning(key_warning, warning)
-                    self.report_by_api_v2_by_type[key][str(parser.model._meta.model_name).capitalize()] = {
+                    self.report_by_api_v2_by_type[key][model] = {
                         'nb_lines': 0,
                         'nb_success': 0,
                         'nb_created': 0,
@@ -1246,15 +2125,32 @@ class GeotrekAggregatorParser:
                         'nb_unmodified': 0,
                         'warnings': self.warnings
                     }
-                else:
-                    Parser = parser(progress_cb=self.progress_cb, provider=key, url=datas['url'],
-                                    portals_filter=datas.get('portals'), mapping=datas.get('mapping'),
-                                    create_categories=datas.get('create'), all_datas=datas.get('all_datas'))
-                    parsers_to_parse.append(Parser)
+                    continue
+            module_name, class_name = self.mapping_model_parser[model]
+            module = importlib.import_module(module_name)
+            parser = getattr(module, class_name)
+            if 'url' not in datas:
+                warning = f"{key} has no url"
+                key_warning = _("Geotrek-admin")
+                self.add_warning(key_warning, warning)
+                self.report_by_api_v2_by_type[key][str(parser.model._meta.model_name).capitalize()] = {
+                    'nb_lines': 0,
+                    'nb_success': 0,
+                    'nb_created': 0,
+                    'nb_updated': 0,
+                    'nb_deleted': None,
+                    'nb_unmodified': 0,
+                    'warnings': self.warnings
+                }
+            else:
+                Parser = parser(progress_cb=self.progress_cb, provider=key, url=datas['url'],
+                                portals_filter=datas.get('portals'), mapping=datas.get('mapping'),
+                                create_categories=datas.get('create'), all_datas=datas.get('all_datas'))
+                parsers_to_parse.append(Parser)
 
-            self.run_method_parser(key, parsers_to_parse, 'start_meta')
-            self.run_method_parser(key, parsers_to_parse, 'parse')
-            self.run_method_parser(key, parsers_to_parse, 'end_meta')
+        self.run_method_parser(key, parsers_to_parse, 'start_meta')
+        self.run_method_parser(key, parsers_to_parse, 'parse')
+        self.run_method_parser(key, parsers_to_parse, 'end_meta')
 
     def report(self, output_format='txt'):
         context = {'report': self.report_by_api_v2_by_type}
@@ -1322,6 +2218,9 @@ class GeotrekParser(AttachmentParserMixin, Parser):
         for key, value in self.m2m_replace_fields.items():
             self.m2m_fields[key] = value
         self.translated_fields = [field for field in get_translated_fields(self.model)]
+        self.reverse_mapping = {}
+        # Mappings of this source must not be shared with other instances, which may parse at the same time
+        self.field_options = copy.deepcopy(self.field_options)
         # Generate a mapping dictionnary between id and the related label
         for category, route in self.url_categories.items():
             if self.categories_keys_api_v2.get(category):
@@ -1346,10 +2245,25 @@ class GeotrekParser(AttachmentParserMixin, Parser):
         self.creator, created = get_user_model().objects.get_or_create(username='import', defaults={'is_active': False})
 
     def replace_mapping(self, label, route):
-        for key, list_map in self.mapping.get(route, {}).items():
+        if route not in self.reverse_mapping:
+            # Labels of list mappings of this route, to the position and final value of their first
+            # mapping, and string mappings, which match labels they contain
+            labels, strings = {}, []
+            for position, (key, list_map) in enumerate(self.mapping.get(route, {}).items()):
+                if isinstance(list_map, str):
+                    strings.append((position, list_map, key))
+                else:
+                    for mapped_label in list_map:
+                        labels.setdefault(mapped_label, (position, key))
+            self.reverse_mapping[route] = labels, strings
+        labels, strings = self.reverse_mapping[route]
+        found = labels.get(label)
+        for position, list_map, key in strings:
+            if found is not None and found[0] < position:
+                break
             if label in list_map:
                 return key
-        return label
+        return found[1] if found is not None else label
 
     def generate_attachments(self, src, val, attachments_to_delete, updated):
         attachments = []
@@ -1357,7 +2271,7 @@ class GeotrekParser(AttachmentParserMixin, Parser):
             url = self.base_url + url
             legend = legend or ""
             author = author or ""
-            license = License.objects.get_or_create(label=license)[0] if license else None
+            license = self.lookups.get_or_create(License, label=license)[0] if license else None
             basename, ext = os.path.splitext(os.path.basename(url))
             name = '%s%s' % (basename[:128], ext)
             found, updated = self.check_attachment_updated(attachments_to_delete, updated, name=name, url=url,
@@ -1384,9 +2298,10 @@ class GeotrekParser(AttachmentParserMixin, Parser):
         attachment.license = kwargs.get('license')
         return attachment
 
-    def start(self):
-        super().start()
-        kwargs = self.get_to_delete_kwargs()
+    def get_to_delete_queryset(self):
+        queryset = super().get_to_delete_queryset()
+        if queryset is None:
+            return None
         json_id_key = self.replace_fields.get('eid', 'id')
         params = {
             'fields': json_id_key,
@@ -1394,13 +2309,13 @@ class GeotrekParser(AttachmentParserMixin, Parser):
         }
         response = self.request_or_retry(self.next_url, params=params)
         ids = [f"{element[json_id_key]}" for element in response.json().get('results', [])]
-        self.to_delete = set(self.model.objects.filter(**kwargs).exclude(eid__in=ids).values_list('pk', flat=True))
+        return self.exclude_values(queryset, 'eid', ids)
 
     def filter_attachments(self, src, val):
         return [(subval.get('url'), subval.get('legend'), subval.get('author'), subval.get('license')) for subval in val]
 
     def start_meta(self):
-        self.to_delete = set()
+        self.to_delete_table = None
 
     def end_meta(self):
         pass
@@ -1454,17 +2369,7 @@ class GeotrekParser(AttachmentParserMixin, Parser):
             'updated_after': updated_after
         }
         self.params_used = params
-        response = self.request_or_retry(self.next_url, params=params)
-        self.root = response.json()
-        self.nb = int(self.root['count'])
-
-        for row in self.items:
-            yield row
-        self.next_url = self.root['next']
-
-        while self.next_url:
-            response = self.request_or_retry(self.next_url)
-            self.root = response.json()
+        for self.root in self.fetch_pages(self.get_pages(self.next_url, params)):
             self.nb = int(self.root['count'])
 
             for row in self.items:
@@ -1472,6 +2377,15 @@ class GeotrekParser(AttachmentParserMixin, Parser):
 
             self.next_url = self.root['next']
 
+    def get_pages(self, url, params):
+        response = self.request_or_retry(url, params=params)
+        root = response.json()
+        yield root
+        while root['next']:
+            response = self.request_or_retry(root['next'])
+            root = response.json()
+            yield root
+
 
 class ApidaeBaseParser(Parser):
     """Parser to import "anything" from APIDAE"""
@@ -1493,24 +2407,29 @@ class ApidaeBaseParser(Parser):
         return self.root['objetsTouristiques']
 
     def next_row(self):
+        for self.root in self.fetch_pages(self.get_pages(self.skip)):
+            self.nb = int(self.root['numFound'])
+            for row in self.items:
+                yield row
+            self.skip += self.size
+
+    def get_pages(self, skip):
         while True:
             params = {
                 'apiKey': self.api_key,
                 'projetId': self.project_id,
                 'selectionIds': [self.selection_id],
                 'count': self.size,
-                'first': self.skip,
+                'first': skip,
                 'responseFields': self.responseFields
             }
             if self.locales:
                 params['locales'] = self.locales
             response = self.request_or_retry(self.url, params={'query': json.dumps(params)})
-            self.root = response.json()
-            self.nb = int(self.root['numFound'])
-            for row in self.items:
-                yield row
-            self.skip += self.size
-            if self.skip >= self.nb:
+            root = response.json()
+            yield root
+            skip += self.size
+            if skip >= int(root['numFound']):
                 return
 
     def normalize_field_name(self, name):
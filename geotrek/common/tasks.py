@@ -4,9 +4,12 @@ import os
 from os.path import join
 import sys
 from celery import Task, shared_task, current_task
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
 from django.core.management import call_command
 from django.conf import settings
+from django.test.client import RequestFactory
+from django.urls import resolve
+from django.utils import translation
 from django.utils.translation import gettext_lazy as _
 
 
@@ -83,6 +86,7 @@ def import_datas(**kwargs):
         'filename': filename.split('/').pop(-1),
         'parser': class_name,
         'report': parser.report(output_format='html').replace('$celery_id', current_task.request.id),
+        'profile': parser.profiler.as_dict(),
         'name': current_task.name
     }
 
@@ -123,6 +127,7 @@ def import_datas_from_web(**kwargs):
         'filename': _("Import from web."),
         'parser': class_name,
         'report': parser.report(output_format='html').replace('$celery_id', current_task.request.id),
+        'profile': parser.profiler.as_dict(),
         'name': current_task.name
     }
 
@@ -175,3 +180,28 @@ def launch_sync_rando(*args, **kwargs):
     return {
         'name': current_task.name,
     }
+
+
+@shared_task(name='geotrek.common.refresh-public-pdf')
+def refresh_public_pdf(path, query_string, lang, host, secure):
+    """
+    celery shared task - render again an outdated public PDF and store it in cache
+    """
+    match = resolve(path)
+    if query_string:
+        path = '{}?{}'.format(path, query_string)
+    request = RequestFactory().get(path, HTTP_HOST=host, secure=secure)
+    request.LANGUAGE_CODE = lang
+    request.user = AnonymousUser()
+    request.refresh_public_pdf = True
+    translation.activate(lang)
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    finally:
+        translation.deactivate()
+    return {
+        'path': path,
+        'status_code': response.status_code,
+    }
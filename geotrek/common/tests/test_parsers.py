@@ -1,30 +1,38 @@
+import hashlib
 import json
 import os
+import threading
 import urllib
-from io import StringIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
 from shutil import rmtree
 from tempfile import mkdtemp
 from unittest import mock, skipIf
 
 import requests
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
 from django.core.management import call_command
 from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models.signals import post_save
 from django.db.utils import DatabaseError
 from django.template.exceptions import TemplateDoesNotExist
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.test.utils import override_settings
 from requests import Response
 
+from geotrek.authent.models import default_structure
 from geotrek.authent.tests.factories import StructureFactory
 from geotrek.common.models import Attachment, FileType, Organism, Theme
-from geotrek.common.parsers import (AttachmentParserMixin, DownloadImportError,
+from geotrek.common.parsers import (AttachmentFetcher, AttachmentParserMixin,
+                                    DownloadImportError,
                                     ExcelParser, GeotrekAggregatorParser,
-                                    GeotrekParser, OpenSystemParser,
+                                    GeotrekParser, LookupCache, OpenSystemParser,
                                     TourInSoftParser, TourismSystemParser,
                                     ValueImportError, XmlParser)
-from geotrek.common.tests.factories import ThemeFactory
+from geotrek.common.tests.factories import OrganismFactory, ThemeFactory
 from geotrek.common.tests.mixins import GeotrekParserTestMixin
 from geotrek.common.utils.testdata import get_dummy_img
 from geotrek.trekking.models import POI, Trek
@@ -43,6 +51,26 @@ class OrganismEidParser(ExcelParser):
     eid = 'organism'
 
 
+class OrganismEidBatchParser(OrganismEidParser):
+    batch_size = 10
+
+
+class OrganismEidKwargsBatchParser(OrganismEidBatchParser):
+    def get_eid_kwargs(self, row):
+        eid_kwargs = super().get_eid_kwargs(row)
+        eid_kwargs['structure'] = self.structure
+        return eid_kwargs
+
+
+class OrganismDeleteParser(OrganismEidParser):
+    delete = True
+    delete_batch_size = 1
+
+
+class OrganismEidChunkParser(OrganismEidParser):
+    chunk_size = 10
+
+
 class StructureExcelParser(ExcelParser):
     model = Organism
     fields = {
@@ -146,11 +174,123 @@ class ParserTests(TestCase):
         self.assertEqual(organisms[0].organism, "2.0")
         self.assertEqual(organisms[1].organism, "Comité Hippolyte")
 
+    def test_delete_stale_objects(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.OrganismEidParser', filename, verbosity=0)
+        kept = Organism.objects.get()
+        OrganismFactory.create_batch(3)
+        parser = OrganismDeleteParser()
+        parser.parse(filename)
+        self.assertEqual(parser.nb_deleted, 3)
+        self.assertEqual(list(Organism.objects.values_list('pk', flat=True)), [kept.pk])
+        # Staging tables are dropped at the end of the import
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_class WHERE relname LIKE 'parser\\_%%' AND relpersistence = 't'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_batch_with_eid(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        filename2 = os.path.join(os.path.dirname(__file__), 'data', 'organism2.xls')
+        parser = OrganismEidBatchParser()
+        parser.parse(filename)
+        self.assertEqual((parser.nb_created, parser.nb_updated, parser.nb_unmodified), (1, 0, 0))
+        parser = OrganismEidBatchParser()
+        parser.parse(filename)
+        self.assertEqual((parser.nb_created, parser.nb_updated, parser.nb_unmodified), (0, 0, 1))
+        self.assertEqual(Organism.objects.count(), 1)
+        call_command('import', 'geotrek.common.tests.test_parsers.OrganismEidBatchParser', filename2, verbosity=0)
+        self.assertEqual(Organism.objects.count(), 2)
+        organisms = Organism.objects.order_by('pk')
+        self.assertEqual(organisms[0].organism, "2.0")
+        self.assertEqual(organisms[1].organism, "Comité Hippolyte")
+
+    @mock.patch('geotrek.common.models.Organism.objects.bulk_create')
+    def test_batch_databaseerror_fallback(self, mocked):
+        mocked.side_effect = DatabaseError('foo bar')
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        parser = OrganismEidBatchParser()
+        parser.parse(filename)
+        self.assertEqual(parser.nb_created, 1)
+        self.assertEqual(Organism.objects.count(), 1)
+
+    def test_batch_with_eid_kwargs(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        parser = OrganismEidKwargsBatchParser()
+        parser.parse(filename)
+        parser = OrganismEidKwargsBatchParser()
+        parser.parse(filename)
+        self.assertEqual((parser.nb_created, parser.nb_updated, parser.nb_unmodified), (0, 0, 1))
+        self.assertEqual(Organism.objects.count(), 1)
+
+    @mock.patch('geotrek.common.models.Organism.objects.bulk_create')
+    def test_batch_disabled_with_signals(self, mocked):
+        receiver = mock.Mock()
+        post_save.connect(receiver, sender=Organism)
+        self.addCleanup(post_save.disconnect, receiver, sender=Organism)
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        parser = OrganismEidBatchParser()
+        parser.parse(filename)
+        self.assertIsNone(parser.batch_size)
+        mocked.assert_not_called()
+        self.assertEqual(receiver.call_count, 1)
+
+    def test_batch_review_emails(self):
+        parser = OrganismEidBatchParser()
+        objects = [mock.Mock(review=True), mock.Mock(review=True), mock.Mock(review=False)]
+        parser.send_review_emails([
+            {'obj': objects[0], 'operation': "updated", 'update_fields': ['name', 'review']},
+            {'obj': objects[1], 'operation': "created", 'update_fields': ['review']},
+            {'obj': objects[2], 'operation': "updated", 'update_fields': ['review']},
+        ])
+        objects[0].send_review_email.assert_called_once_with()
+        objects[1].send_review_email.assert_not_called()
+        objects[2].send_review_email.assert_not_called()
+
+    def test_chunk(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism2.xls')
+        parser = OrganismEidChunkParser()
+        with mock.patch.object(parser, 'end_chunk') as mocked:
+            parser.parse(filename)
+        mocked.assert_called_once_with()
+        self.assertEqual(parser.nb_created, Organism.objects.count())
+        self.assertEqual(parser.warnings, {})
+
+    def test_chunk_databaseerror_fallback(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism2.xls')
+        parser = OrganismEidChunkParser()
+        errors = [DatabaseError('foo bar')]
+
+        def end_chunk():
+            if errors:
+                raise errors.pop()
+
+        with mock.patch.object(parser, 'end_chunk', side_effect=end_chunk):
+            parser.parse(filename)
+        # Rows of the rollbacked chunk are imported again one by one
+        self.assertEqual(parser.nb_created, Organism.objects.count())
+        self.assertEqual(parser.line, Organism.objects.count())
+        self.assertEqual(parser.warnings, {})
+
     def test_report_format_text(self):
         parser = OrganismParser()
         self.assertRegex(parser.report(), '0/0 lines imported.')
         self.assertNotRegex(parser.report(), r'<div id=\"collapse-\$celery_id\" class=\"collapse\">')
 
+    def test_report_profile(self):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        parser = OrganismEidParser()
+        parser.parse(filename)
+        profile = parser.profiler.as_dict()
+        phases = {phase['name']: phase for phase in profile['phases']}
+        self.assertEqual(phases['save']['count'], 1)
+        self.assertGreaterEqual(phases['save']['queries'], 1)
+        self.assertGreaterEqual(phases['lookups']['queries'], 1)
+        self.assertEqual(phases['fetch']['queries'], 0)
+        self.assertGreaterEqual(profile['queries'], sum(phase['queries'] for phase in profile['phases']))
+        self.assertEqual(len(profile['slowest_rows']), 1)
+        self.assertRegex(parser.report(), 'save: .*s, [0-9]+ queries')
+        self.assertIn('<div class="profile">', parser.report(output_format='html'))
+
     def test_report_format_html(self):
         parser = OrganismParser()
         self.assertRegex(parser.report(output_format='html'),
@@ -188,6 +328,52 @@ class ParserTests(TestCase):
         self.assertIn("Bad value 'Structure' for field STRUCTURE. Should contain ['foo']", output.getvalue())
 
 
+class LookupCacheTests(TestCase):
+    def test_get_cached(self):
+        theme = ThemeFactory.create(label='Foo')
+        lookups = LookupCache()
+        with self.assertNumQueries(1):
+            self.assertEqual(lookups.get(Theme, label='Foo'), theme)
+            self.assertEqual(lookups.get(Theme, label='Foo'), theme)
+
+    def test_missing_cached(self):
+        lookups = LookupCache()
+        with self.assertNumQueries(1):
+            for i in range(2):
+                with self.assertRaises(Theme.DoesNotExist):
+                    lookups.get(Theme, label='Foo')
+
+    def test_created_reused(self):
+        lookups = LookupCache()
+        with self.assertRaises(Theme.DoesNotExist):
+            lookups.get(Theme, label='Foo')
+        theme, created = lookups.get_or_create(Theme, label='Foo')
+        self.assertTrue(created)
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.get_or_create(Theme, label='Foo'), (theme, False))
+            self.assertEqual(lookups.get(Theme, label='Foo'), theme)
+
+
+class LookupCacheThreadsTests(TransactionTestCase):
+    def test_created_once_by_threads(self):
+        # Like parsers of the sources of GeotrekAggregatorParser, each thread has its own lookups
+        barrier = threading.Barrier(4)
+
+        def get_or_create():
+            try:
+                barrier.wait()
+                LookupCache().get_or_create(Theme, label='Foo')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=get_or_create) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Theme.objects.filter(label='Foo').count(), 1)
+
+
 class ThemeParser(ExcelParser):
     """Parser used in MultilangParserTests, using Theme because it has a translated field"""
     model = Theme
@@ -279,6 +465,134 @@ class AttachmentParserTests(TestCase):
         self.assertTrue(attachment.is_image)
         self.assertTrue(os.path.exists(attachment.attachment_file.path), True)
 
+    @override_settings(PARSER_ATTACHMENT_WORKERS=2)
+    @mock.patch('requests.Session.get')
+    def test_attachment_concurrent(self, mocked):
+        mocked.return_value.status_code = 200
+        mocked.return_value.content = get_dummy_img()
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        organism = Organism.objects.get()
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.content_object, organism)
+        self.assertEqual(attachment.attachment_file.name, 'paperclip/common_organism/{pk}/titi.png'.format(pk=organism.pk))
+        self.assertTrue(attachment.is_image)
+        self.assertEqual(mocked.call_count, 1)
+
+    @override_settings(PARSER_ATTACHMENT_WORKERS=2)
+    @mock.patch('requests.Session.get')
+    @mock.patch('requests.Session.head')
+    def test_attachment_concurrent_not_updated(self, mocked_head, mocked_get):
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.content = b''
+        mocked_head.return_value.status_code = 200
+        mocked_head.return_value.headers = {'content-length': 0}
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        self.assertEqual(mocked_get.call_count, 1)
+        self.assertEqual(mocked_head.call_count, 1)
+        self.assertEqual(Attachment.objects.count(), 1)
+
+    @override_settings(PARSER_ATTACHMENT_WORKERS=2, PARSER_RETRY_SLEEP_TIME=0)
+    @mock.patch('requests.Session.get')
+    def test_attachment_concurrent_retry(self, mocked):
+        response_503 = mock.Mock(status_code=503)
+        response_200 = mock.Mock(status_code=200, content=get_dummy_img())
+        mocked.side_effect = [response_503, response_200]
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        self.assertEqual(mocked.call_count, 2)
+        self.assertEqual(Attachment.objects.count(), 1)
+
+    @override_settings(PARSER_ATTACHMENT_WORKERS=2)
+    @mock.patch('geotrek.common.parsers.AttachmentFetcher.close', autospec=True, side_effect=AttachmentFetcher.close)
+    @mock.patch('geotrek.common.parsers.Parser.parse_row', side_effect=Exception('Parse error'))
+    def test_attachment_fetcher_closed_on_error(self, mocked_parse_row, mocked_close):
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        with self.assertRaisesRegex(Exception, 'Parse error'):
+            AttachmentParser().parse(filename)
+        mocked_close.assert_called_once()
+
+    @override_settings(PARSER_RETRY_SLEEP_TIME=0)
+    @mock.patch('requests.Session.get')
+    def test_attachment_fetcher_pending_size(self, mocked):
+        mocked.return_value.status_code = 200
+        mocked.return_value.content = b'1234'
+        fetcher = AttachmentFetcher(1, 1)
+        self.addCleanup(fetcher.close)
+        fetcher.max_pending_size = 6
+        fetcher.prefetch('http://foo.fr/1.png')
+        fetcher.prefetch('http://foo.fr/2.png')
+        for future in list(fetcher.futures.values()):
+            future.result()
+        self.assertEqual(fetcher.pending_size, 8)
+        self.assertTrue(fetcher.is_full())
+        fetcher.fetch('http://foo.fr/1.png')
+        self.assertEqual(fetcher.pending_size, 4)
+        self.assertFalse(fetcher.is_full())
+
+    @override_settings(PARSER_RETRY_SLEEP_TIME=0.2)
+    @mock.patch('requests.Session.get')
+    def test_attachment_fetcher_retry_does_not_block_worker(self, mocked):
+        response_503 = mock.Mock(status_code=503)
+        response_200 = mock.Mock(status_code=200, content=b'1234')
+        mocked.side_effect = lambda url, **kwargs: response_503 if url.endswith('1.png') and mocked.call_count == 1 else response_200
+        fetcher = AttachmentFetcher(1, 1)
+        self.addCleanup(fetcher.close)
+        fetcher.prefetch('http://foo.fr/1.png')
+        # The only worker downloads the second attachment while the first one waits for its retry
+        self.assertEqual(fetcher.fetch('http://foo.fr/2.png'), response_200)
+        self.assertFalse(fetcher.futures[('get', 'http://foo.fr/1.png', ())].done())
+        self.assertEqual(fetcher.fetch('http://foo.fr/1.png'), response_200)
+        self.assertEqual(mocked.call_count, 3)
+
+    @mock.patch('requests.get')
+    def test_attachment_validators(self, mocked):
+        mocked.return_value.status_code = 200
+        mocked.return_value.content = get_dummy_img()
+        mocked.return_value.headers = {'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.import_url, mocked.call_args[0][0])
+        self.assertEqual(attachment.import_etag, '"abc"')
+        self.assertEqual(attachment.import_last_modified, 'Wed, 21 Oct 2015 07:28:00 GMT')
+        self.assertEqual(attachment.import_hash, hashlib.sha1(get_dummy_img()).hexdigest())
+        self.assertIsNotNone(attachment.import_date)
+
+    @mock.patch('requests.get')
+    @mock.patch('requests.head')
+    def test_attachment_not_modified(self, mocked_head, mocked_get):
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.content = get_dummy_img()
+        mocked_get.return_value.headers = {'ETag': '"abc"'}
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        mocked_get.reset_mock()
+        mocked_get.return_value.status_code = 304
+        mocked_get.return_value.content = b''
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        self.assertEqual(mocked_get.call_count, 1)
+        self.assertEqual(mocked_get.call_args[1]['headers'], {'If-None-Match': '"abc"'})
+        mocked_head.assert_not_called()
+        self.assertEqual(Attachment.objects.count(), 1)
+        self.assertEqual(Attachment.objects.get().import_hash, hashlib.sha1(get_dummy_img()).hexdigest())
+
+    @override_settings(PARSER_ATTACHMENT_FRESHNESS=3600)
+    @mock.patch('requests.get')
+    @mock.patch('requests.head')
+    def test_attachment_fresh(self, mocked_head, mocked_get):
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.content = get_dummy_img()
+        mocked_get.return_value.headers = {'ETag': '"abc"'}
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'organism.xls')
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        call_command('import', 'geotrek.common.tests.test_parsers.AttachmentParser', filename, verbosity=0)
+        self.assertEqual(mocked_get.call_count, 1)
+        mocked_head.assert_not_called()
+        self.assertEqual(Attachment.objects.count(), 1)
+
     @mock.patch('requests.get')
     def test_attachment_connection_error(self, mocked):
         mocked.return_value.status_code = 200
@@ -551,6 +865,41 @@ class XMLParserTests(TestCase):
         self.assertEqual(Organism.objects.count(), 1)
         self.assertEqual(Organism.objects.get().organism, 'Organism a')
 
+    @mock.patch('requests.get')
+    def test_xml_stream_url(self, mocked):
+        class TestXmlParser(XmlParser):
+            results_path = 'Result/el'
+            model = Organism
+            url = 'http://test.com/organisms.xml'
+            fields = {'organism': 'ORGANISM'}
+
+        content = b'<Test><Result>' + b''.join(
+            b'<el><ORGANISM>Organism %d</ORGANISM></el>' % i for i in range(3)
+        ) + b'</Result></Test>'
+        mocked.return_value = Response()
+        mocked.return_value.status_code = 200
+        mocked.return_value.raw = BytesIO(content)
+        mocked.return_value.headers['Content-Length'] = str(len(content))
+        progress = []
+        parser = TestXmlParser(progress_cb=lambda ratio, line, eid: progress.append(ratio))
+        parser.parse()
+        self.assertEqual(mocked.call_args[1]['stream'], True)
+        self.assertEqual(sorted(Organism.objects.values_list('organism', flat=True)),
+                         ['Organism 0', 'Organism 1', 'Organism 2'])
+        self.assertEqual(parser.nb, 3)
+        self.assertEqual(len(progress), 3)
+
+    def test_xml_not_streamable_path(self):
+        class TestXmlParser(XmlParser):
+            results_path = './/el'
+            model = Organism
+            filename = os.path.join(os.path.dirname(__file__), 'data', 'test.xml')
+            fields = {'organism': 'ORGANISM'}
+
+        parser = TestXmlParser()
+        parser.parse()
+        self.assertEqual(Organism.objects.get().organism, 'Organism a')
+
 
 class TourInSoftParserTests(TestCase):
 
@@ -659,10 +1008,87 @@ class GeotrekTrekTestNoProviderParser(GeotrekTrekParser):
     url_categories = {}
 
 
+class GeotrekTrekTestSoftDeleteParser(GeotrekTrekTestProviderParser):
+    soft_delete = True
+    delete_batch_size = 1
+
+
+class OrganismSoftDeleteParser(OrganismEidParser):
+    delete = True
+    soft_delete = True
+
+
 class GeotrekAggregatorTestParser(GeotrekAggregatorParser):
     pass
 
 
+class GeotrekTrekLocalParser(GeotrekParser):
+    model = Trek
+    url_categories = {}
+
+
+class PagesHandler(BaseHTTPRequestHandler):
+    """Serve 3 pages of a Geotrek API, page 2 being unavailable at first request"""
+    def do_GET(self):
+        page = int(self.path.split('/')[-1].split('?')[0])
+        self.server.requested.append(page)
+        if page == 2 and self.server.requested.count(2) == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+        next_url = 'http://{}:{}/page/{}'.format(*self.server.server_address, page + 1) if page < 3 else None
+        body = json.dumps({'count': 3, 'next': next_url, 'results': [{'id': page}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if page > 1:
+            self.server.fetched.set()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(PARSER_RETRY_SLEEP_TIME=0)
+class PageFetcherTests(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), PagesHandler)
+        self.server.requested = []
+        self.server.fetched = threading.Event()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.parser = GeotrekTrekLocalParser(url='http://{}:{}'.format(*self.server.server_address))
+        self.parser.next_url = '{}/page/1'.format(self.parser.url)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @override_settings(PARSER_PREFETCH_PAGES=2)
+    def test_prefetch(self):
+        rows = self.parser.next_row()
+        self.assertEqual(next(rows), {'id': 1})
+        # Next page is fetched while the first one is still being imported
+        self.assertTrue(self.server.fetched.wait(5))
+        self.assertEqual(list(rows), [{'id': 2}, {'id': 3}])
+        self.assertEqual(self.server.requested, [1, 2, 2, 3])
+        self.assertIsNone(self.parser.next_url)
+
+    def test_no_prefetch(self):
+        rows = self.parser.next_row()
+        self.assertEqual(next(rows), {'id': 1})
+        self.assertEqual(self.server.requested, [1])
+        self.assertEqual(list(rows), [{'id': 2}, {'id': 3}])
+        self.assertEqual(self.server.requested, [1, 2, 2, 3])
+
+    @override_settings(PARSER_PREFETCH_PAGES=2, PARSER_NUMBER_OF_TRIES=1)
+    def test_prefetch_error(self):
+        rows = self.parser.next_row()
+        self.assertEqual(next(rows), {'id': 1})
+        with self.assertRaises(DownloadImportError):
+            next(rows)
+
+
 class GeotrekParserTest(TestCase):
     def setUp(self, *args, **kwargs):
         self.filetype = FileType.objects.create(type="Photographie")
@@ -713,6 +1139,44 @@ class GeotrekParserTest(TestCase):
         call_command('import', 'geotrek.common.tests.test_parsers.GeotrekTrekTestNoProviderParser', verbosity=0)
         self.assertEqual([t.pk], list(Trek.objects.values_list('pk', flat=True)))
 
+    @mock.patch('requests.get')
+    def test_soft_delete(self, mocked_get):
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.json = self.mock_json
+        stale1 = TrekFactory(provider="Provider1", name="I should be marked as deleted", eid="1234")
+        stale2 = TrekFactory(provider="Provider1", name="I should be marked as deleted", eid="1235")
+        other = TrekFactory(provider="Provider2", name="I should not be deleted", eid="1236")
+        call_command('import', 'geotrek.common.tests.test_parsers.GeotrekTrekTestSoftDeleteParser', verbosity=0)
+        self.assertEqual(Trek.objects.count(), 4)
+        self.assertEqual(set(Trek.objects.filter(deleted=True).values_list('pk', flat=True)), {stale1.pk, stale2.pk})
+        other.refresh_from_db()
+        self.assertFalse(other.deleted)
+        # Object back in source is restored
+        t = Trek.objects.get(eid="58ed4fc1-645d-4bf6-b956-71f0a01a5eec")
+        Trek.objects.filter(pk=t.pk).update(deleted=True)
+        call_command('import', 'geotrek.common.tests.test_parsers.GeotrekTrekTestSoftDeleteParser', verbosity=0)
+        t.refresh_from_db()
+        self.assertFalse(t.deleted)
+
+    def test_replace_mapping(self):
+        parser = GeotrekTrekLocalParser(url='http://foo.fr')
+        parser.mapping = {'difficulty': {
+            'Easy': ['Very easy', 'Easy'],
+            'Medium': 'Medium hard',
+            'Hard': ['Medium', 'Hard'],
+        }}
+        self.assertEqual(parser.replace_mapping('Very easy', 'difficulty'), 'Easy')
+        # Labels contained in a string mapping match it, in mapping order
+        self.assertEqual(parser.replace_mapping('Medium', 'difficulty'), 'Medium')
+        self.assertEqual(parser.replace_mapping('hard', 'difficulty'), 'Medium')
+        self.assertEqual(parser.replace_mapping('Hard', 'difficulty'), 'Hard')
+        self.assertEqual(parser.replace_mapping('Unknown', 'difficulty'), 'Unknown')
+        self.assertEqual(parser.replace_mapping('Easy', 'route'), 'Easy')
+
+    def test_soft_delete_improperly_configured(self):
+        with self.assertRaisesRegex(ImproperlyConfigured, 'soft_delete can only be used with models having a deleted field'):
+            OrganismSoftDeleteParser()
+
 
 class GeotrekAggregatorParserTest(GeotrekParserTestMixin, TestCase):
     def setUp(self, *args, **kwargs):
@@ -791,6 +1255,30 @@ class GeotrekAggregatorParserTest(GeotrekParserTestMixin, TestCase):
         # "POI", "InformationDesk", "TouristicContent"
         self.assertEqual(8, mocked_import_module.call_count)
 
+    @skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
+    @override_settings(PARSER_AGGREGATOR_WORKERS=2)
+    @mock.patch('geotrek.common.parsers.importlib.import_module', return_value=mock.MagicMock())
+    def test_geotrek_aggregator_parser_concurrent(self, mocked_import_module):
+        calls = []
+
+        def run_method_parser(key, parsers, method_name):
+            calls.append((threading.current_thread(), key, method_name))
+
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'geotrek_parser_v2',
+                                'config_aggregator_multiple_admin.json')
+        with open(filename) as f:
+            sources = list(json.load(f).keys())
+        parser = GeotrekAggregatorParser(progress_cb=mock.MagicMock())
+        with mock.patch.object(parser, 'run_method_parser', side_effect=run_method_parser):
+            parser.parse(filename)
+        self.assertNotIn(threading.current_thread(), [thread for thread, key, method_name in calls])
+        self.assertEqual(list(parser.report_by_api_v2_by_type.keys()), sources)
+        for source in sources:
+            # Models of a source are still imported in order
+            self.assertEqual([method_name for thread, key, method_name in calls if key == source],
+                             ['start_meta', 'parse', 'end_meta'])
+        self.assertEqual(8, mocked_import_module.call_count)
+
     @skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
     def test_geotrek_aggregator_parser_no_url(self):
         output = StringIO()
@@ -885,3 +1373,79 @@ class GeotrekAggregatorParserTest(GeotrekParserTestMixin, TestCase):
         call_command('import', 'geotrek.common.parsers.GeotrekAggregatorParser', filename=filename, verbosity=2,
                      stdout=output)
         self.assertEqual(1, Trek.objects.get(name="Boucle du Pic des Trois Seigneurs").information_desks.count())
+
+
+@skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
+@override_settings(PARSER_AGGREGATOR_WORKERS=2, MODELTRANSLATION_DEFAULT_LANGUAGE="fr")
+class GeotrekAggregatorParserThreadsTest(TransactionTestCase):
+    categories = {
+        'trek_difficulty': 'trek_difficulty.json',
+        'trek_route': 'trek_route.json',
+        'theme': 'trek_theme.json',
+        'trek_practice': 'trek_practice.json',
+        'trek_accessibility': 'trek_accessibility.json',
+        'trek_network': 'trek_network.json',
+        'label': 'trek_label.json',
+        'source': 'sources.json',
+    }
+
+    def setUp(self):
+        FileType.objects.create(type="Photographie")
+        # Created by parsers of both sources otherwise
+        default_structure()
+        get_user_model().objects.create(username='import', is_active=False)
+        self.tmp_dir = mkdtemp()
+        self.addCleanup(rmtree, self.tmp_dir)
+        # Parsers of both sources are built before any of them parses
+        self.barrier = threading.Barrier(2, timeout=10)
+
+    def load_json(self, name):
+        filename = os.path.join('geotrek', 'trekking', 'tests', 'data', 'geotrek_parser_v2', name)
+        with open(filename) as f:
+            return f.read()
+
+    def source_json(self, host, route, params):
+        if route == 'tour':
+            return {'count': 0, 'next': None, 'previous': None, 'results': []}
+        if route == 'trek':
+            content = self.load_json('trek_ids.json' if 'fields' in (params or {}) else 'trek.json')
+            if host == 'b.fr':
+                # Same treks, with other uuids
+                for uuid in ('9e70b294', '1ba24605', '6761143f', 'c9567576', 'b2aea892'):
+                    content = content.replace(uuid, uuid[:-1] + 'f')
+            return json.loads(content)
+        root = json.loads(self.load_json(self.categories[route]))
+        if host == 'b.fr' and route == 'trek_practice':
+            # Same practice ids with other labels
+            names = {1: 'VTT', 3: 'Pédestre', 4: 'Cheval'}
+            for result in root['results']:
+                result['name']['fr'] = names[result['id']]
+        return root
+
+    def mocked_get(self, url, params=None, **kwargs):
+        parsed = urllib.parse.urlparse(url)
+        route = parsed.path.split('/api/v2/')[-1].strip('/')
+        if route == 'trek' and 'fields' not in (params or {}):
+            self.barrier.wait()
+        response = mock.Mock(status_code=200, content=b'', url=url)
+        response.json.return_value = self.source_json(parsed.netloc, route, params) if '/api/v2/' in parsed.path else {}
+        return response
+
+    @mock.patch('requests.head')
+    def test_sources_mappings(self, mocked_head):
+        mocked_head.return_value.status_code = 200
+        filename = os.path.join(self.tmp_dir, 'config_aggregator.json')
+        with open(filename, 'w') as f:
+            json.dump({
+                'A': {'url': 'http://a.fr', 'data_to_import': ['Trek'], 'create': True, 'all_datas': True},
+                'B': {'url': 'http://b.fr', 'data_to_import': ['Trek'], 'create': True, 'all_datas': True},
+            }, f)
+        with mock.patch('requests.get', side_effect=self.mocked_get):
+            GeotrekAggregatorParser(progress_cb=mock.MagicMock()).parse(filename)
+        self.assertEqual(Trek.objects.filter(provider='A').count(), 5)
+        self.assertEqual(Trek.objects.filter(provider='B').count(), 5)
+        # Practice 3 of each source is resolved with the labels of this source
+        trek_a = Trek.objects.get(provider='A', eid='9e70b294-1134-4c50-9c56-d722720cacf1')
+        trek_b = Trek.objects.get(provider='B', eid='9e70b29f-1134-4c50-9c56-d722720cacf1')
+        self.assertEqual(trek_a.practice.name_fr, 'Cheval')
+        self.assertEqual(trek_b.practice.name_fr, 'Pédestre')
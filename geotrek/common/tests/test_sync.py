@@ -8,13 +8,14 @@ from io import StringIO
 import zipfile
 
 from django.conf import settings
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.contrib.gis.geos import LineString
 from django.core import management
 from django.core.management.base import CommandError
 from django.http import HttpResponse, StreamingHttpResponse
 from django.test.utils import override_settings
 
+from geotrek.common.helpers_sync import SyncZipFile, fix2028_chunks, write_chunks
 from geotrek.common.tests.factories import FileTypeFactory, RecordSourceFactory, TargetPortalFactory, AttachmentFactory, ThemeFactory
 from geotrek.common.utils.testdata import get_dummy_uploaded_image
 from geotrek.core.tests.factories import PathFactory
@@ -36,6 +37,49 @@ class VarTmpTestCase(TestCase):
             shutil.rmtree(os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync'))
 
 
+class SyncStreamingWriterTest(SimpleTestCase):
+    def test_fix2028_split_across_chunks(self):
+        content = b'toto\\u2028tata\\u2029titi' * 10
+        expected = content.replace(b'\\u2028', b'\\n').replace(b'\\u2029', b'\\n')
+        for size in range(1, 12):
+            chunks = [content[i:i + size] for i in range(0, len(content), size)]
+            self.assertEqual(b''.join(fix2028_chunks(chunks)), expected)
+
+    def test_write_chunks_to_file_and_zip(self):
+        tmp_dir = os.path.join(settings.TMP_DIR, 'sync_streaming')
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        fullname = os.path.join(tmp_dir, 'treks.geojson')
+        zfile = SyncZipFile(os.path.join(tmp_dir, 'global.zip'), 'w')
+        write_chunks(iter([b'toto\\u20', b'28tata']), fullname, zipfile=zfile, arcname='api/en/treks.geojson',
+                     fix2028=True)
+        # Already zipped member is not written twice
+        write_chunks(iter([b'other']), fullname, zipfile=zfile, arcname='api/en/treks.geojson')
+        self.assertIn('api/en/treks.geojson', zfile)
+        zfile.close()
+        with open(fullname, 'rb') as f:
+            self.assertEqual(f.read(), b'other')
+        with zipfile.ZipFile(os.path.join(tmp_dir, 'global.zip')) as zfile:
+            self.assertEqual(zfile.namelist(), ['api/en/treks.geojson'])
+            self.assertEqual(zfile.read('api/en/treks.geojson'), b'toto\\ntata')
+
+    def test_write_chunks_does_not_modify_linked_file(self):
+        tmp_dir = os.path.join(settings.TMP_DIR, 'sync_streaming')
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        published = os.path.join(tmp_dir, 'published.geojson')
+        fullname = os.path.join(tmp_dir, 'treks.geojson')
+        with open(published, 'wb') as f:
+            f.write(b'published')
+        # Files of a resumed step can be hard links to published files
+        os.link(published, fullname)
+        write_chunks(iter([b'new']), fullname)
+        with open(fullname, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+        with open(published, 'rb') as f:
+            self.assertEqual(f.read(), b'published')
+
+
 class SyncRandoTilesTest(VarTmpTestCase):
     @classmethod
     def setUpClass(cls):
@@ -250,6 +294,38 @@ class SyncTest(VarTmpTestCase):
                                 skip_pdf=True, verbosity=2, stdout=output)
         self.assertIn("unchanged", output.getvalue())
 
+    def test_sync_resume(self):
+        with mock.patch('geotrek.sensitivity.helpers_sync.SyncRando.sync', side_effect=Exception('Interrupted')):
+            with self.assertRaisesRegex(Exception, 'Interrupted'):
+                management.call_command('sync_rando', os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync'), url='http://localhost:8000',
+                                        skip_tiles=True, languages='en', skip_pdf=True, verbosity=2, resume=True,
+                                        stdout=StringIO())
+        self.assertFalse(os.path.exists(os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync')))
+
+        output = StringIO()
+        with mock.patch('geotrek.trekking.helpers_sync.SyncRando.sync') as trek_sync:
+            management.call_command('sync_rando', os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync'), url='http://localhost:8000',
+                                    skip_tiles=True, languages='en', skip_pdf=True, verbosity=2, resume=True, stdout=output)
+        trek_sync.assert_not_called()
+        self.assertIn("geotrek.trekking.helpers_sync/en already synced", output.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync', 'api', 'en', 'treks.geojson')))
+        self.assertTrue(os.path.exists(os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync', 'api', 'en', 'sensitiveareas.geojson')))
+
+    def test_sync_without_resume_leaves_no_working_directory(self):
+        sync_rando_tmp_dir = os.path.join(settings.TMP_DIR, 'sync_rando')
+        os.makedirs(sync_rando_tmp_dir, exist_ok=True)
+        existing = set(os.listdir(sync_rando_tmp_dir))
+        with mock.patch('geotrek.sensitivity.helpers_sync.SyncRando.sync', side_effect=Exception('Interrupted')):
+            with self.assertRaisesRegex(Exception, 'Interrupted'):
+                management.call_command('sync_rando', os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync'), url='http://localhost:8000',
+                                        skip_tiles=True, languages='en', skip_pdf=True, verbosity=0)
+        self.assertEqual(set(os.listdir(sync_rando_tmp_dir)), existing)
+
+    def test_sync_resume_empty_tmp_folder(self):
+        with self.assertRaisesRegex(CommandError, 'not compatible'):
+            management.call_command('sync_rando', os.path.join(settings.TMP_DIR, 'sync_rando', 'tmp_sync'), url='http://localhost:8000',
+                                    skip_tiles=True, resume=True, empty_tmp_folder=True, verbosity=0)
+
     @override_settings(THUMBNAIL_COPYRIGHT_FORMAT='*' * 300)
     def test_sync_pictures_long_title_legend_author(self):
         with mock.patch('geotrek.trekking.models.Trek.prepare_map_image'):
@@ -65,6 +65,10 @@ class TasksTest(TestCase):
         self.assertEqual(organism.organism, "2.0")
         self.assertEqual("100%", log)
         self.assertEqual(task.status, "SUCCESS")
+        profile = task.result['profile']
+        json.dumps(profile)
+        self.assertIn('save', [phase['name'] for phase in profile['phases']])
+        self.assertEqual(profile['slowest_rows'][0]['line'], 1)
 
     @patch('requests.get')
     @patch('sys.stdout', new_callable=StringIO)
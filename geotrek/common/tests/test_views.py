@@ -24,12 +24,15 @@ from geotrek.common.mixins.views import CustomColumnsMixin
 from geotrek.common.models import FileType, HDViewPoint
 from geotrek.common.parsers import Parser
 from geotrek.common.tasks import import_datas, launch_sync_rando
-from geotrek.common.tests.factories import (HDViewPointFactory, LicenseFactory,
+from geotrek.common.tests.factories import (AttachmentFactory,
+                                            HDViewPointFactory, LicenseFactory,
                                             TargetPortalFactory)
 from geotrek.common.utils.testdata import get_dummy_uploaded_image
 from geotrek.core.models import Path
-from geotrek.trekking.models import Trek
+from geotrek.tourism.tests.factories import InformationDeskFactory
+from geotrek.trekking.models import OrderedTrekChild, Trek
 from geotrek.trekking.tests.factories import TrekFactory
+from geotrek.trekking.views import TrekDocumentPublic
 
 
 class DocumentPublicPortalTest(TestCase):
@@ -104,6 +107,74 @@ class DocumentPublicPortalTest(TestCase):
         self.assertTemplateUsed(response, template_name='trekking/trek_public_pdf_base.html')
 
 
+@override_settings(PUBLIC_PDF_CACHE_ROOT=os.path.join(settings.TMP_DIR, 'public_pdf_cache_tests'))
+class DocumentPublicCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.trek = TrekFactory.create()
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(settings.TMP_DIR, 'public_pdf_cache_tests'), ignore_errors=True)
+
+    def get_pdf(self):
+        return self.client.get(reverse('trekking:trek_printable', kwargs={'lang': 'fr', 'pk': self.trek.pk,
+                                                                          'slug': self.trek.slug}))
+
+    @mock.patch('geotrek.common.mixins.views.refresh_public_pdf.delay')
+    @mock.patch('mapentity.helpers.requests.get')
+    def test_public_pdf_served_from_cache(self, mock_request_get, mock_refresh):
+        mock_request_get.return_value.status_code = 200
+        mock_request_get.return_value.content = b'xxx'
+        response = self.get_pdf()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        rendered = response.content
+        # Up-to-date PDF is served from cache
+        response = self.get_pdf()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), rendered)
+        mock_refresh.assert_not_called()
+        # Outdated PDF is still served, and refreshed in background
+        self.trek.save()
+        response = self.get_pdf()
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), rendered)
+        mock_refresh.assert_called_once()
+        # Only one refresh is queued at a time
+        self.get_pdf()
+        mock_refresh.assert_called_once()
+
+    def test_public_pdf_dependencies(self):
+        view = TrekDocumentPublic()
+        dependencies = view.get_public_pdf_dependencies(self.trek)
+        attachment = AttachmentFactory.create(content_object=self.trek, attachment_file=get_dummy_uploaded_image())
+        self.assertNotEqual(view.get_public_pdf_dependencies(self.trek), dependencies)
+        dependencies = view.get_public_pdf_dependencies(self.trek)
+        attachment.delete()
+        self.assertNotEqual(view.get_public_pdf_dependencies(self.trek), dependencies)
+        dependencies = view.get_public_pdf_dependencies(self.trek)
+        self.trek.information_desks.add(InformationDeskFactory.create())
+        self.assertNotEqual(view.get_public_pdf_dependencies(self.trek), dependencies)
+        dependencies = view.get_public_pdf_dependencies(self.trek)
+        child = TrekFactory.create()
+        OrderedTrekChild.objects.create(parent=self.trek, child=child, order=1)
+        self.assertNotEqual(view.get_public_pdf_dependencies(self.trek), dependencies)
+        dependencies = view.get_public_pdf_dependencies(self.trek)
+        AttachmentFactory.create(content_object=child, attachment_file=get_dummy_uploaded_image())
+        self.assertNotEqual(view.get_public_pdf_dependencies(self.trek), dependencies)
+
+    @override_settings(PUBLIC_PDF_CACHE_ENABLED=False)
+    @mock.patch('mapentity.helpers.requests.get')
+    def test_public_pdf_cache_disabled(self, mock_request_get):
+        mock_request_get.return_value.status_code = 200
+        mock_request_get.return_value.content = b'xxx'
+        self.get_pdf()
+        response = self.get_pdf()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+
+
 class ViewsTest(TestCase):
     @classmethod
     def setUpTestData(cls):
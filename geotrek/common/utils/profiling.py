@@ -0,0 +1,96 @@
+import heapq
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class ImportProfiler:
+    """ Wall time and number of database queries of each phase of an import, and slowest rows
+    and filter methods.
+
+    Time and queries of a phase do not include those of phases nested in it
+    (e.g. lookups done while filtering values).
+    """
+    def __init__(self, nb_slowest=10):
+        self.nb_slowest = nb_slowest
+        self.phases = {}
+        self.filters = {}
+        self.rows = []
+        self.queries = 0
+        self.nested = []
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """To be installed with connection.execute_wrapper() to count queries"""
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def phase(self, name):
+        start_time, start_queries = perf_counter(), self.queries
+        self.nested.append([0, 0])
+        try:
+            yield
+        finally:
+            nested_time, nested_queries = self.nested.pop()
+            time, queries = perf_counter() - start_time, self.queries - start_queries
+            stats = self.phases.setdefault(name, {'time': 0, 'queries': 0, 'count': 0})
+            stats['time'] += time - nested_time
+            stats['queries'] += queries - nested_queries
+            stats['count'] += 1
+            if self.nested:
+                self.nested[-1][0] += time
+                self.nested[-1][1] += queries
+
+    @contextmanager
+    def filter(self, name):
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.filters.setdefault(name, {'time': 0, 'count': 0})
+            stats['time'] += perf_counter() - start_time
+            stats['count'] += 1
+
+    @contextmanager
+    def row(self, parser):
+        start_time, start_queries = perf_counter(), self.queries
+        try:
+            yield
+        finally:
+            eid = str(getattr(parser, 'eid_val', None) or '')
+            entry = (perf_counter() - start_time, self.queries - start_queries, parser.line, eid)
+            if len(self.rows) < self.nb_slowest:
+                heapq.heappush(self.rows, entry)
+            else:
+                heapq.heappushpop(self.rows, entry)
+
+    def iterate(self, rows, name='fetch'):
+        """Iterate over rows, timing the time spent to get each of them"""
+        rows = iter(rows)
+        while True:
+            with self.phase(name):
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    return
+            yield row
+
+    def as_dict(self):
+        """Profile as JSON serializable dict, slowest first"""
+        phases = sorted(self.phases.items(), key=lambda item: item[1]['time'], reverse=True)
+        filters = sorted(self.filters.items(), key=lambda item: item[1]['time'], reverse=True)
+        return {
+            'time': round(sum(stats['time'] for stats in self.phases.values()), 3),
+            'queries': self.queries,
+            'phases': [
+                {'name': name, 'time': round(stats['time'], 3), 'queries': stats['queries'], 'count': stats['count']}
+                for name, stats in phases
+            ],
+            'slowest_rows': [
+                {'line': line, 'eid': eid, 'time': round(time, 3), 'queries': queries}
+                for time, queries, line, eid in sorted(self.rows, reverse=True)
+            ],
+            'slowest_filters': [
+                {'name': name, 'time': round(stats['time'], 3), 'count': stats['count']}
+                for name, stats in filters[:self.nb_slowest]
+            ],
+        }
@@ -0,0 +1,97 @@
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+STATS_EVENTS = ('hit', 'stale', 'miss')
+
+
+def _digest(values):
+    return hashlib.sha1(repr(list(values)).encode('utf-8')).hexdigest()
+
+
+class PublicPDFCache:
+    """ Files cache of rendered public PDFs.
+
+    There is one directory per object, document kind (simple or booklet), language and
+    request parameters (portal, source). In this directory, the PDF is named after a digest
+    of the versions of everything it depends on, so any change of these leads to a new name.
+    """
+    def __init__(self, obj, variant, lang, params):
+        params = sorted((key, params.getlist(key)) for key in params)
+        kind = '{lang}{variant}_{params}'.format(lang=lang, variant=variant, params=_digest(params))
+        self.directory = os.path.join(settings.PUBLIC_PDF_CACHE_ROOT, obj._meta.app_label, obj._meta.model_name,
+                                      str(obj.pk), kind)
+
+    def name(self, dependencies):
+        return '{}.pdf'.format(_digest(dependencies))
+
+    def open(self, name):
+        """ Open up-to-date PDF ``name``, or return None if it does not exist."""
+        try:
+            return open(os.path.join(self.directory, name), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def open_latest(self):
+        """ Open the most recently rendered PDF, even if outdated, or return None if there is none."""
+        paths = sorted(glob.glob(os.path.join(self.directory, '*.pdf')), key=os.path.getmtime, reverse=True)
+        for path in paths:
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                continue
+        return None
+
+    def store(self, name, content):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write in a temporary file then rename it, so that a partial PDF is never served
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        path = os.path.join(self.directory, name)
+        os.replace(tmp_path, path)
+        for outdated in glob.glob(os.path.join(self.directory, '*.pdf')):
+            if outdated != path:
+                try:
+                    os.remove(outdated)
+                except FileNotFoundError:
+                    pass
+
+    @property
+    def refresh_lock_key(self):
+        return 'public_pdf_refresh_{}'.format(_digest([self.directory]))
+
+    def lock_refresh(self):
+        """ Return True if no refresh of this PDF is already pending."""
+        return cache.add(self.refresh_lock_key, True, timeout=settings.PUBLIC_PDF_CACHE_REFRESH_TIMEOUT)
+
+    def unlock_refresh(self):
+        cache.delete(self.refresh_lock_key)
+
+
+def record_public_pdf_cache(event):
+    key = 'public_pdf_cache_{}'.format(event)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:  # Evicted in the meantime
+        cache.set(key, 1, timeout=None)
+    stats = public_pdf_cache_stats()
+    logger.debug("Public PDF cache %s (hit rate: %.1f%%)", event, 100 * stats['hit_rate'])
+
+
+def public_pdf_cache_stats():
+    """ Return counts of hits (up-to-date PDF), stale hits (outdated PDF served while refreshing)
+    and misses (PDF rendered during the request), and the rate of requests served from the cache.
+    """
+    stats = {event: cache.get('public_pdf_cache_{}'.format(event), 0) for event in STATS_EVENTS}
+    total = sum(stats.values())
+    stats['hit_rate'] = (stats['hit'] + stats['stale']) / total if total else 0
+    return stats
@@ -113,11 +113,13 @@ class Meta(MetaMixin, TemplateView):
 
 class DocumentPublic(DocumentPortalMixin, PublicOrReadPermMixin, DocumentPublicMixin,
                      mapentity_views.MapEntityDocumentWeasyprint):
-    pass
+    public_pdf_cache = True
 
 
 class DocumentBookletPublic(DocumentPortalMixin, PublicOrReadPermMixin, DocumentPublicMixin, BookletMixin,
                             mapentity_views.MapEntityDocumentWeasyprint):
+    public_pdf_cache = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.template_name_suffix = '_public_booklet'
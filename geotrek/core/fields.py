@@ -80,15 +80,9 @@ class SnappedLineStringField(LineStringField):
             snaplist = value.get('snap', [])
             if geom.num_coords != len(snaplist):
                 raise ValueError("Snap list length != %s (%s)" % (geom.num_coords, snaplist))
-            paths = [Path.objects.get(pk=pk) if pk is not None else None
-                     for pk in snaplist]
-            coords = list(geom.coords)
-            for i, (vertex, path) in enumerate(zip(coords, paths)):
-                if path:
-                    # Snap vertex on path
-                    snap = path.snap(Point(*vertex, srid=geom.srid))
-                    coords[i] = snap.coords
-            return LineString(*coords, srid=settings.SRID)
+            # Snap vertices on paths
+            points = Path.snap_many([Point(*vertex, srid=geom.srid) for vertex in geom.coords], snaplist)
+            return LineString(*[point.coords for point in points], srid=settings.SRID)
         except (TypeError, Path.DoesNotExist, ValueError) as e:
             logger.warning("User input error: %s" % e)
             raise ValidationError(self.error_messages['invalid_snap_line'])
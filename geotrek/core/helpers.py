@@ -0,0 +1,91 @@
+from itertools import islice
+from time import perf_counter
+
+from django.conf import settings
+
+from geotrek.core.models import Topology
+
+
+class PointLoaderMixin:
+    """ Helpers for commands loading layers of points.
+
+    Features are loaded by chunks, each one in a transaction. Related objects (types, conditions...)
+    are looked up once per value, and topologies of the objects of a chunk are computed at once.
+    If loading fails, only the current chunk is rolled back: objects of previous chunks are kept.
+    """
+    chunk_size = None
+
+    def add_chunk_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of objects loaded in each transaction, default 1000. '
+                                 'If loading fails, objects of previous transactions are kept')
+
+    def init_loading(self, options):
+        self.chunk_size = options.get('chunk_size')
+        self.nb_committed = 0
+        self.lookups = {}
+        self.pending_topologies = []
+
+    def get_or_create_cached(self, model, **kwargs):
+        """ Same as model.objects.get_or_create(**kwargs), with one query per distinct kwargs """
+        if not hasattr(self, 'lookups'):
+            self.lookups = {}
+        key = (model, tuple(sorted(kwargs.items())))
+        if key in self.lookups:
+            return self.lookups[key], False
+        obj, created = model.objects.get_or_create(**kwargs)
+        self.lookups[key] = obj
+        return obj, created
+
+    def get_cached(self, model, **kwargs):
+        """ Same as model.objects.get(**kwargs), with one query per distinct kwargs """
+        if not hasattr(self, 'lookups'):
+            self.lookups = {}
+        key = (model, tuple(sorted(kwargs.items())))
+        if key not in self.lookups:
+            self.lookups[key] = model.objects.get(**kwargs)
+        return self.lookups[key]
+
+    def set_point_topology(self, obj, geometry):
+        """ Attach obj to the closest path of the geometry (2D point with API_SRID),
+        at the end of the chunk if loading by chunks """
+        if not hasattr(self, 'pending_topologies'):
+            self.pending_topologies = []
+        self.pending_topologies.append((obj, (geometry.x, geometry.y)))
+        if not self.chunk_size:
+            self.attach_topologies()
+
+    def attach_topologies(self):
+        pending = getattr(self, 'pending_topologies', [])
+        if not pending:
+            return
+        topologies = Topology._topologypoints([coords for obj, coords in pending])
+        # Move deserialization aggregations to the objects
+        Topology.mutate_many([(obj, topology) for (obj, coords), topology in zip(pending, topologies)])
+        self.pending_topologies = []
+
+    def iter_chunks(self, features):
+        """ Yield lists of chunk_size features (all features if chunk_size is not set).
+        Each chunk is expected to be loaded in a transaction, then ended with end_chunk(). """
+        self.loading_start = perf_counter()
+        self.nb_loaded = 0
+        features = iter(features)
+        while True:
+            chunk = list(islice(features, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def end_chunk(self, chunk, total, verbosity):
+        if settings.TREKKING_TOPOLOGY_ENABLED:
+            self.attach_topologies()
+        self.nb_loaded += len(chunk)
+        self.nb_committed += len(chunk)
+        if verbosity >= 1:
+            elapsed = perf_counter() - self.loading_start
+            self.stdout.write("{}/{} objects loaded ({:.1f}s)".format(self.nb_loaded, total, elapsed))
+
+    def loading_error_message(self):
+        """ Message displayed when loading fails, as objects of previous chunks (of all layers) are committed """
+        return "An error occured, {} objects already loaded are kept, objects of the current chunk are rolled back.".format(
+            self.nb_committed)
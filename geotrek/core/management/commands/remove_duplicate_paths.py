@@ -1,3 +1,5 @@
+from time import perf_counter
+
 from django.core.management.base import BaseCommand
 from django.db import connection, transaction
 
@@ -8,38 +10,80 @@ class Command(BaseCommand):
     help = """Remove all duplicate path (same geom)."""
     """Do not remove path with topology."""
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help="Only count duplicate paths, without deleting them")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of duplicate paths deleted at once (default: 1000)")
+
+    def get_duplicates(self):
+        """ Duplicate paths to delete, as a dict {duplicate id: id of the path to keep}.
+        Among paths with the same geometry, the first visible one is kept, or the first one if none is visible. """
+        cursor = connection.cursor()
+        # ~= compares bounding boxes using the spatial index, before comparing geometries
+        cursor.execute("""
+            SELECT t1.id, t1.visible, t2.id, t2.visible
+            FROM core_path t1
+            JOIN core_path t2 ON t1.id < t2.id AND t1.geom ~= t2.geom AND ST_OrderingEquals(t1.geom, t2.geom)
+            ORDER BY t1.id, t2.id
+        """)
+        pairs = cursor.fetchall()
+        # Same geometry is transitive, so groups are given by pairs starting with their smallest id
+        not_first = {t2_id for t1_id, t1_visible, t2_id, t2_visible in pairs}
+        groups = {}
+        for t1_id, t1_visible, t2_id, t2_visible in pairs:
+            if t1_id not in not_first:
+                groups.setdefault((t1_id, t1_visible), []).append((t2_id, t2_visible))
+        duplicates = {}
+        for first, others in groups.items():
+            paths = [first] + others
+            keep = next((pk for pk, visible in paths if visible), first[0])
+            for pk, visible in paths:
+                if pk != keep:
+                    duplicates[pk] = keep
+        return duplicates
+
+    def merge(self, duplicates):
+        """ Move topologies of duplicate paths to paths to keep, then delete duplicates """
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE core_pathaggregation et SET path_id = merged.keep
+            FROM unnest(%s::integer[], %s::integer[]) AS merged(duplicate, keep)
+            WHERE et.path_id = merged.duplicate
+        """, [list(duplicates.keys()), list(duplicates.values())])
+        Path.include_invisible.filter(pk__in=list(duplicates)).delete()
+
     def handle(self, *args, **options):
         verbosity = options['verbosity']
-        cursor = connection.cursor()
-        query = """with relations as (SELECT t1.id as t1_id,
-                                             t2.id as t2_id
-                                      FROM core_path t1
-                                      JOIN core_path t2 ON t1.id < t2.id AND ST_OrderingEquals(t1.geom, t2.geom)
-                                      ORDER BY t1.id, t2.id)
-                      SELECT * FROM relations WHERE t1_id NOT IN (SELECT t2_id FROM relations) """
-        cursor.execute(query)
-        list_topologies = cursor.fetchall()
-
-        path_deleted = []
-
-        with transaction.atomic():
-            try:
-                for path1_pk, path2_pk in list_topologies:
-                    path1 = Path.include_invisible.get(pk=path1_pk)
-                    path2 = Path.include_invisible.get(pk=path2_pk)
-                    if not path1.visible and path2.visible:
-                        path1.aggregations.update(path_id=path2_pk)
-                        path1.delete()
-                        path_deleted.append(path1)
-                    else:
-                        path2.aggregations.update(path_id=path1_pk)
-                        path2.delete()
-                        path_deleted.append(path2)
-                    if verbosity > 1:
-                        self.stdout.write("Deleting path %s" % path_deleted[-1])
-
-            except Exception as exc:
-                self.stdout.write(self.style.ERROR("{}".format(exc)))
+        batch_size = options['batch_size']
+        start = perf_counter()
+        duplicates = self.get_duplicates()
+        detection_time = perf_counter() - start
+
+        if options['dry_run']:
+            if verbosity > 0:
+                self.stdout.write("{} duplicate paths would be deleted, {} paths with duplicates would be kept "
+                                  "(detection: {:.2f}s)".format(len(duplicates), len(set(duplicates.values())),
+                                                                detection_time))
+            return
+
+        path_deleted = 0
+        start = perf_counter()
+        duplicate_ids = sorted(duplicates)
+        try:
+            for i in range(0, len(duplicate_ids), batch_size):
+                batch = {pk: duplicates[pk] for pk in duplicate_ids[i:i + batch_size]}
+                with transaction.atomic():
+                    self.merge(batch)
+                path_deleted += len(batch)
+                if verbosity > 1:
+                    for pk, keep in batch.items():
+                        self.stdout.write("Deleting path {} (duplicate of {})".format(pk, keep))
+
+        except Exception as exc:
+            self.stdout.write(self.style.ERROR("{}".format(exc)))
 
+        if verbosity > 1:
+            self.stdout.write("Detection: {:.2f}s, merge: {:.2f}s".format(detection_time, perf_counter() - start))
         if verbosity > 0:
-            self.stdout.write(self.style.SUCCESS("{} duplicate paths have been deleted".format(len(path_deleted))))
+            self.stdout.write(self.style.SUCCESS("{} duplicate paths have been deleted".format(path_deleted)))
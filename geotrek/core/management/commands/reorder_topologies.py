@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db.models import OneToOneRel
-from django.db import connection
+from django.db import connection, transaction
 
 from django.contrib.gis.geos import GEOSGeometry
 
@@ -11,105 +11,143 @@ from geotrek.core.models import PathAggregation, Topology
 class Command(BaseCommand):
     help = """Reorder Pathaggregations of all topologies."""
 
-    def get_geom_lines(self, topology):
+    def add_arguments(self, parser):
+        parser.add_argument('--topologies', nargs='+', type=int, default=None,
+                            help="Reorder only these topologies (ids)")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of topologies reordered at once (default: 1000)")
+
+    def get_geom_lines(self, topology_ids):
+        """ Sublines of the topologies, by topology, as lists of (id, order, wkt, is_point) """
         cursor = connection.cursor()
-        # We get all sublines of the topology
-        cursor.execute(f"""
-                    SELECT et.id, ST_ASTEXT(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position))
-                    FROM core_topology e, core_pathaggregation et, core_path t
-                    WHERE e.id = {topology.pk} AND et.topo_object_id = e.id AND et.path_id = t.id
-                    AND GeometryType(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position)) != 'POINT'
-                    ORDER BY et."order", et.id
-                    """)
-        geom_lines_order = cursor.fetchall()
-        return geom_lines_order
-
-    def get_new_order(self, geom_lines):
+        cursor.execute("""
+            SELECT et.topo_object_id, et.id, et."order", ST_ASTEXT(sub.geom), GeometryType(sub.geom) = 'POINT'
+            FROM core_pathaggregation et
+            JOIN core_path t ON et.path_id = t.id,
+            LATERAL (SELECT ST_SmartLineSubstring(t.geom, et.start_position, et.end_position) AS geom) sub
+            WHERE et.topo_object_id = ANY(%s)
+            ORDER BY et.topo_object_id, et."order", et.id
+        """, [topology_ids])
+        geom_lines = {}
+        for topology_id, pa_id, order, wkt, is_point in cursor.fetchall():
+            geom_lines.setdefault(topology_id, []).append((pa_id, order, wkt, is_point))
+        return geom_lines
+
+    def get_new_orders(self, topology_ids):
+        """ Order of the lines of the topologies given by ft_Smart_MakeLine, by topology """
         cursor = connection.cursor()
-        # We use ft_Smart_MakeLine to get the order of the lines
-        cursor.execute(f"""SELECT * FROM ft_Smart_MakeLine(ARRAY{[geom[1] for geom in geom_lines]}::geometry[])""")
-
+        # Lines are given as WKT, like when calling ft_Smart_MakeLine on each topology
+        cursor.execute("""
+            SELECT topology_id, (ft_Smart_MakeLine(array_agg(ST_GeomFromText(wkt) ORDER BY "order", id))).new_order
+            FROM (
+                SELECT et.topo_object_id AS topology_id, et.id, et."order",
+                       ST_ASTEXT(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position)) AS wkt
+                FROM core_pathaggregation et JOIN core_path t ON et.path_id = t.id
+                WHERE et.topo_object_id = ANY(%s)
+            ) sublines
+            WHERE GeometryType(ST_GeomFromText(wkt)) != 'POINT'
+            GROUP BY topology_id
+        """, [topology_ids])
+        return dict(cursor.fetchall())
+
+    def reorder(self, geom_lines, points, new_order):
+        """ New orders of pathaggregations of a topology, by id, from the order of its lines
+        given by ft_Smart_MakeLine. Points not between two lines are left out. """
         # We remove first value (algorithme use a 0 by default to go through the lines and will always be here)
         # Then we need to remove first value and remove 1 to all of them because Path aggregation's orders begin at 0
-        fetched = cursor.fetchall()
-        return fetched[0][1]
-
-    def handle(self, *args, **options):
-        topologies = Topology.objects.filter(deleted=False)
+        order_maked_lines = new_order[1:]
+        orders = [result - 1 for result in order_maked_lines]
+        # We generate a dict with id Pathaggregation as key and new order (without points)
+        new_orders = {}
+        for x, geom_line in enumerate(geom_lines):
+            new_orders[geom_line[0]] = orders[x]
+
+        id_order = 0
+
+        dict_points = {}
+        for id_pa_point, geom_point_wkt in points:
+            dict_points[id_pa_point] = GEOSGeometry(geom_point_wkt, srid=settings.SRID)
+
+        points_touching = {}
+        # Find points aggregations that touches lines
+        while id_order < len(orders) - 1:
+            geometries_points = dict_points.values()
+            order_actual = orders[id_order]
+            order_next = orders[id_order + 1]
+            actual_point_end = GEOSGeometry(geom_lines[order_actual][1], srid=settings.SRID).boundary[
+                1]  # Get end point of the geometry
+            next_point_start = GEOSGeometry(geom_lines[order_next][1], srid=settings.SRID).boundary[
+                0]  # Get start point of the geometry
+            if actual_point_end == next_point_start and actual_point_end in geometries_points:
+                for id_pa_point, point_geom in dict_points.items():
+                    if point_geom == actual_point_end:
+                        points_touching[id_pa_point] = id_order + 1
+                        dict_points.pop(id_pa_point)
+                        break
+            id_order += 1
+
+        points_added = 0
+        # We add all points between the lines and remove points generated which should not be here (it happens)
+        for id_pa_point, order_point_touching in points_touching.items():
+            new_orders = {id_pa: new_order + 1 if new_order >= order_point_touching + points_added else new_order for id_pa, new_order in new_orders.items()}
+            new_orders[id_pa_point] = order_point_touching + points_added
+            points_added += 1
+        return new_orders
+
+    def get_failed_topologies(self, topology_ids):
         failed_topologies = []
-        num_updated_topologies = 0
-        for topology in topologies:
-            geom_lines = self.get_geom_lines(topology)
-
-            new_order = self.get_new_order(geom_lines)
+        for topology in Topology.objects.filter(pk__in=topology_ids).order_by('pk'):
+            for field in topology._meta.get_fields():
+                if isinstance(field, OneToOneRel) and hasattr(topology, field.name):
+                    failed_topologies.append(str(f'{getattr(topology, field.name).kind} id: {topology.pk}'))
+        return failed_topologies
+
+    def reorder_chunk(self, topology_ids):
+        """ Reorder pathaggregations of topologies with a few queries.
+        Return the number of updated topologies and the list of failed ones. """
+        geom_lines = self.get_geom_lines(topology_ids)
+        new_orders_by_topology = self.get_new_orders(topology_ids)
+        failed_ids = []
+        to_delete = []
+        pas_updated = []
+        updated_topologies = set()
+        for topology_id in topology_ids:
+            sublines = geom_lines.get(topology_id, [])
+            # Topologies made of points only have no line to order
+            new_order = new_orders_by_topology.get(topology_id, [0])
             if new_order == []:
-                for field in topology._meta.get_fields():
-                    if isinstance(field, OneToOneRel) and hasattr(topology, field.name):
-                        failed_topologies.append(str(f'{getattr(topology, field.name).kind} id: {topology.pk}'))
+                failed_ids.append(topology_id)
 
             if len(new_order) <= 2:
                 continue
-            order_maked_lines = new_order[1:]
-            orders = [result - 1 for result in order_maked_lines]
-            new_orders = {}
-            for x, geom_line in enumerate(geom_lines):
-                new_orders[geom_line[0]] = orders[x]
-
-            # We generate a dict with id Pathaggregation as key and new order (without points)
-
-            # We get all the Points that we didn't get for smart make line
-            cursor = connection.cursor()
-            cursor.execute(f"""
-            SELECT et.id, ST_ASTEXT(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position))
-            FROM core_topology e, core_pathaggregation et, core_path t
-            WHERE e.id = {topology.pk} AND et.topo_object_id = e.id AND et.path_id = t.id
-            AND GeometryType(ST_SmartLineSubstring(t.geom, et.start_position, et.end_position)) = 'POINT'
-            ORDER BY et."order", et.id
-            """)
-            points = cursor.fetchall()
-            id_order = 0
-
-            dict_points = {}
-            for id_pa_point, geom_point_wkt in points:
-                dict_points[id_pa_point] = GEOSGeometry(geom_point_wkt, srid=settings.SRID)
-
-            points_touching = {}
-            # Find points aggregations that touches lines
-            while id_order < len(orders) - 1:
-                geometries_points = dict_points.values()
-                order_actual = orders[id_order]
-                order_next = orders[id_order + 1]
-                actual_point_end = GEOSGeometry(geom_lines[order_actual][1], srid=settings.SRID).boundary[
-                    1]  # Get end point of the geometry
-                next_point_start = GEOSGeometry(geom_lines[order_next][1], srid=settings.SRID).boundary[
-                    0]  # Get start point of the geometry
-                if actual_point_end == next_point_start and actual_point_end in geometries_points:
-                    for id_pa_point, point_geom in dict_points.items():
-                        if point_geom == actual_point_end:
-                            points_touching[id_pa_point] = id_order + 1
-                            dict_points.pop(id_pa_point)
-                            break
-                id_order += 1
-
-            points_added = 0
-            # We add all points between the lines and remove points generated which should not be here (it happens)
-            for id_pa_point, order_point_touching in points_touching.items():
-                new_orders = {id_pa: new_order + 1 if new_order >= order_point_touching + points_added else new_order for id_pa, new_order in new_orders.items()}
-                new_orders[id_pa_point] = order_point_touching + points_added
-                points_added += 1
-            PathAggregation.objects.filter(topo_object=topology).exclude(id__in=new_orders.keys()).delete()
-
-            initial_order = PathAggregation.objects.filter(topo_object=topology).values_list('id', flat=True)
-
-            pas_updated = []
-            for pa_id in initial_order:
-                pa = PathAggregation.objects.get(id=pa_id)
-                if pa.order != new_orders[pa_id]:
-                    pa.order = new_orders[pa_id]
-                    pas_updated.append(pa)
-            PathAggregation.objects.bulk_update(pas_updated, ['order'])
-            if pas_updated:
-                num_updated_topologies += 1
+            lines = [(pa_id, wkt) for pa_id, order, wkt, is_point in sublines if is_point is False]
+            points = [(pa_id, wkt) for pa_id, order, wkt, is_point in sublines if is_point is True]
+            new_orders = self.reorder(lines, points, new_order)
+            for pa_id, order, wkt, is_point in sublines:
+                if pa_id not in new_orders:
+                    to_delete.append(pa_id)
+                elif order != new_orders[pa_id]:
+                    pas_updated.append(PathAggregation(id=pa_id, order=new_orders[pa_id]))
+                    updated_topologies.add(topology_id)
+
+        with transaction.atomic():
+            if to_delete:
+                PathAggregation.objects.filter(id__in=to_delete).delete()
+            PathAggregation.objects.bulk_update(pas_updated, ['order'], batch_size=1000)
+        return len(updated_topologies), self.get_failed_topologies(failed_ids)
+
+    def handle(self, *args, **options):
+        topologies = Topology.objects.filter(deleted=False)
+        if options['topologies']:
+            topologies = topologies.filter(pk__in=options['topologies'])
+        topology_ids = list(topologies.order_by('pk').values_list('pk', flat=True))
+        chunk_size = options['chunk_size']
+        failed_topologies = []
+        num_updated_topologies = 0
+        for i in range(0, len(topology_ids), chunk_size):
+            num_updated, failed = self.reorder_chunk(topology_ids[i:i + chunk_size])
+            num_updated_topologies += num_updated
+            failed_topologies += failed
 
         if options['verbosity']:
             self.stdout.write(f'{num_updated_topologies} topologies has beeen updated')
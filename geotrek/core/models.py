@@ -1,4 +1,5 @@
 import functools
+import itertools
 import json
 import logging
 from geotrek.common.signals import log_cascade_deletion
@@ -206,6 +207,74 @@ class Path(CheckBoxActionMixin, ZoningPropertiesMixin, AddPropertyMixin, Geotrek
         result = cursor.fetchall()
         return Point(*result[0], srid=self.geom.srid)
 
+    @classmethod
+    def interpolate_many(cls, points, paths=None, exclude=None):
+        """
+        Returns a list of (path, position, offset) for each point, with two queries.
+        Path is the closest path of the point, like closest() would return, or the path
+        whose pk is given at the same index in ``paths`` if it is not None. Position and
+        offset are those interpolate() would return along this path.
+        Will fail if no path in database.
+        """
+        points = [point.transform(settings.SRID, clone=True) if point.srid != settings.SRID else point
+                  for point in points]
+        if not points:
+            return []
+        if paths is None:
+            paths = [None] * len(points)
+        cursor = connection.cursor()
+        sql = """
+        SELECT closest.id, r.position, r.distance
+        FROM unnest(%%s::float8[], %%s::float8[], %%s::integer[]) WITH ORDINALITY AS pts(x, y, path_id, idx),
+        LATERAL (SELECT ST_SetSRID(ST_MakePoint(pts.x, pts.y), %(srid)s) AS geom) pt,
+        LATERAL (SELECT COALESCE(pts.path_id, (
+            SELECT p.id FROM %(table)s p
+            WHERE p.visible AND NOT p.draft AND p.id IS DISTINCT FROM %%s
+            ORDER BY ST_Distance(p.geom, pt.geom) LIMIT 1
+        )) AS id) closest,
+        LATERAL ft_path_interpolate(closest.id, pt.geom) AS r(position FLOAT, distance FLOAT)
+        ORDER BY pts.idx
+        """ % {'srid': settings.SRID, 'table': cls._meta.db_table}
+        cursor.execute(sql, [[point.x for point in points], [point.y for point in points], list(paths),
+                             exclude.pk if exclude else None])
+        result = cursor.fetchall()
+        if any(pk is None for pk, position, distance in result):
+            # Like closest() when there is no path
+            raise IndexError("No path found")
+        objects = cls.objects.in_bulk({pk for pk, position, distance in result})
+        if any(pk not in objects for pk, position, distance in result):
+            raise cls.DoesNotExist("Path matching query does not exist.")
+        return [(objects[pk], position, distance) for pk, position, distance in result]
+
+    @classmethod
+    def snap_many(cls, points, paths):
+        """
+        Returns points snapped (i.e closest) to the path of same index in ``paths`` (pks),
+        or unchanged if the path is None, like snap() would, with one query.
+        """
+        points = [point.transform(settings.SRID, clone=True) if point.srid != settings.SRID else point
+                  for point in points]
+        snapped = list(points)
+        to_snap = [(i, point, pk) for i, (point, pk) in enumerate(zip(points, paths)) if pk is not None]
+        if not to_snap:
+            return snapped
+        cursor = connection.cursor()
+        sql = """
+        WITH pts AS (SELECT * FROM unnest(%%s::integer[], %%s::float8[], %%s::float8[], %%s::integer[])
+                     AS pts(idx, x, y, path_id)),
+             p AS (SELECT pts.idx, ST_ClosestPoint(t.geom, ST_SetSRID(ST_MakePoint(pts.x, pts.y), %(srid)s)) AS geom
+                   FROM pts JOIN %(table)s t ON t.id = pts.path_id AND t.visible)
+        SELECT p.idx, ST_X(p.geom), ST_Y(p.geom) FROM p
+        """ % {'srid': settings.SRID, 'table': cls._meta.db_table}
+        cursor.execute(sql, [[i for i, point, pk in to_snap], [point.x for i, point, pk in to_snap],
+                             [point.y for i, point, pk in to_snap], [pk for i, point, pk in to_snap]])
+        result = cursor.fetchall()
+        if len(result) != len(to_snap):
+            raise cls.DoesNotExist("Path matching query does not exist.")
+        for i, x, y in result:
+            snapped[i] = Point(x, y, srid=settings.SRID)
+        return snapped
+
     def reload(self):
         # Update object's computed values (reload from database)
         if self.pk and self.visible:
@@ -247,22 +316,21 @@ class Path(CheckBoxActionMixin, ZoningPropertiesMixin, AddPropertyMixin, Geotrek
         r = super().delete(*args, **kwargs)
         if not Path.objects.exists():
             return r
-        for topology in topologies_list:
-            if isinstance(topology.geom, Point):
-                closest = self.closest(topology.geom, self)
-                position, offset = closest.interpolate(topology.geom)
-                new_topology = Topology.objects.create()
-                aggrobj = PathAggregation(topo_object=new_topology,
-                                          start_position=position,
-                                          end_position=position,
-                                          path=closest)
-                aggrobj.save()
-                point = Point(topology.geom.x, topology.geom.y, srid=settings.SRID)
-                new_topology.geom = point
-                new_topology.offset = offset
-                new_topology.position = position
-                new_topology.save()
-                topology.mutate(new_topology)
+        point_topologies = [topology for topology in topologies_list if isinstance(topology.geom, Point)]
+        located = Path.interpolate_many([topology.geom for topology in point_topologies], exclude=self)
+        for topology, (closest, position, offset) in zip(point_topologies, located):
+            new_topology = Topology.objects.create()
+            aggrobj = PathAggregation(topo_object=new_topology,
+                                      start_position=position,
+                                      end_position=position,
+                                      path=closest)
+            aggrobj.save()
+            point = Point(topology.geom.x, topology.geom.y, srid=settings.SRID)
+            new_topology.geom = point
+            new_topology.offset = offset
+            new_topology.position = position
+            new_topology.save()
+            topology.mutate(new_topology)
         return r
 
     @property
@@ -434,52 +502,59 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
         return aggr
 
     @classmethod
-    def overlapping(cls, queryset, all_objects=None):
-        """ Return a Topology queryset overlapping specified topologies.
+    def overlapping_pks(cls, topology_pks, all_objects, by_source=False):
+        """ Return rows (source pk, pk) of topologies of all_objects overlapping specified topologies,
+        sorted by order of progression along them (for each source if by_source).
         """
-        if all_objects is None:
-            all_objects = cls.objects.existing()
-        is_generic = all_objects.model.KIND == Topology.KIND
-        single_input = isinstance(queryset, QuerySet)
-
-        if single_input:
-            topology_pks = [str(pk) for pk in queryset.values_list('pk', flat=True)]
-        else:
-            topology_pks = [str(queryset.pk)]
-
-        if len(topology_pks) == 0:
-            return all_objects.filter(pk__in=[])
-
         sql = """
-        WITH topologies AS (SELECT id FROM %(topology_table)s WHERE id IN (%(topology_list)s)),
+        WITH topologies AS (SELECT id FROM %(topology_table)s WHERE id = ANY(%%s)),
         -- Concerned aggregations
              aggregations AS (SELECT * FROM %(aggregations_table)s a, topologies t
                               WHERE a.topo_object_id = t.id),
         -- Concerned paths along with (start, end)
-             paths_aggr AS (SELECT a.start_position AS start, a.end_position AS end, p.id, a.order AS order
+             paths_aggr AS (SELECT a.topo_object_id AS source, a.start_position AS start, a.end_position AS end,
+                                   p.id, a.order AS order
                             FROM %(paths_table)s p, aggregations a
                             WHERE a.path_id = p.id
                             ORDER BY a.order)
         -- Retrieve primary keys
-        SELECT t.id
+        SELECT pa.source, t.id
         FROM %(topology_table)s t, %(aggregations_table)s a, paths_aggr pa
         WHERE a.path_id = pa.id AND a.topo_object_id = t.id
           AND least(a.start_position, a.end_position) <= greatest(pa.start, pa.end)
           AND greatest(a.start_position, a.end_position) >= least(pa.start, pa.end)
           AND %(extra_condition)s
-        ORDER BY (pa.order + CASE WHEN pa.start > pa.end THEN (1 - a.start_position) ELSE a.start_position END);
+        ORDER BY %(source_ordering)s(pa.order + CASE WHEN pa.start > pa.end THEN (1 - a.start_position) ELSE a.start_position END);
         """ % {
             'topology_table': Topology._meta.db_table,
             'aggregations_table': PathAggregation._meta.db_table,
             'paths_table': Path._meta.db_table,
-            'topology_list': ','.join(topology_pks),
-            'extra_condition': 'true' if is_generic else "kind = '%s'" % all_objects.model.KIND
+            'extra_condition': 'true' if all_objects.model.KIND == Topology.KIND else "kind = '%s'" % all_objects.model.KIND,
+            'source_ordering': 'pa.source, ' if by_source else '',
         }
 
         cursor = connection.cursor()
-        cursor.execute(sql)
-        result = cursor.fetchall()
-        pk_list = uniquify([row[0] for row in result])
+        cursor.execute(sql, [list(topology_pks)])
+        return cursor.fetchall()
+
+    @classmethod
+    def overlapping(cls, queryset, all_objects=None):
+        """ Return a Topology queryset overlapping specified topologies.
+        """
+        if all_objects is None:
+            all_objects = cls.objects.existing()
+        single_input = isinstance(queryset, QuerySet)
+
+        if single_input:
+            topology_pks = list(queryset.values_list('pk', flat=True))
+        else:
+            topology_pks = [queryset.pk]
+
+        if len(topology_pks) == 0:
+            return all_objects.filter(pk__in=[])
+
+        result = cls.overlapping_pks(topology_pks, all_objects)
+        pk_list = uniquify([row[1] for row in result])
 
         # Return a QuerySet and preserve pk list order
         # http://stackoverflow.com/a/1310188/141895
@@ -489,6 +564,24 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
             select={'ordering': ordering}, order_by=('ordering',))
         return queryset
 
+    @classmethod
+    def overlapping_many(cls, topologies, all_objects=None):
+        """ Return a dict {topology pk: list of objects overlapping it} for many topologies at once,
+        each list being sorted like overlapping() would sort it.
+        """
+        if all_objects is None:
+            all_objects = cls.objects.existing()
+        topology_pks = [getattr(topology, 'pk', topology) for topology in topologies]
+        overlaps = {pk: [] for pk in topology_pks}
+        if not topology_pks:
+            return overlaps
+
+        result = cls.overlapping_pks(topology_pks, all_objects, by_source=True)
+        objects = all_objects.in_bulk({row[1] for row in result})
+        for source, pks in itertools.groupby(result, key=lambda row: row[0]):
+            overlaps[source] = [objects[pk] for pk in uniquify([row[1] for row in pks]) if pk in objects]
+        return overlaps
+
     def mutate(self, other):
         """
         Take alls attributes of the other topology specified and
@@ -522,13 +615,54 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
         self.reload()
         return self
 
-    def reload(self):
+    @classmethod
+    def mutate_many(cls, pairs):
+        """
+        Same as mutate() for a list of (topology, other) pairs, with a constant number of queries,
+        so that geometries are computed by triggers once for all topologies.
+        """
+        if not pairs:
+            return
+        topologies = [
+            Topology(pk=topology.pk, offset=settings.TOPOLOGY_STATIC_OFFSETS.get(
+                topology._meta.object_name.lower().replace('edge', ''), other.offset))
+            for topology, other in pairs
+        ]
+        Topology.objects.bulk_update(topologies, ['offset'])
+        PathAggregation.objects.filter(topo_object__in=topologies).delete()
+        for topology, (obj, other) in zip(topologies, pairs):
+            topology.deleted = False
+            topology.geom = other.geom
+        Topology.objects.bulk_update(topologies, ['deleted', 'geom'])
+        aggregations = []
+        for topology, other in pairs:
+            aggrs = other.aggregations.all()
+            if other.ispoint():
+                aggrs = aggrs[:1]
+            aggregations += [
+                PathAggregation(
+                    path=aggr.path,
+                    topo_object_id=topology.pk,
+                    start_position=aggr.start_position,
+                    end_position=aggr.end_position,
+                    order=aggr.order
+                )
+                for aggr in aggrs
+            ]
+        PathAggregation.objects.bulk_create(aggregations)
+        model = pairs[0][0].__class__
+        fromdb = model.objects.in_bulk([topology.pk for topology, other in pairs])
+        for topology, other in pairs:
+            topology.reload(fromdb[topology.pk])
+
+    def reload(self, fromdb=None):
         """
         Reload into instance all computed attributes in triggers.
         """
         if self.pk:
             # Update computed values
-            fromdb = self.__class__.objects.get(pk=self.pk)
+            if fromdb is None:
+                fromdb = self.__class__.objects.get(pk=self.pk)
             self.geom = fromdb.geom
             # /!\ offset may be set by a trigger OR in
             # the django code, reload() will override
@@ -616,29 +750,40 @@ class Topology(ZoningPropertiesMixin, AddPropertyMixin, AltimetryMixin,
         Receives a point (lng, lat) with API_SRID, and returns
         a topology objects with a computed path aggregation.
         """
-        # Find closest path
-        point = Point(lng, lat, srid=settings.API_SRID)
-        point.transform(settings.SRID)
-        if snap is None:
-            closest = Path.closest(point)
-            position, offset = closest.interpolate(point)
-        else:
-            closest = Path.objects.get(pk=snap)
-            position, offset = closest.interpolate(point)
-            offset = 0
-        # We can now instantiante a Topology object
-        topology = Topology(kind=kind, offset=offset)
-        aggr = PathAggregation(
-            topo_object=topology,
-            path=closest,
-            start_position=position,
-            end_position=position
-        )
-        topology.aggregations = [aggr]
-        closest.aggregations.add(aggr)
-        point = Point(point.x, point.y, srid=settings.SRID)
-        topology.geom = point
-        return topology
+        return cls._topologypoints([(lng, lat)], kind, snaps=[snap])[0]
+
+    @classmethod
+    def _topologypoints(cls, coords, kind=None, snaps=None):
+        """
+        Same as _topologypoint() for a list of points (lng, lat) with API_SRID,
+        with a constant number of queries.
+        """
+        # Find closest paths
+        points = []
+        for lng, lat in coords:
+            point = Point(lng, lat, srid=settings.API_SRID)
+            point.transform(settings.SRID)
+            points.append(point)
+        if snaps is None:
+            snaps = [None] * len(points)
+        topologies = []
+        for point, snap, (closest, position, offset) in zip(points, snaps, Path.interpolate_many(points, paths=snaps)):
+            if snap is not None:
+                offset = 0
+            # We can now instantiante a Topology object
+            topology = Topology(kind=kind, offset=offset)
+            aggr = PathAggregation(
+                topo_object=topology,
+                path=closest,
+                start_position=position,
+                end_position=position
+            )
+            topology.aggregations = [aggr]
+            closest.aggregations.add(aggr)
+            point = Point(point.x, point.y, srid=settings.SRID)
+            topology.geom = point
+            topologies.append(topology)
+        return topologies
 
     @classmethod
     def deserialize(cls, serialized):
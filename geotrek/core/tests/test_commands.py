@@ -6,6 +6,7 @@ from django.contrib.gis.geos import LineString, MultiLineString, Point, GEOSGeom
 from django.core.management import call_command
 from django.core.management.base import CommandError
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.db import connection, IntegrityError
 
 from geotrek.authent.models import Structure
@@ -105,8 +106,8 @@ class RemoveDuplicatePathTest(TestCase):
 
     def test_remove_duplicate_path_fail(self):
         output = StringIO()
-        with mock.patch('geotrek.core.models.Path.delete') as mock_delete:
-            mock_delete.side_effect = Exception('An ERROR')
+        with mock.patch('geotrek.core.management.commands.remove_duplicate_paths.Command.merge') as mock_merge:
+            mock_merge.side_effect = Exception('An ERROR')
             call_command('remove_duplicate_paths', verbosity=2, stdout=output)
         self.assertIn("An ERROR", output.getvalue())
         self.assertEqual(Path.include_invisible.count(), 9)
@@ -114,6 +115,34 @@ class RemoveDuplicatePathTest(TestCase):
         self.assertIn("0 duplicate paths have been deleted",
                       output.getvalue())
 
+    def test_remove_duplicate_path_dry_run(self):
+        output = StringIO()
+        call_command('remove_duplicate_paths', dry_run=True, stdout=output)
+        self.assertEqual(Path.objects.count(), 9)
+        self.assertIn("4 duplicate paths would be deleted, 4 paths with duplicates would be kept", output.getvalue())
+
+    def test_remove_duplicate_path_many(self):
+        # 1000 geometries, each one on 3 paths
+        Path.objects.bulk_create([
+            Path(name='Path {} {}'.format(i, j), geom=LineString((100, 10 * i + 10), (105, 10 * i + 10)))
+            for i in range(1000) for j in range(3)
+        ])
+        self.assertEqual(Path.objects.count(), 3009)
+        first, second, third = Path.objects.filter(name__startswith='Path 0 ').order_by('pk')
+        second.visible = False
+        second.save()
+        poi_second = POIFactory.create(paths=[(second, 0.5, 0.5)])
+        poi_third = POIFactory.create(paths=[(third, 0.5, 0.5)])
+        output = StringIO()
+        with CaptureQueriesContext(connection) as context:
+            call_command('remove_duplicate_paths', batch_size=500, stdout=output)
+        self.assertLess(len(context.captured_queries), 100)
+        self.assertIn("2004 duplicate paths have been deleted", output.getvalue())
+        self.assertEqual(Path.include_invisible.count(), 1005)
+        self.assertEqual(list(Path.include_invisible.filter(name__startswith='Path 0 ')), [first])
+        self.assertEqual(poi_second.aggregations.get().path, first)
+        self.assertEqual(poi_third.aggregations.get().path, first)
+
 
 @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
 class LoadPathsCommandTest(TestCase):
@@ -626,3 +655,25 @@ class ReorderTopologiesPathAggregationTest(TestCase):
         output = StringIO()
         call_command('reorder_topologies', stdout=output)
         self.assertIn(f'Topologies with errors :\nTREK id: {topo.pk}\n', output.getvalue())
+
+    def test_reorder_topologies_chunks(self):
+        topo_1 = TopologyFactory.create(paths=[(self.path_1_a, 0, 1), (self.path_1_b, 0, 1)])
+        topo_2 = TopologyFactory.create(paths=[(self.path_1_a, 0, 1), (self.path_1_b, 0, 1)])
+        topo_3 = TopologyFactory.create(paths=[(self.path_1_a, 0, 1), (self.path_1_b, 0, 1)])
+        PathFactory.create(geom=LineString(Point(700000, 6600090), Point(700090, 6600000), srid=settings.SRID))
+        for topo in (topo_1, topo_2, topo_3):
+            self.assertEqual(list(PathAggregation.objects.filter(topo_object=topo).values_list('order', flat=True)),
+                             [0, 0, 1])
+        output = StringIO()
+        call_command('reorder_topologies', '--topologies', topo_1.pk, topo_2.pk, '--chunk-size', 1, stdout=output)
+        self.assertEqual('2 topologies has beeen updated\n', output.getvalue())
+        for topo in (topo_1, topo_2):
+            self.assertEqual(list(PathAggregation.objects.filter(topo_object=topo).values_list('order', flat=True)),
+                             [0, 1, 2])
+        self.assertEqual(list(PathAggregation.objects.filter(topo_object=topo_3).values_list('order', flat=True)),
+                         [0, 0, 1])
+        # Ids, sublines, orders of lines, then savepoint, update of orders and release
+        with self.assertNumQueries(6):
+            call_command('reorder_topologies', verbosity=0)
+        self.assertEqual(list(PathAggregation.objects.filter(topo_object=topo_3).values_list('order', flat=True)),
+                         [0, 1, 2])
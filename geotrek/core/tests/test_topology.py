@@ -148,6 +148,38 @@ class TopologyTest(TestCase):
         self.assertEqual(point.wkt, 'POINT (0 0)')
         self.assertEqual(closest, path_normal)
 
+    def test_interpolate_many(self):
+        path_draft = PathFactory.create(geom=LineString((0, 0), (10, 0)), draft=True)
+        path_1 = PathFactory.create(geom=LineString((0, 5), (10, 5)))
+        path_2 = PathFactory.create(geom=LineString((0, 20), (10, 20)))
+        PathFactory.create(geom=LineString((0, 10), (10, 10)), visible=False)
+        points = [Point(2, 1, srid=settings.SRID), Point(7, 18, srid=settings.SRID), Point(5, 11, srid=settings.SRID),
+                  Point(5, 11, srid=settings.SRID)]
+        with self.assertNumQueries(2):
+            located = Path.interpolate_many(points, paths=[None, None, None, path_1.pk])
+        expected = []
+        for point in points[:3]:
+            closest = Path.closest(point)
+            expected.append((closest, *closest.interpolate(point)))
+        expected.append((path_1, *path_1.interpolate(points[3])))
+        self.assertEqual(located, expected)
+        self.assertEqual([path for path, position, offset in located], [path_1, path_2, path_1, path_1])
+        located = Path.interpolate_many(points[:1], exclude=path_1)
+        self.assertEqual(located[0][0], path_2)
+        with self.assertRaises(Path.DoesNotExist):
+            Path.interpolate_many(points[:1], paths=[path_draft.pk + 1000])
+        self.assertEqual(Path.interpolate_many([]), [])
+
+    def test_snap_many(self):
+        path_1 = PathFactory.create(geom=LineString((0, 0), (10, 0)))
+        path_2 = PathFactory.create(geom=LineString((0, 5), (10, 5)))
+        points = [Point(2, 1, srid=settings.SRID), Point(7, 3, srid=settings.SRID), Point(8, 2, srid=settings.SRID)]
+        with self.assertNumQueries(1):
+            snapped = Path.snap_many(points, [path_1.pk, None, path_2.pk])
+        self.assertEqual(snapped, [path_1.snap(points[0]), points[1], path_2.snap(points[2])])
+        with self.assertRaises(Path.DoesNotExist):
+            Path.snap_many(points[:1], [path_2.pk + 1000])
+
     def test_topology_deserialize(self):
         p1 = PathFactory.create(geom=LineString((0, 0), (2, 2)))
         p2 = PathFactory.create(geom=LineString((2, 2), (2, 0)))
@@ -904,3 +936,20 @@ class TopologyOverlappingTest(TestCase):
         from geotrek.trekking.models import Trek
         overlaps = Topology.overlapping(Trek.objects.all())
         self.assertEqual(list(overlaps), [])
+
+    def test_overlapping_many(self):
+        topologies = [self.topo1, self.topo2, self.point1, self.point3]
+        with self.assertNumQueries(2):
+            overlaps = Topology.overlapping_many(topologies)
+        self.assertEqual(list(overlaps.keys()), [topology.pk for topology in topologies])
+        for topology in topologies:
+            self.assertEqual(overlaps[topology.pk], list(Topology.overlapping(topology)))
+
+    def test_overlapping_many_filtered(self):
+        overlaps = Topology.overlapping_many([self.topo1.pk, self.point2.pk],
+                                             all_objects=Topology.objects.exclude(pk=self.topo2.pk))
+        self.assertEqual(overlaps, {
+            self.topo1.pk: [self.topo1, self.point2, self.point3, self.point1],
+            self.point2.pk: [self.point2, self.topo1],
+        })
+        self.assertEqual(Topology.overlapping_many([]), {})
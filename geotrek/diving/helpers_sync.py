@@ -45,7 +45,7 @@ class SyncRando:
 
     def sync_detail(self, lang, dive):
         self.global_sync.sync_metas(lang, diving_views.DiveMeta, dive)
-        self.global_sync.sync_pdf(lang, dive, diving_views.DiveDocumentPublic.as_view(model=type(dive)))
+        self.global_sync.sync_pdf(lang, dive, diving_views.DiveDocumentPublic.as_view(model=type(dive), serve_stale_public_pdf=False))
         if 'geotrek.trekking' in settings.INSTALLED_APPS:
             self.sync_pois(lang, dive)
             self.sync_services(lang, dive)
@@ -116,14 +116,16 @@ class SuricateRequestManager:
             logger.exception(e)  # Send alert to admins
             self.save_pending_request("POST", endpoint, params, e.args)
 
-    def get_attachment_from_suricate(self, url):
+    def get_attachment_from_suricate(self, url, session=None):
+        # Reuse connections of the session if given
+        client = session if session is not None else requests
         if self.USE_AUTH:
-            response = requests.get(
+            response = client.get(
                 url,
                 auth=self.AUTH,
             )
         else:
-            response = requests.get(
+            response = client.get(
                 url,
             )
         if response.status_code not in [200, 201]:
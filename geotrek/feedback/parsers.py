@@ -2,9 +2,11 @@ import logging
 import os
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urlparse
 
+import requests
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
@@ -12,6 +14,7 @@ from django.contrib.gis.geos import Point
 from django.contrib.gis.geos.collections import Polygon
 from django.core.files.base import ContentFile
 from django.utils.timezone import make_aware
+from requests.adapters import HTTPAdapter
 
 from geotrek.common.models import Attachment, FileType
 from geotrek.feedback.models import (AttachedMessage, Report, ReportActivity,
@@ -25,12 +28,41 @@ logger = logging.getLogger(__name__)
 
 
 class SuricateParser(SuricateGestionRequestManager):
+    # Number of documents queued before downloading them
+    download_batch_size = 100
 
     def __init__(self):
         super().__init__()
         self.bbox = Polygon.from_bbox(settings.SPATIAL_EXTENT)
         self.filetype, created = FileType.objects.get_or_create(type="Photographie", structure=None)
         self.creator, created = get_user_model().objects.get_or_create(username='import', defaults={'is_active': False})
+        # Documents are downloaded by several threads (one at a time with 0), reusing connections to Suricate
+        self.download_workers = settings.PARSER_ATTACHMENT_WORKERS
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(self.download_workers, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lookups = {}
+        self.pending_documents = []
+        self.attachments = {}
+        self.existing_reports = {}
+        self.skip_unchanged = False
+
+    def get_cached(self, model, **kwargs):
+        """ Same as model.objects.get(**kwargs), with one query per distinct kwargs and per run """
+        key = (model, tuple(sorted(kwargs.items())))
+        if key not in self.lookups:
+            self.lookups[key] = model.objects.get(**kwargs)
+        return self.lookups[key]
+
+    def get_or_create_cached(self, model, **kwargs):
+        """ Same as model.objects.get_or_create(**kwargs), with one query per distinct kwargs and per run """
+        key = (model, tuple(sorted(kwargs.items())))
+        if key in self.lookups:
+            return self.lookups[key], False
+        obj, created = model.objects.get_or_create(**kwargs)
+        self.lookups[key] = obj
+        return obj, created
 
     def parse_date(self, date):
         """Parse datetime string from Suricate Rest API"""
@@ -83,7 +115,7 @@ class SuricateParser(SuricateGestionRequestManager):
         rep_point = Point(rep_srid.coords)
 
         # Parse status
-        rep_status = ReportStatus.objects.get(identifier=report["statut"])
+        rep_status = self.get_cached(ReportStatus, identifier=report["statut"])
 
         # Keep or discard
         should_import = rep_point.within(self.bbox) and rep_status.identifier != 'created'
@@ -97,9 +129,19 @@ class SuricateParser(SuricateGestionRequestManager):
             rep_updated = self.parse_date(report["updated"])
             rep_creation = self.parse_date(report["datedepot"])
 
+            # Skip reports which did not change in Suricate since last sync, but retry downloading their documents
+            existing_report = self.existing_reports.get(report["uid"])
+            if (self.skip_unchanged and existing_report and existing_report.last_updated_in_suricate
+                    and rep_updated <= existing_report.last_updated_in_suricate):
+                self.to_delete.discard(existing_report.pk)
+                self.create_documents(report["documents"], existing_report)
+                for message in report["messages"]:
+                    self.create_documents(message["documents"], existing_report)
+                return 0
+
             # Parse magnitude
-            rep_magnitude, created = ReportProblemMagnitude.objects.get_or_create(
-                suricate_label=report["ampleur"]
+            rep_magnitude, created = self.get_or_create_cached(
+                ReportProblemMagnitude, suricate_label=report["ampleur"]
             )
             if created:
                 logger.info(
@@ -107,14 +149,14 @@ class SuricateParser(SuricateGestionRequestManager):
                 )
 
             # Parse category
-            rep_category, created = ReportCategory.objects.get_or_create(
-                label=report["type"]
+            rep_category, created = self.get_or_create_cached(
+                ReportCategory, label=report["type"]
             )
             if created:
                 logger.info(f"Created new feedback category - label: {report['type']}")
 
             # Parse activity
-            rep_activity = ReportActivity.objects.get(identifier=report["idactivite"])
+            rep_activity = self.get_cached(ReportActivity, identifier=report["idactivite"])
 
             # Create report object
             fields = {
@@ -154,18 +196,24 @@ class SuricateParser(SuricateGestionRequestManager):
             return report_obj.pk if created else 0
 
     def before_get_alerts(self, verbosity=1):
-        pk_and_uuid = Report.objects.values_list('pk', 'external_uuid')
-        if pk_and_uuid:
-            pks, uuids = zip(*pk_and_uuid)
-            self.existing_uuids = list(map(lambda x: "".join(str(x).upper().rsplit("-", 1)), uuids))  # Format UUIDs as they are found in Suricate
-            self.to_delete = set(pks)
-        else:
-            self.existing_uuids = []
-            self.to_delete = set()
+        reports = Report.objects.only('pk', 'external_uuid', 'last_updated_in_suricate')
+        # Format UUIDs as they are found in Suricate
+        self.existing_reports = {"".join(str(report.external_uuid).upper().rsplit("-", 1)): report for report in reports}
+        self.existing_uuids = list(self.existing_reports)
+        self.to_delete = set(report.pk for report in self.existing_reports.values())
+        # Lookup tables and attachments of reports are cached during the run
+        self.lookups = {}
+        self.pending_documents = []
+        content_type = ContentType.objects.get_for_model(Report)
+        self.attachments = {
+            (attachment.object_id, attachment.title): attachment
+            for attachment in Attachment.objects.filter(content_type=content_type)
+        }
         if verbosity >= 1:
             logger.info("Starting reports parsing from Suricate\n")
 
     def after_get_alerts(self, reports_created, should_notify):
+        self.download_documents()
         Report.objects.filter(pk__in=self.to_delete).delete()
         if reports_created and should_notify:
             self.send_workflow_manager_new_reports_email(reports_created)
@@ -186,7 +234,9 @@ class SuricateParser(SuricateGestionRequestManager):
             logger.info(f"Processing report {report['uid']}\n")
         self.before_get_alerts(verbosity)
         self.to_delete = set()
+        self.skip_unchanged = False
         report_created = self.parse_report(report)
+        self.download_documents()
         if verbosity >= 1:
             logger.info(f"Created : {report_created}")
 
@@ -196,6 +246,7 @@ class SuricateParser(SuricateGestionRequestManager):
         :return: returns True if and only if reports was imported (it is in bbox)
         """
         self.before_get_alerts(verbosity)
+        self.skip_unchanged = True
         data = self.get_suricate("wsGetAlerts")
         total_reports = len(data["alertes"])
         current_report = 1
@@ -224,15 +275,23 @@ class SuricateParser(SuricateGestionRequestManager):
             uid = uid + str(file_id)
             parsed_url = urlparse(file_url)
 
-            attachment, created = Attachment.objects.get_or_create(
-                object_id=parent.pk,
-                title=uid,
-                content_type=ContentType.objects.get_for_model(parent),
-                defaults={
-                    'filetype': self.filetype,
-                    'creator': self.creator
-                }
-            )
+            key = (parent.pk, uid)
+            attachment = self.attachments.get(key)
+            if attachment is None:
+                attachment, created = Attachment.objects.get_or_create(
+                    object_id=parent.pk,
+                    title=uid,
+                    content_type=ContentType.objects.get_for_model(parent),
+                    defaults={
+                        'filetype': self.filetype,
+                        'creator': self.creator
+                    }
+                )
+                self.attachments[key] = attachment
+            elif any(pending[0] is attachment for pending in self.pending_documents):
+                # Same document attached to the report and one of its messages
+                continue
+            attachment.content_object = parent
             attachment_final_name = attachment.prepare_file_suffix(basename=uid + ext)
             attachment_final_path = attachment_upload(attachment, attachment_final_name)
             # If attachment is either new or had a failed download last time => download file
@@ -242,7 +301,23 @@ class SuricateParser(SuricateGestionRequestManager):
                 continue
 
             if parsed_url.scheme in ('http', 'https'):
-                response = self.get_attachment_from_suricate(file_url)
+                self.pending_documents.append((attachment, attachment_final_name, file_url))
+                if len(self.pending_documents) >= self.download_batch_size:
+                    self.download_documents()
+
+    def download_documents(self):
+        """Download queued documents concurrently, then save them as attachments"""
+        pending_documents, self.pending_documents = self.pending_documents, []
+        if not pending_documents:
+            return
+        # Only HTTP requests are run in threads, files and attachments are saved from the current one
+        executor = ThreadPoolExecutor(max_workers=self.download_workers) if self.download_workers else None
+        try:
+            responses = (executor.map if executor else map)(self.download_document, pending_documents)
+            for (attachment, attachment_final_name, file_url), response in zip(pending_documents, responses):
+                if response is None:
+                    # Downloaded again on next synchronization, as the file is missing
+                    continue
                 try:
                     if response.status_code in [200, 201]:
                         f = ContentFile(response.content)
@@ -250,6 +325,18 @@ class SuricateParser(SuricateGestionRequestManager):
                     attachment.save(**{'skip_file_save': True})
                 except Exception as e:
                     logger.error(f"Could not download image : {file_url} \n{e}\n{traceback.format_exc()}")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def download_document(self, document):
+        """Return the response for a queued document, or None if it could not be requested"""
+        file_url = document[2]
+        try:
+            return self.get_attachment_from_suricate(file_url, self.session)
+        except Exception as e:
+            logger.error(f"Could not download image : {file_url} \n{e}\n{traceback.format_exc()}")
+            return None
 
     def create_messages(self, messages, parent):
         """Parse messages list from Suricate Rest API"""
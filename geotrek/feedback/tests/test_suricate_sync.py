@@ -1,9 +1,11 @@
 import io
 import os
 import uuid
+from datetime import timedelta
 from unittest import mock
 from unittest.mock import MagicMock
 
+import requests
 from django.core import mail
 from django.core.management import call_command
 from django.test import TestCase
@@ -92,6 +94,10 @@ class SuricateTests(TestCase):
             return mock_response
 
         mocked.side_effect = build_response_patch
+        # Documents are downloaded through a session
+        session_patcher = mock.patch("geotrek.feedback.helpers.requests.Session.get", side_effect=build_response_patch)
+        session_patcher.start()
+        self.addCleanup(session_patcher.stop)
 
     def build_post_request_patch(self, mocked: MagicMock):
         """Mock post requests to Suricate API"""
@@ -322,6 +328,37 @@ class SuricateAPITests(SuricateTests):
             # No attachments are missing their image file
             self.assertTrue(atta.attachment_file.storage.exists(atta.attachment_file.name))
 
+    @override_settings(SURICATE_WORKFLOW_ENABLED=True)
+    @mock.patch("geotrek.feedback.parsers.logger")
+    @mock.patch("geotrek.feedback.helpers.requests.get")
+    def test_unchanged_alerts_are_skipped_on_next_sync(self, mocked_get, mocked_logger):
+        """Test reports not updated in Suricate since last sync are skipped, with the same resulting objects"""
+        self.build_get_request_patch(mocked_get)
+        call_command("sync_suricate", verbosity=0)
+
+        def get_rows():
+            return (
+                list(Report.objects.order_by('pk').values()),
+                list(AttachedMessage.objects.order_by('pk').values()),
+                list(Attachment.objects.order_by('pk').values()),
+            )
+
+        rows = get_rows()
+        self.assertEqual(len(rows[0]), 8)
+        self.assertEqual(len(rows[1]), 44)
+        self.assertEqual(len(rows[2]), 6)
+        call_command("sync_suricate", verbosity=0)
+        # Reports were not saved again, their date of update is unchanged
+        self.assertEqual(get_rows(), rows)
+        # Reports updated in Suricate since last sync are updated
+        r = Report.objects.get(external_uuid="7EE5DF25-5056-AA2B-DDBEEFA5768CD53E")
+        last_updated_in_suricate = r.last_updated_in_suricate
+        Report.objects.filter(pk=r.pk).update(comment="", last_updated_in_suricate=last_updated_in_suricate - timedelta(days=1))
+        call_command("sync_suricate", verbosity=0)
+        r.refresh_from_db()
+        self.assertEqual(r.comment, "Lames cassées")
+        self.assertEqual(r.last_updated_in_suricate, last_updated_in_suricate)
+
     @override_settings(PAPERCLIP_ENABLE_LINK=False)
     @override_settings(SURICATE_WORKFLOW_ENABLED=True)
     def test_sync_needs_paperclip_enabled(self):
@@ -449,6 +486,31 @@ class SuricateAPITests(SuricateTests):
         self.assertEqual(Report.objects.filter(external_uuid="742CBF16-5056-AA2B-DD1FD403F72D6B9B").count(), 0)
         self.assertEqual(Report.objects.count(), 7)
 
+    @override_settings(SURICATE_WORKFLOW_ENABLED=True, PARSER_ATTACHMENT_WORKERS=2)
+    @mock.patch("geotrek.feedback.parsers.logger")
+    @mock.patch("geotrek.feedback.helpers.requests.get")
+    def test_attachment_connection_error_skips_only_this_attachment(self, mocked_get, mocked_logger):
+        """Test a document failing to download does not interrupt sync, nor other documents"""
+        self.build_get_request_patch(mocked_get, cause_JPG_error=True)
+        call_command("sync_suricate", verbosity=0)
+        self.assertEqual(Report.objects.count(), 8)
+        self.build_get_request_patch(mocked_get, remove_one_alert=True)
+        build_response_patch = mocked_get.side_effect
+
+        def failing_document_patch(url, params=None, **kwargs):
+            if url.endswith("64629/doc_2.jpg"):
+                raise requests.exceptions.ConnectionError("Connection reset by peer")
+            return build_response_patch(url, params, **kwargs)
+
+        with mock.patch("geotrek.feedback.helpers.requests.Session.get", side_effect=failing_document_patch):
+            call_command("sync_suricate", verbosity=0)
+        self.assertTrue(any("64629/doc_2.jpg" in call[0][0] for call in mocked_logger.error.call_args_list))
+        # Relocated report is still deleted after documents are downloaded
+        self.assertEqual(Report.objects.filter(external_uuid="742CBF16-5056-AA2B-DD1FD403F72D6B9B").count(), 0)
+        self.assertEqual(Report.objects.count(), 7)
+        # Other documents of the same alert and of other alerts are downloaded
+        self.assertEqual(Attachment.objects.exclude(attachment_file='').count(), 3)
+
 
 class SuricateInterfaceTests(SuricateTests):
 
@@ -8,13 +8,13 @@ from django.db import transaction
 
 from geotrek.authent.models import default_structure
 from geotrek.authent.models import Structure
-from geotrek.core.models import Topology
+from geotrek.core.helpers import PointLoaderMixin
 from geotrek.infrastructure.models import (InfrastructureType,
                                            InfrastructureCondition, Infrastructure)
 from django.conf import settings
 
 
-class Command(BaseCommand):
+class Command(PointLoaderMixin, BaseCommand):
     help = 'Load a layer with point geometries in te structure model\n'
     can_import_settings = True
     counter = 0
@@ -47,6 +47,9 @@ class Command(BaseCommand):
         parser.add_argument('--eid-field', action='store', dest='eid_field', help='External ID field')
         parser.add_argument('--year-default', action='store', dest='year_default',
                             help='Default year for all infrastructures')
+        parser.add_argument('--skip-geometry-messages', action='store_true', dest='skip_geometry_messages', default=False,
+                            help='Do not display a message for each MultiPoint geometry')
+        self.add_chunk_arguments(parser)
 
     def handle(self, *args, **options):
         verbosity = options.get('verbosity')
@@ -67,7 +70,7 @@ class Command(BaseCommand):
         field_implantation_year = options.get('year_field')
         field_eid = options.get('eid_field')
 
-        sid = transaction.savepoint()
+        self.init_loading(options)
         structure_default = options.get('structure_default')
 
         try:
@@ -139,58 +142,60 @@ class Command(BaseCommand):
                         "Change your --eid-field option"))
                     break
 
-                for feature in layer:
-                    feature_geom = feature.geom
-                    name = feature.get(field_name) if field_name in available_fields else options.get('name_default')
-                    if feature_geom.geom_type == 'MultiPoint':
-                        self.stdout.write(self.style.NOTICE("This object is a MultiPoint : %s" % name))
-                        if len(feature_geom) < 2:
-                            feature_geom = feature_geom[0].geos
-                        else:
-                            raise CommandError("One of your geometry is a MultiPoint object with multiple points")
-                    type = feature.get(
-                        field_infrastructure_type) if field_infrastructure_type in available_fields else options.get(
-                        'type_default')
-                    category = feature.get(
-                        field_infrastructure_category) if field_infrastructure_category in available_fields else options.get(
-                        'category_default')
-                    if field_condition_type in available_fields:
-                        condition = feature.get(field_condition_type)
-                    else:
-                        condition = options.get('condition_default')
-                    structure = Structure.objects.get(name=feature.get(field_structure_type)) \
-                        if field_structure_type in available_fields else structure
-                    description = feature.get(
-                        field_description) if field_description in available_fields else options.get(
-                        'description_default')
-                    year = int(feature.get(
-                        field_implantation_year)) if field_implantation_year in available_fields and feature.get(
-                        field_implantation_year).isdigit() else options.get('year_default')
-                    eid = feature.get(field_eid) if field_eid in available_fields else None
-
-                    self.create_infrastructure(feature_geom, name, type, category, use_structure,
-                                               condition, structure, description, year, verbosity, eid)
-
-            transaction.savepoint_commit(sid)
+                for chunk in self.iter_chunks(layer):
+                    with transaction.atomic():
+                        for feature in chunk:
+                            feature_geom = feature.geom
+                            name = feature.get(field_name) if field_name in available_fields else options.get('name_default')
+                            if feature_geom.geom_type == 'MultiPoint':
+                                if not options.get('skip_geometry_messages'):
+                                    self.stdout.write(self.style.NOTICE("This object is a MultiPoint : %s" % name))
+                                if len(feature_geom) < 2:
+                                    feature_geom = feature_geom[0].geos
+                                else:
+                                    raise CommandError("One of your geometry is a MultiPoint object with multiple points")
+                            type = feature.get(
+                                field_infrastructure_type) if field_infrastructure_type in available_fields else options.get(
+                                'type_default')
+                            category = feature.get(
+                                field_infrastructure_category) if field_infrastructure_category in available_fields else options.get(
+                                'category_default')
+                            if field_condition_type in available_fields:
+                                condition = feature.get(field_condition_type)
+                            else:
+                                condition = options.get('condition_default')
+                            structure = self.get_cached(Structure, name=feature.get(field_structure_type)) \
+                                if field_structure_type in available_fields else structure
+                            description = feature.get(
+                                field_description) if field_description in available_fields else options.get(
+                                'description_default')
+                            year = int(feature.get(
+                                field_implantation_year)) if field_implantation_year in available_fields and feature.get(
+                                field_implantation_year).isdigit() else options.get('year_default')
+                            eid = feature.get(field_eid) if field_eid in available_fields else None
+
+                            self.create_infrastructure(feature_geom, name, type, category, use_structure,
+                                                       condition, structure, description, year, verbosity, eid)
+                        self.end_chunk(chunk, layer.num_feat, verbosity)
+
             if verbosity >= 2:
                 self.stdout.write(self.style.NOTICE("{} objects created.".format(self.counter)))
 
         except Exception:
-            self.stdout.write(self.style.ERROR("An error occured, rolling back operations."))
-            transaction.savepoint_rollback(sid)
+            self.stdout.write(self.style.ERROR(self.loading_error_message()))
             raise
 
     def create_infrastructure(self, geometry, name, type, category, use_structure,
                               condition, structure, description, year, verbosity, eid):
 
-        infra_type, created = InfrastructureType.objects.get_or_create(label=type, type=category,
-                                                                       structure=structure if use_structure else None)
+        infra_type, created = self.get_or_create_cached(InfrastructureType, label=type, type=category,
+                                                        structure=structure if use_structure else None)
         if created and verbosity:
             self.stdout.write("- InfrastructureType '{}' created".format(infra_type))
 
         if condition:
-            condition_type, created = InfrastructureCondition.objects.get_or_create(
-                label=condition,
+            condition_type, created = self.get_or_create_cached(
+                InfrastructureCondition, label=condition,
                 structure=structure if use_structure else None)
             if created and verbosity:
                 self.stdout.write("- Condition Type '{}' created".format(condition_type))
@@ -219,9 +224,7 @@ class Command(BaseCommand):
             try:
                 geometry.coord_dim = 2
                 geometry = geometry.transform(settings.API_SRID, clone=True)
-                serialized = '{"lng": %s, "lat": %s}' % (geometry.x, geometry.y)
-                topology = Topology.deserialize(serialized)
-                infra.mutate(topology)
+                self.set_point_topology(infra, geometry)
             except IndexError:
                 raise GEOSException('Invalid Geometry type. You need 1 path')
         else:
@@ -233,3 +236,9 @@ class Command(BaseCommand):
         self.counter += 1
 
         return infra
+
+    def attach_topologies(self):
+        try:
+            super().attach_topologies()
+        except IndexError:
+            raise GEOSException('Invalid Geometry type. You need 1 path')
@@ -150,7 +150,7 @@ class InfrastructureCommandTest(TestCase):
         with self.assertRaises(GEOSException):
             call_command('loadinfrastructure', filename, type_default='label', name_default='name',
                          stdout=output)
-        self.assertIn('An error occured, rolling back operations.', output.getvalue())
+        self.assertIn('An error occured, 0 objects already loaded are kept', output.getvalue())
         self.assertEqual(Infrastructure.objects.count(), 0)
 
     def test_update_same_eid(self):
@@ -96,7 +96,7 @@ def log_cascade_deletion_from_physicaledge_topology(sender, instance, using, **k
 Path.add_property('physical_edges', PhysicalEdge.path_physicals, _("Physical edges"))
 Topology.add_property('physical_edges', PhysicalEdge.topology_physicals, _("Physical edges"))
 Intervention.add_property('physical_edges', lambda self: self.target.physical_edges if self.target and hasattr(self.target, 'physical_edges') else [], _("Physical edges"))
-Project.add_property('physical_edges', lambda self: self.edges_by_attr('physical_edges'), _("Physical edges"))
+Project.add_property('physical_edges', lambda self: self.edges_by_attr('physical_edges', PhysicalEdge), _("Physical edges"))
 if 'geotrek.signage' in settings.INSTALLED_APPS:
     Blade.add_property('physical_edges', lambda self: self.signage.physical_edges, _("Physical edges"))
 
@@ -174,7 +174,7 @@ def log_cascade_deletion_from_landedge_topology(sender, instance, using, **kwarg
 Path.add_property('land_edges', LandEdge.path_lands, _("Land edges"))
 Topology.add_property('land_edges', LandEdge.topology_lands, _("Land edges"))
 Intervention.add_property('land_edges', lambda self: self.target.land_edges if self.target and hasattr(self.target, 'land_edges') else [], _("Land edges"))
-Project.add_property('land_edges', lambda self: self.edges_by_attr('land_edges'), _("Land edges"))
+Project.add_property('land_edges', lambda self: self.edges_by_attr('land_edges', LandEdge), _("Land edges"))
 if 'geotrek.signage' in settings.INSTALLED_APPS:
     Blade.add_property('land_edges', lambda self: self.signage.land_edges, _("Land edges"))
 
@@ -235,7 +235,7 @@ def log_cascade_deletion_from_competenceedge_topology(sender, instance, using, *
 Path.add_property('competence_edges', CompetenceEdge.path_competences, _("Competence edges"))
 Topology.add_property('competence_edges', CompetenceEdge.topology_competences, _("Competence edges"))
 Intervention.add_property('competence_edges', lambda self: self.target.competence_edges if self.target and hasattr(self.target, 'competence_edges') else [], _("Competence edges"))
-Project.add_property('competence_edges', lambda self: self.edges_by_attr('competence_edges'), _("Competence edges"))
+Project.add_property('competence_edges', lambda self: self.edges_by_attr('competence_edges', CompetenceEdge), _("Competence edges"))
 if 'geotrek.signage' in settings.INSTALLED_APPS:
     Blade.add_property('competence_edges', lambda self: self.signage.competence_edges, _("Competence edges"))
 
@@ -296,7 +296,7 @@ def log_cascade_deletion_from_workmanagementedge_topology(sender, instance, usin
 Path.add_property('work_edges', WorkManagementEdge.path_works, _("Work management edges"))
 Topology.add_property('work_edges', WorkManagementEdge.topology_works, _("Work management edges"))
 Intervention.add_property('work_edges', lambda self: self.target.work_edges if self.target and hasattr(self.target, 'work_edges') else [], _("Work management edges"))
-Project.add_property('work_edges', lambda self: self.edges_by_attr('work_edges'), _("Work management edges"))
+Project.add_property('work_edges', lambda self: self.edges_by_attr('work_edges', WorkManagementEdge), _("Work management edges"))
 if 'geotrek.signage' in settings.INSTALLED_APPS:
     Blade.add_property('work_edges', lambda self: self.signage.work_edges, _("Work management edges"))
 
@@ -357,6 +357,6 @@ def log_cascade_deletion_from_signagemanagementedge_topology(sender, instance, u
 Path.add_property('signage_edges', SignageManagementEdge.path_signages, _("Signage management edges"))
 Topology.add_property('signage_edges', SignageManagementEdge.topology_signages, _("Signage management edges"))
 Intervention.add_property('signage_edges', lambda self: self.target.signage_edges if self.target and hasattr(self.target, 'signage_edges') else [], _("Signage management edges"))
-Project.add_property('signage_edges', lambda self: self.edges_by_attr('signage_edges'), _("Signage management edges"))
+Project.add_property('signage_edges', lambda self: self.edges_by_attr('signage_edges', SignageManagementEdge), _("Signage management edges"))
 if 'geotrek.signage' in settings.INSTALLED_APPS:
     Blade.add_property('signage_edges', lambda self: self.signage.signage_edges, _("Signage management edges"))
@@ -1,16 +1,115 @@
-from django.db.models import Min, Max
-from django.db.models.functions import ExtractYear
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.gis.db.models import GeometryCollectionField, GeometryField
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, FloatField, IntegerField, Min, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce, ExtractYear
 
-from geotrek.common.mixins.managers import NoDeleteManager
+from geotrek.common.mixins.managers import NoDeleteManager, NoDeleteQuerySet
+
+
+def mandays_sum(expression):
+    """ Sum of an expression over the mandays of each intervention, as a subquery (0 without manday) """
+    from geotrek.maintenance.models import ManDay
+    mandays = ManDay.objects.filter(intervention=OuterRef('pk')).order_by() \
+        .values('intervention').annotate(total=Sum(expression)).values('total')
+    return Coalesce(Cast(Subquery(mandays), FloatField()), Value(0.0))
+
+
+def target_geom_sql():
+    """ SQL expression of the geometry of the target of an intervention aliased `i` (with content type `target_type`),
+    one case by model with a geometry and an integer primary key, as given by Intervention.geom """
+    cases = []
+    for model in apps.get_models():
+        try:
+            field = model._meta.get_field('geom')
+        except FieldDoesNotExist:
+            continue
+        if not isinstance(field, GeometryField) or not field.concrete:
+            continue
+        # With multi-table inheritance (topologies), the geometry is in the table of the parent
+        table = field.model._meta
+        # Targets are referenced by an integer, models with another primary key (cities...) cannot be targets.
+        # Comparing them with target_id would make PostgreSQL reject the whole query.
+        if not isinstance(table.pk, IntegerField):
+            continue
+        geom = 'ST_Transform(target.{}, {})'.format(field.column, settings.SRID) \
+            if field.srid != settings.SRID else 'target.{}'.format(field.column)
+        cases.append((model, 'SELECT {} FROM {} target WHERE target.{} = i.target_id'.format(
+            geom, table.db_table, table.pk.column)))
+    if 'geotrek.signage' in settings.INSTALLED_APPS:
+        from geotrek.core.models import Topology
+        from geotrek.signage.models import Blade
+        # Geometry of blades is the one of their signage
+        cases.append((Blade, 'SELECT target.geom FROM {} blade JOIN {} target ON target.id = blade.signage_id '
+                             'WHERE blade.id = i.target_id'.format(Blade._meta.db_table, Topology._meta.db_table)))
+    # Content types are given by their label, to build the queryset without querying them
+    return "CASE target_type.app_label || '.' || target_type.model {} END".format(' '.join(
+        "WHEN '{}' THEN ({})".format(model._meta.label_lower, sql) for model, sql in cases
+    ))
+
+
+class InterventionQuerySet(NoDeleteQuerySet):
+    def annotate_costs(self):
+        """ Compute total_manday, total_cost_mandays and total_cost in database """
+        return self.annotate(
+            annotated_total_manday=mandays_sum(F('nb_days')),
+            annotated_total_cost_mandays=mandays_sum(F('nb_days') * F('job__cost')),
+        ).annotate(
+            annotated_total_cost=F('annotated_total_cost_mandays')
+            + Coalesce(F('material_cost'), Value(0.0))
+            + Coalesce(F('heliport_cost'), Value(0.0))
+            + Coalesce(F('subcontract_cost'), Value(0.0))
+        )
+
+
+class ProjectQuerySet(NoDeleteQuerySet):
+    def annotate_costs(self):
+        """ Compute interventions_total_cost in database """
+        from geotrek.maintenance.models import Intervention
+        interventions = Intervention.objects.existing().filter(project=OuterRef('pk')).annotate_costs() \
+            .order_by().values('project').annotate(total=Sum('annotated_total_cost')).values('total')
+        # NULL for projects without intervention
+        return self.annotate(annotated_interventions_total_cost=Subquery(interventions))
+
+    def annotate_geom(self):
+        """ Compute geom in database: a collection of the geometries of existing interventions,
+        members of multi geometries and collections being added one by one """
+        from geotrek.maintenance.models import Intervention, Project
+        sql = """
+            SELECT ST_ForceCollection(ST_Collect(
+                CASE WHEN ST_IsCollection(t.geom) THEN ST_GeometryN(t.geom, n) ELSE t.geom END
+                ORDER BY t.id, n
+            ))
+            FROM (
+                SELECT i.id, {target_geom} AS geom
+                FROM {intervention} i
+                JOIN {content_type} target_type ON target_type.id = i.target_type_id
+                WHERE i.project_id = {project}.id AND NOT i.deleted
+            ) t,
+            generate_series(1, CASE WHEN ST_IsCollection(t.geom) THEN ST_NumGeometries(t.geom) ELSE 1 END) n
+            WHERE t.geom IS NOT NULL
+        """.format(target_geom=target_geom_sql(), intervention=Intervention._meta.db_table,
+                   content_type=ContentType._meta.db_table,
+                   project=Project._meta.db_table)
+        return self.annotate(annotated_geom=RawSQL(sql, [], output_field=GeometryCollectionField(srid=settings.SRID)))
 
 
 class InterventionManager(NoDeleteManager):
+    def get_queryset(self):
+        return InterventionQuerySet(self.model, using=self._db)
+
     def year_choices(self):
         return self.existing().filter(date__isnull=False).annotate(year=ExtractYear('date')) \
             .order_by('-year').distinct().values_list('year', 'year')
 
 
 class ProjectManager(NoDeleteManager):
+    def get_queryset(self):
+        return ProjectQuerySet(self.model, using=self._db)
+
     def year_choices(self):
         bounds = self.existing().aggregate(min=Min('begin_year'), max=Max('end_year'))
         if not bounds['min'] or not bounds['max']:
@@ -6,7 +6,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import GeometryCollection
 from django.contrib.postgres.indexes import GistIndex
-from django.db.models import Q
+from django.db.models import F, Q, Sum
 from django.db.models.signals import pre_delete
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
@@ -183,20 +183,44 @@ class Intervention(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixi
 
     @property
     def trails(self):
-        s = []
         if hasattr(self.target, 'paths'):
-            for p in self.target.paths.all():
-                for t in p.trails.all():
-                    s.append(t.pk)
+            trails = Trail.objects.existing().filter(aggregations__path__in=self.target.paths.all())
+            return Trail.objects.filter(pk__in=trails.values('pk'))
+        return Trail.objects.none()
 
-        return Trail.objects.filter(pk__in=s)
+    @classmethod
+    def split_targets(cls, interventions, exclude_labels=()):
+        """ Split interventions into pks of their target topologies (signages for blades) and
+        a list of (intervention, target model) for other targets, with two queries at most.
+        Topologies with a label in exclude_labels are considered as other targets.
+        """
+        topology_pks = []
+        blade_pks = []
+        others = []
+        for intervention in interventions.select_related('target_type'):
+            model = intervention.target_type.model_class() if intervention.target_type else None
+            if model is None or intervention.target_id is None:
+                others.append((intervention, model))
+            elif issubclass(model, Topology) and model._meta.label_lower not in exclude_labels:
+                topology_pks.append(intervention.target_id)
+            elif 'geotrek.signage' in settings.INSTALLED_APPS and issubclass(model, Blade):
+                blade_pks.append(intervention.target_id)
+            else:
+                others.append((intervention, model))
+        if blade_pks:
+            topology_pks += Blade.objects.filter(pk__in=blade_pks).values_list('signage_id', flat=True)
+        return topology_pks, others
+
+    def mandays_totals(self):
+        """ Number of days and cost of mandays, annotated by annotate_costs() or queried """
+        if hasattr(self, 'annotated_total_manday'):
+            return self.annotated_total_manday, self.annotated_total_cost_mandays
+        totals = self.manday_set.aggregate(days=Sum('nb_days'), cost=Sum(F('nb_days') * F('job__cost')))
+        return float(totals['days'] or 0), float(totals['cost'] or 0)
 
     @property
     def total_manday(self):
-        total = 0.0
-        for md in self.manday_set.all():
-            total += float(md.nb_days)
-        return total
+        return self.mandays_totals()[0]
 
     @classproperty
     def total_manday_verbose_name(cls):
@@ -204,10 +228,7 @@ class Intervention(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixi
 
     @property
     def total_cost_mandays(self):
-        total = 0.0
-        for md in self.manday_set.all():
-            total += md.cost
-        return total
+        return self.mandays_totals()[1]
 
     @classproperty
     def total_cost_mandays_verbose_name(cls):
@@ -277,7 +298,7 @@ class Intervention(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixi
         if 'geotrek.signage' in settings.INSTALLED_APPS:
             blades = list(Blade.objects.filter(signage__in=topologies).values_list('id', flat=True))
             qs |= Q(target_id__in=blades, target_type=blade_content_type)
-        return Intervention.objects.existing().filter(qs).distinct('pk')
+        return Intervention.objects.existing().filter(qs).distinct('pk').annotate_costs()
 
     @classmethod
     def path_interventions(cls, path):
@@ -293,7 +314,7 @@ class Intervention(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixi
         if 'geotrek.signage' in settings.INSTALLED_APPS:
             blades = list(Blade.objects.filter(signage__in=topologies).values_list('id', flat=True))
             qs |= Q(target_id__in=blades, target_type=blade_content_type)
-        return Intervention.objects.existing().filter(qs).distinct('pk')
+        return Intervention.objects.existing().filter(qs).distinct('pk').annotate_costs()
 
     @classmethod
     def topology_interventions(cls, topology):
@@ -461,24 +482,21 @@ class Project(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixin, Ti
         super().__init__(*args, **kwargs)
         self._geom = None
 
+    def targets_paths(self):
+        """ Visible paths of the targets of existing interventions (of their signage for blades, like Blade.paths) """
+        topology_pks, others = Intervention.split_targets(self.interventions.existing())
+        # Targets without paths (outdoor sites...) are left out without loading them
+        other_pks = [p.pk for i, model in others if model is not None and hasattr(model, 'paths') for p in i.paths]
+        return Path.objects.filter(Q(aggregations__topo_object__in=topology_pks) | Q(pk__in=other_pks))
+
     @property
     def paths(self):
-        s = []
-        for i in self.interventions.existing():
-            if hasattr(i, 'paths'):
-                s += i.paths
-        return Path.objects.filter(pk__in=[p.pk for p in set(s)])
+        return Path.objects.filter(pk__in=self.targets_paths().values('pk'))
 
     @property
     def trails(self):
-        s = []
-        for i in self.interventions.existing():
-            if i.target and hasattr(i.target, 'paths'):
-                for p in i.target.paths.all():
-                    for t in p.trails.all():
-                        s.append(t.pk)
-
-        return Trail.objects.filter(pk__in=s)
+        trails = Trail.objects.existing().filter(aggregations__path__in=self.targets_paths())
+        return Trail.objects.filter(pk__in=trails.values('pk'))
 
     @property
     def signages(self):
@@ -502,21 +520,14 @@ class Project(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixin, Ti
 
     @property
     def geom(self):
-        """ Merge all interventions geometry into a collection
+        """ Merge all interventions geometry into a collection, annotated by annotate_geom() or queried
         """
         if self._geom is None:
-            interventions = Intervention.objects.existing().filter(project=self)
-            geoms = []
-            for i in interventions:
-                geom = i.geom
-                if geom is not None:
-                    if isinstance(geom, GeometryCollection):
-                        for sub_geom in geom:
-                            geoms.append(sub_geom)
-                    else:
-                        geoms.append(geom)
-            if geoms:
-                self._geom = GeometryCollection(*geoms, srid=settings.SRID)
+            if hasattr(self, 'annotated_geom'):
+                self._geom = self.annotated_geom
+            elif self.pk:
+                self._geom = Project.objects.filter(pk=self.pk).annotate_geom() \
+                    .values_list('annotated_geom', flat=True).first()
         return self._geom
 
     @property
@@ -566,11 +577,12 @@ class Project(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixin, Ti
 
     @property
     def interventions_total_cost(self):
-        total = 0
-        qs = self.interventions.existing()
-        for i in qs.prefetch_related('manday_set', 'manday_set__job'):
-            total += i.total_cost
-        return total
+        if hasattr(self, 'annotated_interventions_total_cost'):
+            total = self.annotated_interventions_total_cost
+        else:
+            total = Project.objects.filter(pk=self.pk).annotate_costs() \
+                .values_list('annotated_interventions_total_cost', flat=True).first()
+        return 0 if total is None else total
 
     @classproperty
     def interventions_total_cost_verbose_name(cls):
@@ -587,14 +599,26 @@ class Project(ZoningPropertiesMixin, AddPropertyMixin, GeotrekMapEntityMixin, Ti
     def topology_projects(cls, topology):
         return cls.objects.existing().filter(interventions__in=topology.interventions.all()).distinct()
 
-    def edges_by_attr(self, interventionattr):
+    def edges_by_attr(self, interventionattr, model=None):
         """ Return related topology objects of project, by aggregating the same attribute
         on its interventions.
+        If the model of these objects is given, with dynamic segmentation, objects overlapping
+        targets of interventions are found at once. Otherwise, the attribute is evaluated on each intervention.
         (See geotrek.land.models)
         """
         pks = []
         modelclass = Topology
-        for i in self.interventions.all():
+        interventions = self.interventions.all()
+        if model is not None and settings.TREKKING_TOPOLOGY_ENABLED:
+            modelclass = model
+            # Objects related to treks are not all the overlapping ones (trek itself, excluded POIs...)
+            topology_pks, others = Intervention.split_targets(interventions, exclude_labels=('trekking.trek', ))
+            if topology_pks:
+                pks += [pk for source, pk in model.overlapping_pks(topology_pks, model.objects.existing())]
+            # Targets without this attribute are left out without loading them
+            interventions = [i for i, target_model in others
+                             if target_model is not None and hasattr(target_model, interventionattr)]
+        for i in interventions:
             attr_value = getattr(i, interventionattr)
             if isinstance(attr_value, list):
                 pks += [o.pk for o in attr_value]
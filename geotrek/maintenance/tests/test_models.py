@@ -1,23 +1,27 @@
 from unittest import skipIf
 
+from django.apps import apps
 from django.conf import settings
 from django.contrib.admin.models import DELETION, LogEntry
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.gis.geos import LineString, Point
+from django.contrib.gis.geos import GeometryCollection, LineString, Point
 from django.test import TestCase
 from django.utils import translation
 from mapentity.middleware import clear_internal_user_cache
 
 from geotrek.core.tests.factories import (PathFactory, StakeFactory,
                                           TopologyFactory, TrailFactory)
+from geotrek.feedback.tests.factories import ReportFactory
 from geotrek.infrastructure.models import Infrastructure
 from geotrek.infrastructure.tests.factories import InfrastructureFactory
-from geotrek.maintenance.models import Funding, Intervention, ManDay
+from geotrek.land.tests.factories import LandEdgeFactory
+from geotrek.maintenance.managers import target_geom_sql
+from geotrek.maintenance.models import Funding, Intervention, ManDay, Project
 from geotrek.maintenance.tests.factories import (
     FundingFactory, InfrastructureInterventionFactory,
     InfrastructurePointInterventionFactory, InterventionDisorderFactory,
-    InterventionFactory, InterventionJobFactory, ManDayFactory, ProjectFactory,
-    SignageInterventionFactory)
+    InterventionFactory, InterventionJobFactory, InterventionStatusFactory,
+    ManDayFactory, ProjectFactory, SignageInterventionFactory)
 from geotrek.outdoor.tests.factories import CourseFactory, SiteFactory
 from geotrek.signage.tests.factories import BladeFactory, SignageFactory
 
@@ -361,3 +365,112 @@ class ProjectModelTest(TestCase):
         project.interventions.add(intervention_blade)
         project.interventions.add(intervention_course)
         self.assertQuerysetEqual(list(project.trails), ['trail_1', 'trail_2', 'trail_signage'], ordered=False, transform=str)
+
+    def test_interventions_total_cost(self):
+        project = ProjectFactory.create()
+        self.assertEqual(project.interventions_total_cost, 0)
+        self.assertEqual(Project.objects.annotate_costs().get(pk=project.pk).interventions_total_cost, 0)
+        interv = InterventionFactory.create(project=project, material_cost=1, heliport_cost=2, subcontract_cost=4)
+        ManDayFactory.create(intervention=interv, nb_days=1.5, job=InterventionJobFactory(cost=10.25))
+        InterventionFactory.create(project=project, material_cost=None)
+        InterventionFactory.create(project=project, deleted=True)
+        # 7 + 500 + 1.5 * 10.25 for the first intervention, 500 for the second one
+        self.assertEqual(project.interventions_total_cost, 1022.375)
+        self.assertEqual(Project.objects.annotate_costs().get(pk=project.pk).interventions_total_cost, 1022.375)
+
+    def test_interventions_total_cost_queries(self):
+        status = InterventionStatusFactory.create()
+        job = InterventionJobFactory.create(cost=100)
+        projects = Project.objects.bulk_create([Project(name='Project {}'.format(i), begin_year=2010)
+                                                for i in range(1000)])
+        interventions = Intervention.objects.bulk_create([
+            Intervention(name='Intervention {}'.format(i), status=status, project=projects[i // 2], material_cost=i)
+            for i in range(1000)
+        ])
+        ManDay.objects.bulk_create([ManDay(intervention=intervention, job=job, nb_days=2)
+                                    for intervention in interventions])
+        with self.assertNumQueries(1):
+            costs = {project.pk: project.interventions_total_cost
+                     for project in Project.objects.existing().annotate_costs()}
+        self.assertEqual(len(costs), 1000)
+        self.assertEqual(costs[projects[0].pk], 0 + 1 + 2 * 200)
+        self.assertEqual(costs[projects[499].pk], 998 + 999 + 2 * 200)
+        self.assertEqual(costs[projects[500].pk], 0)
+        self.assertEqual(costs[projects[10].pk], projects[10].interventions_total_cost)
+
+    def test_geom(self):
+        project = ProjectFactory.create()
+        self.assertIsNone(project.geom)
+        topology = TopologyFactory.create()
+        course = CourseFactory.create(geom=GeometryCollection(Point(0, 0), LineString((0, 0), (1, 1)),
+                                                              srid=settings.SRID))
+        signage = SignageFactory.create()
+        blade = BladeFactory.create(signage=signage)
+        InterventionFactory.create(project=project, target=topology)
+        InterventionFactory.create(project=project, target=course)
+        InterventionFactory.create(project=project, target=blade)
+        InterventionFactory.create(project=project, target=None)
+        InterventionFactory.create(project=project, target=course, deleted=True)
+        topology.reload()
+        signage.reload()
+        expected = GeometryCollection(topology.geom, Point(0, 0), LineString((0, 0), (1, 1)), signage.geom,
+                                      srid=settings.SRID)
+        project = Project.objects.get(pk=project.pk)
+        self.assertTrue(project.geom.equals_exact(expected))
+        annotated = Project.objects.annotate_geom().get(pk=project.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(annotated.geom.equals_exact(expected))
+
+    def test_geom_queries(self):
+        status = InterventionStatusFactory.create()
+        topology = TopologyFactory.create()
+        projects = Project.objects.bulk_create([Project(name='Project {}'.format(i), begin_year=2010)
+                                                for i in range(1000)])
+        Intervention.objects.bulk_create([
+            Intervention(name='Intervention {}'.format(i), status=status, project=project, target=topology)
+            for i, project in enumerate(projects)
+        ])
+        with self.assertNumQueries(1):
+            geoms = [project.geom for project in Project.objects.existing().annotate_geom()]
+        self.assertEqual(len(geoms), 1000)
+        topology.reload()
+        self.assertTrue(geoms[0].equals_exact(GeometryCollection(topology.geom, srid=settings.SRID)))
+
+    def test_geom_with_installed_apps(self):
+        # Cities have a varchar primary key, they cannot be targets of interventions
+        self.assertTrue(apps.is_installed('geotrek.zoning'))
+        sql = target_geom_sql()
+        self.assertNotIn("'zoning.city'", sql)
+        self.assertIn("'core.topology'", sql)
+        self.assertIn("'feedback.report'", sql)
+        project = ProjectFactory.create()
+        report = ReportFactory.create()
+        InterventionFactory.create(project=project, target=report)
+        annotated = Project.objects.annotate_geom().get(pk=project.pk)
+        self.assertTrue(annotated.geom.equals_exact(GeometryCollection(report.geom, srid=settings.SRID)))
+
+    @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+    def test_related_objects_queries(self):
+        project = ProjectFactory.create()
+        paths = [PathFactory.create(geom=LineString((i * 10, 0), (i * 10, 10))) for i in range(10)]
+        for path in paths[:5]:
+            InterventionFactory.create(project=project, target=InfrastructureFactory.create(paths=[path]))
+        for path in paths[5:]:
+            signage = SignageFactory.create(paths=[path])
+            InterventionFactory.create(project=project, target=BladeFactory.create(signage=signage))
+        InterventionFactory.create(project=project, target=CourseFactory.create())
+        trail = TrailFactory.create(paths=[paths[0]])
+        # Blade.paths are the paths of its signage, so trails under signages of blades belong to the project
+        blade_trail = TrailFactory.create(paths=[paths[5]])
+        TrailFactory.create(paths=[PathFactory.create(geom=LineString((200, 0), (200, 10)))])
+        land_edge = LandEdgeFactory.create(paths=[paths[1]])
+        LandEdgeFactory.create(paths=[PathFactory.create(geom=LineString((200, 0), (200, 10)))])
+        project = Project.objects.get(pk=project.pk)
+        # Interventions with their targets types, signages of blades, then related objects
+        with self.assertNumQueries(3):
+            self.assertCountEqual(list(project.paths), paths)
+        with self.assertNumQueries(3):
+            self.assertCountEqual(list(project.trails), [trail, blade_trail])
+        # Overlapping objects are found before getting them
+        with self.assertNumQueries(4):
+            self.assertEqual(list(project.land_edges), [land_edge])
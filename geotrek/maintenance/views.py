@@ -49,7 +49,7 @@ class InterventionFormatList(MapEntityFormat, InterventionList):
     def get_queryset(self):
         """Returns all interventions joined with a new column for each job, to record the total cost of each job in each intervention"""
 
-        queryset = Intervention.objects.existing()
+        queryset = Intervention.objects.existing().annotate_costs()
 
         if settings.ENABLE_JOBS_COSTS_DETAILED_EXPORT:
 
@@ -108,7 +108,7 @@ class InterventionFormatList(MapEntityFormat, InterventionList):
 
 
 class InterventionDetail(MapEntityDetail):
-    queryset = Intervention.objects.existing()
+    queryset = Intervention.objects.existing().annotate_costs()
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
@@ -182,6 +182,7 @@ class InterventionViewSet(GeotrekMapentityViewSet):
             qs = qs.only('id', 'name')
         else:
             qs = qs.select_related("stake", "status", "type", "target_type").prefetch_related('target')
+            qs = qs.annotate_costs()
         return qs
 
 
@@ -195,6 +196,7 @@ class ProjectList(CustomColumnsMixin, MapEntityList):
 
 
 class ProjectFormatList(MapEntityFormat, ProjectList):
+    queryset = Project.objects.existing().annotate_costs().annotate_geom()
     mandatory_columns = ['id']
     default_extra_columns = [
         'structure', 'name', 'period', 'type', 'domain', 'constraint', 'global_cost',
@@ -206,7 +208,7 @@ class ProjectFormatList(MapEntityFormat, ProjectList):
 
 
 class ProjectDetail(MapEntityDetail):
-    queryset = Project.objects.existing()
+    queryset = Project.objects.existing().annotate_costs().annotate_geom()
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
@@ -258,5 +260,5 @@ class ProjectViewSet(GeotrekMapentityViewSet):
         if self.format_kwarg == 'geojson':
             non_empty_qs = Intervention.objects.existing().filter(project__isnull=False).values('project')
             qs = qs.filter(pk__in=non_empty_qs)
-            qs = qs.only('id', 'name')
+            qs = qs.only('id', 'name').annotate_geom()
         return qs
@@ -664,6 +664,10 @@ TINYMCE_DEFAULT_CONFIG = {
 
 SYNC_RANDO_ROOT = os.path.join(VAR_DIR, 'data')
 SYNC_MOBILE_ROOT = os.path.join(VAR_DIR, 'mobile')
+SYNC_PICTOGRAMS_CACHE_ROOT = os.path.join(CACHE_ROOT, 'pictograms')
+PUBLIC_PDF_CACHE_ENABLED = True
+PUBLIC_PDF_CACHE_ROOT = os.path.join(CACHE_ROOT, 'public_pdf')
+PUBLIC_PDF_CACHE_REFRESH_TIMEOUT = 60 * 10
 SYNC_RANDO_OPTIONS = {}
 SYNC_MOBILE_OPTIONS = {'skip_tiles': False}
 
@@ -817,6 +821,11 @@ REPORT_FILETYPE = "Report"
 PARSER_RETRY_SLEEP_TIME = 60  # time of sleep between requests
 PARSER_NUMBER_OF_TRIES = 3  # number of requests to try before abandon
 PARSER_RETRY_HTTP_STATUS = [503]
+PARSER_ATTACHMENT_WORKERS = 8  # number of attachments downloaded at once (0 to download them one by one)
+PARSER_ATTACHMENT_WORKERS_BY_HOST = 4  # number of attachments downloaded at once from the same host
+PARSER_ATTACHMENT_FRESHNESS = 0  # seconds during which imported attachments are not checked again
+PARSER_PREFETCH_PAGES = 2  # number of pages of APIs fetched ahead while importing (0 to fetch them one by one)
+PARSER_AGGREGATOR_WORKERS = 4  # number of sources imported at once by GeotrekAggregatorParser (0 to import them one by one)
 
 USE_BOOKLET_PDF = False
 HIDDEN_FORM_FIELDS = {}
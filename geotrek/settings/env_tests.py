@@ -8,6 +8,10 @@ ALLOWED_HOSTS = ['localhost']
 
 CELERY_ALWAYS_EAGER = True
 
+PARSER_ATTACHMENT_WORKERS = 0
+PARSER_PREFETCH_PAGES = 0
+PARSER_AGGREGATOR_WORKERS = 0
+
 # TEST_EXCLUDE = ('django',)
 
 ALLOWED_HOSTS = ['localhost']
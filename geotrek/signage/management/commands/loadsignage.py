@@ -9,13 +9,13 @@ from django.db import transaction
 from geotrek.authent.models import default_structure
 from geotrek.authent.models import Structure
 from geotrek.common.models import Organism
-from geotrek.core.models import Topology
+from geotrek.core.helpers import PointLoaderMixin
 from geotrek.signage.models import Sealing, Signage, SignageType
 from geotrek.infrastructure.models import InfrastructureCondition
 from django.conf import settings
 
 
-class Command(BaseCommand):
+class Command(PointLoaderMixin, BaseCommand):
     help = 'Load a layer with point geometries in te structure model\n'
     can_import_settings = True
     counter = 0
@@ -46,6 +46,9 @@ class Command(BaseCommand):
                             help='Default value for Description field')
         parser.add_argument('--year-default', action='store', dest='year_default', help='Default value for Year field')
         parser.add_argument('--code-default', action='store', dest='code_default', default="", help='Default value for Code field')
+        parser.add_argument('--skip-geometry-messages', action='store_true', dest='skip_geometry_messages', default=False,
+                            help='Do not display a message for each MultiPoint geometry')
+        self.add_chunk_arguments(parser)
 
     def check_fields_available_with_default(self, available_fields, name_field, default_field, prefix_argument):
         if (name_field and name_field not in available_fields) \
@@ -96,7 +99,7 @@ class Command(BaseCommand):
         default_code = options.get('code_default')
         field_eid = options.get('eid_field')
 
-        sid = transaction.savepoint()
+        self.init_loading(options)
         structure_default = options.get('structure_default')
 
         try:
@@ -137,72 +140,74 @@ class Command(BaseCommand):
                 if not self.check_fields_available_without_default(available_fields, field_code, 'code'):
                     break
 
-                for feature in layer:
-                    feature_geom = feature.geom
-                    name = feature.get(field_name) if field_name in available_fields else default_name
-                    if feature_geom.geom_type == 'MultiPoint':
-                        self.stdout.write(self.style.NOTICE("This object is a MultiPoint : %s" % name))
-                        if len(feature_geom) < 2:
-                            feature_geom = feature_geom[0].geos
-                        else:
-                            raise CommandError("One of your geometry is a MultiPoint object with multiple points")
-
-                    tmp_signage_type = feature.get(field_infrastructure_type) if field_infrastructure_type in available_fields else default_infrastructure_type
-                    signage_type, created = SignageType.objects.get_or_create(label=tmp_signage_type, structure=structure if use_structure else None)
-                    if created and verbosity:
-                        self.stdout.write("- SignageType '{}' created".format(signage_type))
-
-                    condition = feature.get(field_condition_type) if field_condition_type in available_fields else default_condition_type
-                    if condition:
-                        condition_type, created = InfrastructureCondition.objects.get_or_create(label=condition, structure=structure if use_structure else None)
-                        if created and verbosity:
-                            self.stdout.write("- Condition Type '{}' created".format(condition_type))
-                    else:
-                        condition_type = None
-
-                    sealing = feature.get(field_sealing) if field_sealing in available_fields else default_sealing
-                    if sealing:
-                        sealing, created = Sealing.objects.get_or_create(label=sealing, structure=structure if use_structure else None)
-                        if created and verbosity:
-                            self.stdout.write("- Sealing '{}' created".format(sealing))
-                    else:
-                        sealing = None
-
-                    manager = feature.get(field_manager) if field_manager in available_fields else default_manager
-                    if manager:
-                        manager, created = Organism.objects.get_or_create(organism=manager, structure=structure if use_structure else None)
-                        if created and verbosity:
-                            self.stdout.write("- Organism '{}' created".format(manager))
-                    else:
-                        manager = None
-
-                    structure = Structure.objects.get(name=feature.get(field_structure_type)) if field_structure_type in available_fields else structure
-                    description = feature.get(field_description) if field_description in available_fields else default_description
-                    year = int(feature.get(field_implantation_year)) if field_implantation_year in available_fields and feature.get(field_implantation_year).isdigit() else default_year
-                    eid = feature.get(field_eid) if field_eid in available_fields else None
-                    code = feature.get(field_code) if field_code in available_fields else default_code
-
-                    fields_to_integrate = {
-                        'type': signage_type,
-                        'name': name,
-                        'condition': condition_type,
-                        'structure': structure,
-                        'description': description,
-                        'implantation_year': year,
-                        'sealing': sealing,
-                        'manager': manager,
-                        'code': code,
-                        'eid': eid
-                    }
-                    self.create_signage(feature_geom, fields_to_integrate, verbosity)
-
-            transaction.savepoint_commit(sid)
+                for chunk in self.iter_chunks(layer):
+                    with transaction.atomic():
+                        for feature in chunk:
+                            feature_geom = feature.geom
+                            name = feature.get(field_name) if field_name in available_fields else default_name
+                            if feature_geom.geom_type == 'MultiPoint':
+                                if not options.get('skip_geometry_messages'):
+                                    self.stdout.write(self.style.NOTICE("This object is a MultiPoint : %s" % name))
+                                if len(feature_geom) < 2:
+                                    feature_geom = feature_geom[0].geos
+                                else:
+                                    raise CommandError("One of your geometry is a MultiPoint object with multiple points")
+
+                            tmp_signage_type = feature.get(field_infrastructure_type) if field_infrastructure_type in available_fields else default_infrastructure_type
+                            signage_type, created = self.get_or_create_cached(SignageType, label=tmp_signage_type, structure=structure if use_structure else None)
+                            if created and verbosity:
+                                self.stdout.write("- SignageType '{}' created".format(signage_type))
+
+                            condition = feature.get(field_condition_type) if field_condition_type in available_fields else default_condition_type
+                            if condition:
+                                condition_type, created = self.get_or_create_cached(InfrastructureCondition, label=condition, structure=structure if use_structure else None)
+                                if created and verbosity:
+                                    self.stdout.write("- Condition Type '{}' created".format(condition_type))
+                            else:
+                                condition_type = None
+
+                            sealing = feature.get(field_sealing) if field_sealing in available_fields else default_sealing
+                            if sealing:
+                                sealing, created = self.get_or_create_cached(Sealing, label=sealing, structure=structure if use_structure else None)
+                                if created and verbosity:
+                                    self.stdout.write("- Sealing '{}' created".format(sealing))
+                            else:
+                                sealing = None
+
+                            manager = feature.get(field_manager) if field_manager in available_fields else default_manager
+                            if manager:
+                                manager, created = self.get_or_create_cached(Organism, organism=manager, structure=structure if use_structure else None)
+                                if created and verbosity:
+                                    self.stdout.write("- Organism '{}' created".format(manager))
+                            else:
+                                manager = None
+
+                            structure = self.get_cached(Structure, name=feature.get(field_structure_type)) if field_structure_type in available_fields else structure
+                            description = feature.get(field_description) if field_description in available_fields else default_description
+                            year = int(feature.get(field_implantation_year)) if field_implantation_year in available_fields and feature.get(field_implantation_year).isdigit() else default_year
+                            eid = feature.get(field_eid) if field_eid in available_fields else None
+                            code = feature.get(field_code) if field_code in available_fields else default_code
+
+                            fields_to_integrate = {
+                                'type': signage_type,
+                                'name': name,
+                                'condition': condition_type,
+                                'structure': structure,
+                                'description': description,
+                                'implantation_year': year,
+                                'sealing': sealing,
+                                'manager': manager,
+                                'code': code,
+                                'eid': eid
+                            }
+                            self.create_signage(feature_geom, fields_to_integrate, verbosity)
+                        self.end_chunk(chunk, layer.num_feat, verbosity)
+
             if verbosity >= 2:
                 self.stdout.write(self.style.NOTICE("{} objects created.".format(self.counter)))
 
         except Exception:
-            self.stdout.write(self.style.ERROR("An error occured, rolling back operations."))
-            transaction.savepoint_rollback(sid)
+            self.stdout.write(self.style.ERROR(self.loading_error_message()))
             raise
 
     def create_signage(self, geometry, fields_to_integrate, verbosity):
@@ -222,9 +227,7 @@ class Command(BaseCommand):
             try:
                 geometry = geometry.transform(settings.API_SRID, clone=True)
                 geometry.coord_dim = 2
-                serialized = '{"lng": %s, "lat": %s}' % (geometry.x, geometry.y)
-                topology = Topology.deserialize(serialized)
-                infra.mutate(topology)
+                self.set_point_topology(infra, geometry)
             except IndexError:
                 raise GEOSException('Invalid Geometry type.')
         else:
@@ -236,3 +239,9 @@ class Command(BaseCommand):
         self.counter += 1
 
         return infra
+
+    def attach_topologies(self):
+        try:
+            super().attach_topologies()
+        except IndexError:
+            raise GEOSException('Invalid Geometry type.')
@@ -51,6 +51,30 @@ class SignageCommandTest(TestCase):
         self.assertEqual(2010, value.implantation_year)
         self.assertEqual(Signage.objects.count(), 1)
 
+    def test_load_signage_skip_geometry_messages(self):
+        output = StringIO()
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'signage_good_multipoint.geojson')
+        call_command('loadsignage', filename, type_default='label', name_default='name',
+                     skip_geometry_messages=True, verbosity=2, stdout=output)
+        self.assertNotIn('This object is a MultiPoint', output.getvalue())
+        self.assertIn('1/1 objects loaded', output.getvalue())
+        self.assertEqual(Signage.objects.count(), 1)
+
+    def test_load_signage_by_chunks(self):
+        output = StringIO()
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'signage.shp')
+        call_command('loadsignage', filename, type_default='label', name_default='name', chunk_size=1,
+                     verbosity=1, stdout=output)
+        self.assertIn('1/2 objects loaded', output.getvalue())
+        self.assertIn('2/2 objects loaded', output.getvalue())
+        value = Signage.objects.filter(name='name')
+        self.assertEqual(value.count(), 2)
+        self.assertEqual(value[0].type, value[1].type)
+        self.assertAlmostEqual(value[0].geom.x, -436345.704831, places=5)
+        self.assertAlmostEqual(value[0].geom.y, 1176487.742917, places=5)
+        self.assertAlmostEqual(value[1].geom.x, -436345.505347, places=5)
+        self.assertAlmostEqual(value[1].geom.y, 1176480.918334, places=5)
+
     def test_load_signage_bad_multipoints_error(self):
         output = StringIO()
         StructureFactory.create(name='structure')
@@ -143,7 +167,7 @@ class SignageCommandTest(TestCase):
         with self.assertRaises(GEOSException):
             call_command('loadsignage', filename, type_default='label', name_default='name',
                          stdout=output)
-        self.assertIn('An error occured, rolling back operations.', output.getvalue())
+        self.assertIn('An error occured, 0 objects already loaded are kept', output.getvalue())
         self.assertEqual(Signage.objects.count(), 0)
 
     def test_update_same_eid(self):
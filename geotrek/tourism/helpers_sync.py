@@ -75,13 +75,13 @@ class SyncRando:
     def sync_event(self, lang, event):
         self.global_sync.sync_metas(lang, tourism_views.TouristicEventMeta, event)
         self.global_sync.sync_pdf(lang, event,
-                                  tourism_views.TouristicEventDocumentPublic.as_view(model=type(event)))
+                                  tourism_views.TouristicEventDocumentPublic.as_view(model=type(event), serve_stale_public_pdf=False))
         for picture, resized in event.resized_pictures:
             self.global_sync.sync_media_file(lang, resized)
 
     def sync_content(self, lang, content):
         self.global_sync.sync_metas(lang, tourism_views.TouristicContentMeta, content)
         self.global_sync.sync_pdf(lang, content,
-                                  tourism_views.TouristicContentDocumentPublic.as_view(model=type(content)))
+                                  tourism_views.TouristicContentDocumentPublic.as_view(model=type(content), serve_stale_public_pdf=False))
         for picture, resized in content.resized_pictures:
             self.global_sync.sync_media_file(lang, resized)
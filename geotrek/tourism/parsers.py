@@ -399,6 +399,7 @@ class TouristicContentApidaeParser(AttachmentApidaeParserMixin, TouristicContent
     url = 'http://api.apidae-tourisme.com/api/v002/recherche/list-objets-touristiques/'
     model = TouristicContent
     eid = 'eid'
+    batch_size = 500
     fields = {
         'eid': 'id',
         'name': 'nom.libelleFr',
@@ -624,7 +625,7 @@ class EspritParcParser(AttachmentParserMixin, TouristicContentMixin, Parser):
                 val = [val]
             for subval in val:
                 try:
-                    dst.append(TouristicContentType1.objects.get(category=self.obj.category, label=subval))
+                    dst.append(self.lookups.get(TouristicContentType1, category=self.obj.category, label=subval))
                 except TouristicContentType1.DoesNotExist:
                     self.add_warning(
                         _("Type 1 '{subval}' does not exist for category '{cat}'. Please add it").format(
@@ -638,7 +639,7 @@ class EspritParcParser(AttachmentParserMixin, TouristicContentMixin, Parser):
                 val = [val]
             for subval in val:
                 try:
-                    dst.append(TouristicContentType2.objects.get(category=self.obj.category, label=subval))
+                    dst.append(self.lookups.get(TouristicContentType2, category=self.obj.category, label=subval))
                 except TouristicContentType2.DoesNotExist:
                     self.add_warning(
                         _("Type 2 '{subval}' does not exist for category '{cat}'. Please add it").format(
@@ -655,6 +656,7 @@ class TouristicContentTourInSoftParser(TouristicContentMixin, TourInSoftParser):
     eid = 'eid'
     model = TouristicContent
     delete = True
+    batch_size = 500
     category = None
     type1 = None
     type2 = None
@@ -1038,6 +1040,7 @@ class GeotrekTouristicContentParser(GeotrekParser):
         """Initialize parser with mapping for type1 and type2"""
         super().__init__(*args, **kwargs)
         response = self.request_or_retry(f"{self.url}/api/v2/touristiccontent_category/", )
+        # field_options is already a copy owned by this instance (see GeotrekParser.__init__)
         self.field_options.setdefault("type1", {})
         self.field_options.setdefault("type2", {})
         self.field_options["type1"]["mapping"] = {}
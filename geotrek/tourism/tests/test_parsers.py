@@ -795,9 +795,9 @@ class LEIParserTest(TranslationResetMixin, TestCase):
             response.status_code = 200
             if self.x_time == 0:
                 filename = os.path.join(os.path.dirname(__file__), 'data', 'LEIContent.xml')
-                with open(filename, 'r') as f:
+                with open(filename, 'rb') as f:
                     self.x_time += 1
-                    response._content = f.read()
+                    response.raw = io.BytesIO(f.read())
                     return response
             else:
                 response._content = b'test'
@@ -827,8 +827,8 @@ class LEIParserTest(TranslationResetMixin, TestCase):
             response = requests.Response()
             response.status_code = 200
             filename = os.path.join(os.path.dirname(__file__), 'data', 'LEIContent.xml')
-            with open(filename, 'r') as f:
-                response._content = f.read()
+            with open(filename, 'rb') as f:
+                response.raw = io.BytesIO(f.read())
                 return response
 
         mocked.side_effect = mocked_requests_get
@@ -852,9 +852,9 @@ class LEIParserTest(TranslationResetMixin, TestCase):
             response.status_code = 200
             if self.x_time == 0:
                 filename = os.path.join(os.path.dirname(__file__), 'data', 'LEIEvent.xml')
-                with open(filename, 'r') as f:
+                with open(filename, 'rb') as f:
                     self.x_time += 1
-                    response._content = f.read()
+                    response.raw = io.BytesIO(f.read())
                     return response
             else:
                 response._content = b'test'
@@ -2,9 +2,9 @@ from django.conf import settings
 from django.db.models import Q
 
 import os
-from zipfile import ZipFile
 
 from geotrek.common import views as common_views
+from geotrek.common.helpers_sync import SyncZipFile
 from geotrek.trekking import views
 from geotrek.trekking import models
 
@@ -48,7 +48,7 @@ class SyncRando:
         zipname = os.path.join('zip', 'treks', lang, '{pk}.zip'.format(pk=trek.pk))
         zipfullname = os.path.join(self.global_sync.tmp_root, zipname)
         self.global_sync.mkdirs(zipfullname)
-        self.trek_zipfile = ZipFile(zipfullname, 'w')
+        self.trek_zipfile = SyncZipFile(zipfullname, 'w')
 
         self.global_sync.sync_json(lang, common_views.ParametersView, 'parameters', zipfile=self.global_sync.zipfile)
         self.global_sync.sync_json(lang, common_views.ThemeViewSet, 'themes', as_view_args=[{'get': 'list'}],
@@ -64,9 +64,9 @@ class SyncRando:
         self.global_sync.sync_metas(lang, views.TrekMeta, trek)
         self.global_sync.sync_metas(lang, common_views.Meta)
         if settings.USE_BOOKLET_PDF:
-            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentBookletPublic.as_view(model=type(trek)))
+            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentBookletPublic.as_view(model=type(trek), serve_stale_public_pdf=False))
         else:
-            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentPublic.as_view(model=type(trek)))
+            self.global_sync.sync_pdf(lang, trek, views.TrekDocumentPublic.as_view(model=type(trek), serve_stale_public_pdf=False))
         self.global_sync.sync_profile_json(lang, trek)
         if not self.global_sync.skip_profile_png:
             self.global_sync.sync_profile_png(lang, trek, zipfile=self.global_sync.zipfile)
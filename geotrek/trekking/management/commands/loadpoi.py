@@ -6,11 +6,11 @@ from django.contrib.gis.gdal import DataSource
 from django.contrib.gis.geos import Point
 from django.db import transaction
 
-from geotrek.core.models import Topology
+from geotrek.core.helpers import PointLoaderMixin
 from geotrek.trekking.models import POI, POIType
 
 
-class Command(BaseCommand):
+class Command(PointLoaderMixin, BaseCommand):
     help = 'Load a layer with point geometries in a model\n'
     can_import_settings = True
     counter = 0
@@ -23,6 +23,7 @@ class Command(BaseCommand):
         parser.add_argument('--description-field', '-d', action='store', dest='description_field', help='Name of the field that contains the description of the POI (optional)')
         parser.add_argument('--name-default', action='store', dest='name_default', help='Default value for POI name. Use only if --name-field is not set')
         parser.add_argument('--type-default', action='store', dest='type_default', help='Default value for POI Type. Use only if --type-field is not set')
+        self.add_chunk_arguments(parser)
 
     def handle(self, *args, **options):
         filename = options['point_layer']
@@ -36,8 +37,7 @@ class Command(BaseCommand):
         field_name = options.get('name_field')
         field_poitype = options.get('type_field')
         field_description = options.get('description_field')
-
-        sid = transaction.savepoint()
+        self.init_loading(options)
 
         try:
             for layer in data_source:
@@ -60,36 +60,34 @@ class Command(BaseCommand):
                         "Set it with --type-field, or set a default value with --type-default"))
                     break
 
-                for feature in layer:
-                    feature_geom = feature.geom
-                    name = feature.get(field_name) if field_name in available_fields else options.get('name_default')
-                    poitype = feature.get(field_poitype) if field_poitype in available_fields else options.get('type_default')
-                    description = feature.get(field_description) if field_description in available_fields else ""
-                    self.create_poi(feature_geom, name, poitype, description)
-                    if verbosity >= 2:
-                        self.stdout.write(self.style.NOTICE("{} POI created.".format(name)))
+                for chunk in self.iter_chunks(layer):
+                    with transaction.atomic():
+                        for feature in chunk:
+                            feature_geom = feature.geom
+                            name = feature.get(field_name) if field_name in available_fields else options.get('name_default')
+                            poitype = feature.get(field_poitype) if field_poitype in available_fields else options.get('type_default')
+                            description = feature.get(field_description) if field_description in available_fields else ""
+                            self.create_poi(feature_geom, name, poitype, description)
+                            if verbosity >= 2:
+                                self.stdout.write(self.style.NOTICE("{} POI created.".format(name)))
+                        self.end_chunk(chunk, layer.num_feat, verbosity)
 
-            transaction.savepoint_commit(sid)
             if verbosity >= 2:
                 self.stdout.write(self.style.NOTICE("{} objects created.".format(self.counter)))
 
         except Exception:
-            self.stdout.write(self.style.ERROR("An error occured, rolling back operations."))
-            transaction.savepoint_rollback(sid)
+            self.stdout.write(self.style.ERROR(self.loading_error_message()))
             raise
 
     def create_poi(self, geometry, name, poitype, description):
-        poitype, created = POIType.objects.get_or_create(label=poitype)
+        poitype, created = self.get_or_create_cached(POIType, label=poitype)
         poi = POI.objects.create(name=name, type=poitype, description=description)
         if settings.TREKKING_TOPOLOGY_ENABLED:
             # Use existing topology helpers to transform a Point(x, y)
             # to a path aggregation (topology)
             geometry = geometry.transform(settings.API_SRID, clone=True)
             geometry.coord_dim = 2
-            serialized = '{"lng": %s, "lat": %s}' % (geometry.x, geometry.y)
-            topology = Topology.deserialize(serialized)
-            # Move deserialization aggregations to the POI
-            poi.mutate(topology)
+            self.set_point_topology(poi, geometry)
         else:
             if geometry.geom_type != 'Point':
                 raise TypeError
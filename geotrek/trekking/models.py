@@ -571,7 +571,7 @@ if settings.HIDE_PUBLISHED_TREKS_IN_TOPOLOGIES:
 else:
     Topology.add_property('published_treks', lambda self: intersecting(Trek, self).filter(published=True), _("Published treks"))
 Intervention.add_property('treks', lambda self: self.target.treks if self.target else [], _("Treks"))
-Project.add_property('treks', lambda self: self.edges_by_attr('treks'), _("Treks"))
+Project.add_property('treks', lambda self: self.edges_by_attr('treks', Trek), _("Treks"))
 tourism_models.TouristicContent.add_property('treks', Trek.tourism_treks, _("Treks"))
 tourism_models.TouristicContent.add_property('published_treks', lambda self: intersecting(Trek, self).filter(published=True), _("Published treks"))
 tourism_models.TouristicEvent.add_property('treks', Trek.tourism_treks, _("Treks"))
@@ -817,6 +817,18 @@ class POI(StructureRelated, PicturesMixin, PublishableMixin, GeotrekMapEntityMix
     def published_topology_pois(cls, topology):
         return cls.topology_pois(topology).filter(published=True)
 
+    @classmethod
+    def published_treks_pois(cls, treks):
+        """ Return a dict {trek pk: list of published POIs} like published_topology_pois() does for each trek.
+        With dynamic segmentation, POIs of all treks are found with a fixed number of queries.
+        """
+        if not settings.TREKKING_TOPOLOGY_ENABLED:
+            return {trek.pk: list(cls.published_topology_pois(trek)) for trek in treks}
+        excluded = set(Trek.pois_excluded.through.objects.filter(trek__in=treks).values_list('trek_id', 'poi_id'))
+        queryset = cls.objects.existing().filter(published=True).select_related('type__cirkwi')
+        overlaps = cls.overlapping_many(treks, all_objects=queryset)
+        return {pk: [poi for poi in pois if (pk, poi.pk) not in excluded] for pk, pois in overlaps.items()}
+
     def distance(self, to_cls):
         return settings.TOURISM_INTERSECTION_MARGIN
 
@@ -843,7 +855,7 @@ Topology.add_property('pois', POI.topology_pois, _("POIs"))
 Topology.add_property('all_pois', POI.topology_all_pois, _("POIs"))
 Topology.add_property('published_pois', POI.published_topology_pois, _("Published POIs"))
 Intervention.add_property('pois', lambda self: self.target.pois if self.target else [], _("POIs"))
-Project.add_property('pois', lambda self: self.edges_by_attr('pois'), _("POIs"))
+Project.add_property('pois', lambda self: self.edges_by_attr('pois', POI), _("POIs"))
 tourism_models.TouristicContent.add_property('pois', POI.tourism_pois, _("POIs"))
 tourism_models.TouristicContent.add_property('published_pois', lambda self: intersecting(POI, self).filter(published=True), _("Published POIs"))
 tourism_models.TouristicEvent.add_property('pois', POI.tourism_pois, _("POIs"))
@@ -962,7 +974,7 @@ Path.add_property('services', Service.path_services, _("Services"))
 Topology.add_property('services', Service.topology_services, _("Services"))
 Topology.add_property('published_services', Service.published_topology_services, _("Published Services"))
 Intervention.add_property('services', lambda self: self.target.services if self.target else [], _("Services"))
-Project.add_property('services', lambda self: self.edges_by_attr('services'), _("Services"))
+Project.add_property('services', lambda self: self.edges_by_attr('services', Service), _("Services"))
 tourism_models.TouristicContent.add_property('services', Service.tourism_services, _("Services"))
 tourism_models.TouristicContent.add_property('published_services', lambda self: intersecting(Service, self).filter(published=True), _("Published Services"))
 tourism_models.TouristicEvent.add_property('services', Service.tourism_services, _("Services"))
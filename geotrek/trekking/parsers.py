@@ -65,6 +65,7 @@ class POIParser(AttachmentParserMixin, ShapeParser):
         super().start()
         if settings.TREKKING_TOPOLOGY_ENABLED and not Path.objects.exists():
             raise GlobalImportError(_("You need to add a network of paths before importing POIs"))
+        self.topologies_to_mutate = []
 
     def filter_geom(self, src, val):
         self.topology = Topology.objects.none()
@@ -86,7 +87,22 @@ class POIParser(AttachmentParserMixin, ShapeParser):
     def parse_obj(self, row, operation):
         super().parse_obj(row, operation)
         if settings.TREKKING_TOPOLOGY_ENABLED and self.obj.geom and self.topology:
-            self.obj.mutate(self.topology)
+            if self.chunk_size:
+                # Path aggregations of the whole chunk are created at once
+                self.topologies_to_mutate.append((self.obj, self.topology))
+            else:
+                self.obj.mutate(self.topology)
+
+    def end_chunk(self):
+        super().end_chunk()
+        topologies, self.topologies_to_mutate = self.topologies_to_mutate, []
+        Topology.mutate_many(topologies)
+
+    def get_chunk_state(self):
+        state = super().get_chunk_state()
+        # Topologies of a rollbacked chunk must not be mutated with the next one
+        state['topologies_to_mutate'] = list(self.topologies_to_mutate)
+        return state
 
 
 class TrekParser(DurationParserMixin, AttachmentParserMixin, ShapeParser):
@@ -676,8 +692,9 @@ class ApidaeTrekParser(AttachmentParserMixin, ApidaeBaseTrekkingParser):
             val=[manager['nom']]
         )
         source = sources[0]
-        source.website = manager['siteWeb']
-        source.save()
+        if source.website != manager['siteWeb']:
+            source.website = manager['siteWeb']
+            source.save()
         return sources
 
     def filter_difficulty(self, src, val):
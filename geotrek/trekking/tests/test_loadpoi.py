@@ -1,12 +1,15 @@
+import json
 import os
 from io import StringIO
+from tempfile import TemporaryDirectory
 from unittest import skipIf, mock
 from unittest.mock import patch
 
 from django.conf import settings
-from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.geos import GEOSGeometry, LineString, Point
 from django.core.management import call_command
 from django.test import TestCase
+from geotrek.core.models import Topology
 from geotrek.core.tests.factories import PathFactory
 from geotrek.trekking.management.commands.loadpoi import Command
 from geotrek.trekking.models import POI
@@ -41,9 +44,25 @@ class LoadPOITest(TestCase):
         output = StringIO()
         with self.assertRaises(Exception):
             call_command('loadpoi', self.filename, verbosity=1, name_field='name', type_field='type', stdout=output)
-        self.assertIn('An error occured, rolling back operations.', output.getvalue())
+        self.assertIn('An error occured, 0 objects already loaded are kept', output.getvalue())
         self.assertEqual(POI.objects.count(), 0)
 
+    def test_command_fail_keeps_previous_chunks(self):
+        create_poi = Command.create_poi
+
+        def create_first_poi_only(cmd, *args):
+            if POI.objects.exists():
+                raise Exception('This is a test')
+            return create_poi(cmd, *args)
+
+        output = StringIO()
+        with mock.patch.object(Command, 'create_poi', autospec=True, side_effect=create_first_poi_only):
+            with self.assertRaises(Exception):
+                call_command('loadpoi', self.filename, verbosity=1, name_field='name', type_field='type', chunk_size=1,
+                             stdout=output)
+        self.assertIn('An error occured, 1 objects already loaded are kept', output.getvalue())
+        self.assertEqual(POI.objects.count(), 1)
+
     def test_create_pois_is_executed(self):
         with patch.object(Command, 'create_poi') as mocked:
             self.cmd.handle(point_layer=self.filename, verbosity=0, name_field='name', type_field='type', encoding='utf-8')
@@ -88,3 +107,37 @@ class LoadPOITest(TestCase):
         geom = GEOSGeometry('POINT(1 1)', srid=4326)
         poi = self.cmd.create_poi(geom, 'bridge', 'infra', 'description')
         self.assertEqual([self.path], list(poi.paths.all()))
+
+    @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+    def test_pois_are_loaded_by_chunks(self):
+        path = PathFactory.create(geom=LineString((700000, 6600200), (702000, 6600200), srid=settings.SRID))
+        features = []
+        for i in range(2000):
+            point = Point(700000 + i, 6600150 + (i % 100), srid=settings.SRID)
+            point.transform(4326)
+            features.append({
+                'type': 'Feature',
+                'properties': {'name': 'POI {}'.format(i), 'type': 'type {}'.format(i % 3)},
+                'geometry': {'type': 'Point', 'coordinates': [point.x, point.y]},
+            })
+        with TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'pois.geojson')
+            with open(filename, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': features}, f)
+            output = StringIO()
+            call_command('loadpoi', filename, name_field='name', type_field='type', chunk_size=500, stdout=output)
+        self.assertIn('500/2000 objects loaded', output.getvalue())
+        self.assertIn('2000/2000 objects loaded', output.getvalue())
+        self.assertEqual(POI.objects.count(), 2000)
+        self.assertEqual(set(POI.objects.values_list('type__label', flat=True)), {'type 0', 'type 1', 'type 2'})
+        # Same topologies as deserialized ones, like when POIs were loaded one by one
+        pois = POI.objects.filter(name__in=['POI 0', 'POI 1', 'POI 999', 'POI 1999'])
+        for poi in pois:
+            feature = features[int(poi.name.split()[1])]
+            lng, lat = feature['geometry']['coordinates']
+            topology = Topology.deserialize('{"lng": %s, "lat": %s}' % (lng, lat))
+            aggregation = topology.aggregations.all()[0]
+            self.assertEqual(poi.aggregations.get().path, path)
+            self.assertAlmostEqual(poi.aggregations.get().start_position, aggregation.start_position, places=9)
+            self.assertAlmostEqual(poi.offset, topology.offset, places=6)
+            self.assertTrue(poi.geom.equals_exact(topology.geom, 0.001))
@@ -14,8 +14,8 @@ from mapentity.middleware import clear_internal_user_cache
 
 from geotrek.common.tests import TranslationResetMixin
 from geotrek.core.tests.factories import PathFactory
-from geotrek.trekking.models import (OrderedTrekChild, Rating, RatingScale,
-                                     Trek)
+from geotrek.trekking.models import (POI, OrderedTrekChild, Rating,
+                                     RatingScale, Trek)
 from geotrek.trekking.tests.factories import (POIFactory, PracticeFactory,
                                               RatingFactory,
                                               RatingScaleFactory,
@@ -225,6 +225,25 @@ class RelatedObjectsTest(TranslationResetMixin, TestCase):
             Polygon(((3, 3), (9, 3), (9, 9), (3, 9), (3, 3)))))
         self.assertCountEqual(trek.districts, [d1, d2])
 
+    @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+    def test_published_treks_pois(self):
+        p1 = PathFactory.create(geom=LineString((0, 0), (4, 4)))
+        p2 = PathFactory.create(geom=LineString((4, 4), (8, 8)))
+        trek1 = TrekFactory.create(paths=[(p1, 0, 1), (p2, 0, 1)])
+        trek2 = TrekFactory.create(paths=[(p2, 0, 1)])
+        trek3 = TrekFactory.create(paths=[(p1, 0, 0.5)])
+        poi1 = POIFactory.create(paths=[(p1, 0.6, 0.6)], published=True)
+        poi2 = POIFactory.create(paths=[(p2, 0.5, 0.5)], published=True)
+        poi3 = POIFactory.create(paths=[(p1, 0.2, 0.2)], published=True)
+        POIFactory.create(paths=[(p1, 0.4, 0.4)], published=False)
+        trek1.pois_excluded.add(poi3.pk)
+        treks = [trek1, trek2, trek3]
+        with self.assertNumQueries(3):
+            pois = POI.published_treks_pois(treks)
+        self.assertEqual(pois, {trek1.pk: [poi1, poi2], trek2.pk: [poi2], trek3.pk: [poi3]})
+        for trek in treks:
+            self.assertEqual(pois[trek.pk], list(trek.published_pois))
+
     @skipIf(settings.TREKKING_TOPOLOGY_ENABLED, 'Test without dynamic segmentation only')
     def test_helpers_nds(self):
         trek = TrekFactory.create(geom=LineString((2, 2), (8, 8)))
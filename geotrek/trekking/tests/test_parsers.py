@@ -12,6 +12,7 @@ from django.conf import settings
 from django.contrib.gis.geos import Point, LineString, MultiLineString, WKTWriter
 from django.core.management import call_command
 from django.core.management.base import CommandError
+from django.db.utils import DatabaseError
 from django.test import TestCase, SimpleTestCase
 from django.test.utils import override_settings
 
@@ -22,7 +23,7 @@ from geotrek.core.tests.factories import PathFactory
 from geotrek.trekking.tests.factories import RouteFactory
 from geotrek.trekking.models import POI, POIType, Service, Trek, DifficultyLevel, Route
 from geotrek.trekking.parsers import (
-    TrekParser, GeotrekPOIParser, GeotrekServiceParser, GeotrekTrekParser, ApidaeTrekParser, ApidaeTrekThemeParser,
+    POIParser, TrekParser, GeotrekPOIParser, GeotrekServiceParser, GeotrekTrekParser, ApidaeTrekParser, ApidaeTrekThemeParser,
     ApidaePOIParser, _prepare_attachment_from_apidae_illustration, RowImportError
 )
 
@@ -151,6 +152,10 @@ WKT_POI = (
 )
 
 
+class ChunkPOIParser(POIParser):
+    chunk_size = 10
+
+
 class POIParserTests(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -190,6 +195,34 @@ class POIParserTests(TestCase):
         self.assertEqual(WKTWriter(precision=4).write(poi.geom), WKT_POI)
         self.assertEqual(poi.geom, poi.geom_3d)
 
+    def test_create_chunk(self):
+        PathFactory.create(geom=LineString((0, 0), (0, 10), srid=4326))
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'poi.shp')
+        call_command('import', 'geotrek.trekking.tests.test_parsers.ChunkPOIParser', filename, verbosity=0)
+        poi = POI.objects.all().last()
+        self.assertEqual(poi.name, "pont")
+        poi.reload()
+        self.assertEqual(WKTWriter(precision=4).write(poi.geom), WKT_POI)
+        self.assertEqual(poi.geom, poi.geom_3d)
+
+    @skipIf(not settings.TREKKING_TOPOLOGY_ENABLED, 'Test with dynamic segmentation only')
+    @mock.patch('geotrek.trekking.parsers.Topology.mutate_many')
+    def test_create_chunk_databaseerror_fallback(self, mocked_mutate_many):
+        PathFactory.create(geom=LineString((0, 0), (0, 10), srid=4326))
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'poi.shp')
+        errors = [DatabaseError('foo bar')]
+
+        def end_chunk():
+            if errors:
+                raise errors.pop()
+
+        with mock.patch('geotrek.common.parsers.Parser.end_chunk', side_effect=end_chunk):
+            ChunkPOIParser().parse(filename)
+        # Rows of the rollbacked chunk are imported again one by one, without its topologies
+        mutated = [topologies for (topologies, ), kwargs in mocked_mutate_many.call_args_list]
+        self.assertTrue(all(len(topologies) <= 1 for topologies in mutated))
+        self.assertCountEqual([poi for topologies in mutated for poi, topology in topologies], POI.objects.all())
+
 
 class TestGeotrekTrekParser(GeotrekTrekParser):
     url = "https://test.fr"
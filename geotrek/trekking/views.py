@@ -186,6 +186,19 @@ class TrekDocumentPublicMixin:
                 pass
         return context
 
+    def get_public_pdf_dependencies(self, obj):
+        dependencies = super().get_public_pdf_dependencies(obj)
+        pois = list(obj.published_pois.values_list('pk', 'date_update'))
+        dependencies.append(pois)
+        dependencies.append(self.attachments_version(POI, [pk for pk, date_update in pois]))
+        dependencies.append(list(obj.information_desks.values_list('pk', 'date_update')))
+        children = list(obj.children.values_list('pk', 'date_update'))
+        dependencies.append(children)
+        dependencies.append(self.attachments_version(Trek, [pk for pk, date_update in children]))
+        if 'geotrek.tourism' in settings.INSTALLED_APPS:
+            dependencies.append(list(obj.published_touristic_contents.values_list('pk', 'date_update')))
+        return dependencies
+
     def render_to_response(self, context, **response_kwargs):
         # Prepare altimetric graph
         trek = self.get_object()
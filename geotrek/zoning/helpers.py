@@ -0,0 +1,174 @@
+from django.conf import settings
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos.collections import MultiPolygon
+from django.contrib.gis.geos.polygon import Polygon
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+
+class ZoningLoaderMixin:
+    """ Load polygons of a layer in a zoning model.
+
+    Features are staged by batches in a temporary table, then checked (validity, spatial extent)
+    and created or updated with a few queries, matching existing objects on key fields.
+    """
+    model = None
+    key_fields = ('name', )
+    value_fields = ()
+    batch_size = 1000
+    staging_table = 'zoning_staging'
+
+    def add_batch_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of features staged at once, default 1000")
+
+    def check_srid(self, srid, geom):
+        if not geom.srid:
+            geom.srid = int(srid)
+
+        if geom.srid != settings.SRID:
+            try:
+                geom.transform(settings.SRID)
+            except GDALException:
+                raise CommandError("SRID is not well configurate, change/add option srid")
+
+    def get_values(self, feat, columns):
+        """ Values of the fields of a feature, from the columns given by options """
+        values = {}
+        for field in self.key_fields + self.value_fields:
+            value = feat.get(columns[field])
+            values[field] = str(value) if value is not None else None
+        return values
+
+    def create_staging_table(self, cursor):
+        fields = self.key_fields + self.value_fields
+        cursor.execute("""
+            CREATE TEMPORARY TABLE {table} (
+                id integer PRIMARY KEY, {columns}, geom geometry, status varchar
+            ) ON COMMIT DROP
+        """.format(table=self.staging_table,
+                   columns=', '.join('{} varchar'.format(field) for field in fields)))
+
+    def stage(self, cursor, rows):
+        fields = self.key_fields + self.value_fields
+        cursor.execute("""
+            INSERT INTO {table} (id, {columns}, geom)
+            SELECT * FROM unnest(%s::integer[], {arrays}, %s::geometry[])
+        """.format(table=self.staging_table, columns=', '.join(fields),
+                   arrays=', '.join('%s::varchar[]' for field in fields)),
+            [[i for i, values, geom in rows]]
+            + [[values[field] for i, values, geom in rows] for field in fields]
+            + [[geom.hexewkb.decode() for i, values, geom in rows]])
+
+    def load_layer(self, cursor, layer, columns, verbosity):
+        """ Stage features of the layer. Return the number of features skipped before staging. """
+        skipped = 0
+        count_error = 0
+        rows = []
+        for feat in layer:
+            try:
+                geom = feat.geom.geos
+                if not isinstance(geom, Polygon) and not isinstance(geom, MultiPolygon):
+                    if verbosity > 0:
+                        self.stdout.write("%s's geometry is not a polygon" % feat.get(columns['name']))
+                    skipped += 1
+                    break
+                elif isinstance(geom, Polygon):
+                    geom = MultiPolygon(geom)
+                self.check_srid(columns['srid'], geom)
+                geom.dim = 2
+                self.nb_staged += 1
+                rows.append((self.nb_staged, self.get_values(feat, columns), geom))
+            except IndexError:
+                if count_error == 0:
+                    self.stdout.write(self.index_error_message + "Fields in your file are : %s" % ', '.join(layer.fields))
+                count_error += 1
+                skipped += 1
+            if len(rows) >= self.batch_size:
+                self.stage(cursor, rows)
+                rows = []
+        if rows:
+            self.stage(cursor, rows)
+        return skipped
+
+    def upsert(self, cursor, do_intersect, constants):
+        """ Check staged features, then update existing objects and create new ones """
+        table = self.staging_table
+        target = self.model._meta.db_table
+        keys = ' AND '.join(['t.{0} = s.{0}'.format(field) for field in self.key_fields]
+                            + ['t.{} = %s'.format(column) for column in constants])
+        # Geometries are staged with settings.SRID, which can differ from the one of the model
+        geom = 'ST_Transform(s.geom, {})'.format(self.model._meta.get_field('geom').srid)
+        extent = 'ST_MakeEnvelope(%s, %s, %s, %s, {})'.format(settings.SRID)
+        cursor.execute("UPDATE {} SET status = 'invalid' WHERE NOT ST_IsValid(geom)".format(table))
+        cursor.execute("""
+            UPDATE {table} SET status = 'outside'
+            WHERE status IS NULL AND NOT {predicate}(geom, {extent})
+        """.format(table=table, extent=extent, predicate='ST_Intersects' if do_intersect else 'ST_Within'),
+            list(settings.SPATIAL_EXTENT))
+        # Like when creating or updating features one after the other, the last one with the same key wins
+        cursor.execute("""
+            UPDATE {table} s SET status = 'superseded'
+            FROM {table} s2
+            WHERE s.status IS NULL AND s2.status IS NULL AND {keys} AND s.id < s2.id
+        """.format(table=table, keys=' AND '.join('s.{0} = s2.{0}'.format(field) for field in self.key_fields)))
+        cursor.execute("""
+            UPDATE {table} s SET status = CASE WHEN EXISTS (SELECT 1 FROM {target} t WHERE {keys})
+                                          THEN 'updated' ELSE 'created' END
+            WHERE status IS NULL
+        """.format(table=table, target=target, keys=keys), list(constants.values()))
+        cursor.execute("""
+            UPDATE {target} t SET {values}geom = {geom}, date_update = now()
+            FROM {table} s
+            WHERE s.status = 'updated' AND {keys}
+        """.format(table=table, target=target, keys=keys, geom=geom,
+                   values=''.join('{0} = s.{0}, '.format(field) for field in self.value_fields)),
+            list(constants.values()))
+        fields = self.key_fields + self.value_fields
+        cursor.execute("""
+            INSERT INTO {target} ({columns}geom, published, date_insert, date_update)
+            SELECT {values}{geom}, TRUE, now(), now()
+            FROM {table} s
+            WHERE s.status = 'created'
+            ORDER BY s.id
+        """.format(table=table, target=target, geom=geom,
+                   columns=''.join('{}, '.format(column) for column in fields + tuple(constants)),
+                   values=''.join(['s.{}, '.format(field) for field in fields] + ['%s, ' for column in constants])),
+            list(constants.values()))
+
+    def report(self, skipped, verbosity):
+        counts = {'created': 0, 'updated': 0, 'superseded': 0, 'skipped': skipped}
+        messages = {
+            'created': "Created %s",
+            'updated': "Updated %s",
+            'superseded': "Superseded %s by a later feature with the same key",
+            'invalid': "%s's geometry is not valid",
+        }
+        with connection.chunked_cursor() as cursor:
+            cursor.execute("SELECT status, name FROM {} ORDER BY id".format(self.staging_table))
+            for status, name in cursor:
+                if verbosity > 0 and status in messages:
+                    self.stdout.write(messages[status] % name)
+                if status in ('created', 'updated', 'superseded'):
+                    counts[status] += 1
+                else:
+                    counts['skipped'] += 1
+        if verbosity > 0:
+            self.stdout.write("{created} created, {updated} updated, {superseded} superseded, {skipped} skipped".format(**counts))
+        return counts
+
+    def load(self, ds, columns, do_intersect, verbosity, constants=None):
+        """ Load all layers of the datasource. Columns are the attributes of the file for key and value fields,
+        and the srid of the file. Constants are other values of key fields, by column. """
+        constants = constants or {}
+        self.nb_staged = 0
+        with transaction.atomic():
+            cursor = connection.cursor()
+            self.create_staging_table(cursor)
+            skipped = 0
+            for layer in ds:
+                skipped += self.load_layer(cursor, layer, columns, verbosity)
+            self.upsert(cursor, do_intersect, constants)
+            counts = self.report(skipped, verbosity)
+            cursor.execute("DROP TABLE {}".format(self.staging_table))
+        return counts
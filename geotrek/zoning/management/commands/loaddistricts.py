@@ -1,13 +1,15 @@
-from django.core.management.base import BaseCommand, CommandError
-from django.contrib.gis.gdal import DataSource, GDALException
+from django.core.management.base import BaseCommand
+from django.contrib.gis.gdal import DataSource
+from geotrek.zoning.helpers import ZoningLoaderMixin
 from geotrek.zoning.models import District
-from django.contrib.gis.geos.polygon import Polygon
-from django.contrib.gis.geos.collections import MultiPolygon
-from django.conf import settings
 
 
-class Command(BaseCommand):
+class Command(ZoningLoaderMixin, BaseCommand):
     help = 'Load Districts from a file within the spatial extent\n'
+    model = District
+    key_fields = ('name', )
+    index_error_message = ("Name's attribute do not correspond with options\n"
+                           "Please, use --name to fix it.\n")
 
     def add_arguments(self, parser):
         parser.add_argument('file_path', help="File's path of the districts")
@@ -19,54 +21,16 @@ class Command(BaseCommand):
                             help="File's SRID")
         parser.add_argument('--intersect', '-i', action='store_true', dest='intersect', default=False,
                             help="Check features intersect spatial extent and not only within")
+        self.add_batch_arguments(parser)
 
     def handle(self, *args, **options):
         verbosity = options.get('verbosity')
         file_path = options.get('file_path')
-        name_column = options.get('name')
         encoding = options.get('encoding')
-        srid = options.get('srid')
-        do_intersect = options.get('intersect')
-        bbox = Polygon.from_bbox(settings.SPATIAL_EXTENT)
-        bbox.srid = settings.SRID
+        self.batch_size = options.get('batch_size') or self.batch_size
+        columns = {
+            'name': options.get('name'),
+            'srid': options.get('srid'),
+        }
         ds = DataSource(file_path, encoding=encoding)
-        count_error = 0
-
-        for layer in ds:
-            for feat in layer:
-                try:
-                    geom = feat.geom.geos
-                    if not isinstance(geom, Polygon) and not isinstance(geom, MultiPolygon):
-                        if verbosity > 0:
-                            self.stdout.write("%s's geometry is not a polygon" % feat.get(name_column))
-                        break
-                    elif isinstance(geom, Polygon):
-                        geom = MultiPolygon(geom)
-                    self.check_srid(srid, geom)
-                    geom.dim = 2
-                    if geom.valid:
-                        if do_intersect and bbox.intersects(geom) or not do_intersect and geom.within(bbox):
-                            instance, created = District.objects.update_or_create(name=feat.get(name_column),
-                                                                                  defaults={'geom': geom})
-                            if verbosity > 0:
-                                self.stdout.write("%s %s" % ('Created' if created else 'Updated', feat.get(name_column)))
-                    else:
-                        if verbosity > 0:
-                            self.stdout.write("%s's geometry is not valid" % feat.get(name_column))
-                except IndexError:
-                    if count_error == 0:
-                        self.stdout.write(
-                            "Name's attribute do not correspond with options\n"
-                            "Please, use --name to fix it.\n"
-                            "Fields in your file are : %s" % ', '.join(layer.fields))
-                    count_error += 1
-
-    def check_srid(self, srid, geom):
-        if not geom.srid:
-            geom.srid = srid
-
-        if geom.srid != settings.SRID:
-            try:
-                geom.transform(settings.SRID)
-            except GDALException:
-                raise CommandError("SRID is not well configurate, change/add option srid")
+        self.load(ds, columns, options.get('intersect'), verbosity)
@@ -185,6 +185,31 @@ class CitiesCommandTest(TestCase):
         self.assertIn('Updated coucou', output)
         self.assertIn('Updated lulu', output)
 
+    @override_settings(SRID=4326, SPATIAL_EXTENT=(-1, -3, 2, 2))
+    def test_load_cities_by_batches(self):
+        output = StringIO()
+        call_command('loadcities', self.filename_out_in, '-i', name='NOM', code='Insee', batch_size=1, verbosity=1,
+                     stdout=output)
+        self.assertEqual(City.objects.count(), 2)
+        self.assertIn('2 created, 0 updated, 0 superseded, 0 skipped', output.getvalue())
+        output = StringIO()
+        call_command('loadcities', self.filename_out_in, name='NOM', code='Insee', batch_size=1, verbosity=1,
+                     stdout=output)
+        self.assertEqual(City.objects.count(), 2)
+        self.assertIn('0 created, 1 updated, 0 superseded, 1 skipped', output.getvalue())
+
+    @override_settings(SRID=4326, SPATIAL_EXTENT=(-1, -3, 2, 2))
+    def test_load_cities_with_same_code(self):
+        output = StringIO()
+        filename = os.path.join(os.path.dirname(__file__), 'data', 'polygons_same_code.geojson')
+        call_command('loadcities', filename, name='NOM', code='Insee', verbosity=1, stdout=output)
+        # The last feature with the same code wins, like when features are loaded one by one
+        self.assertEqual(City.objects.count(), 1)
+        self.assertEqual(City.objects.get().name, 'lulu')
+        self.assertIn('Superseded coucou by a later feature with the same key', output.getvalue())
+        self.assertIn('Created lulu', output.getvalue())
+        self.assertIn('1 created, 0 updated, 1 superseded, 0 skipped', output.getvalue())
+
     @override_settings(SRID=4326, SPATIAL_EXTENT=(-1, -3, 2, 2))
     def test_load_cities_no_match_properties(self):
         output = StringIO()